@@ -16,7 +16,7 @@ def check_indexed_files():
     # Import with proper error handling for different execution contexts
     try:
         # When run as a module within the package
-        from .memory_utils import load_cfg, load_index, ROOT
+        from .memory_utils import load_cfg, load_index, faiss, ROOT
         from .index_codebase import find_files_to_index
         try:
             from .thread_safe_store import VectorStoreMetadataReadError
@@ -25,12 +25,12 @@ def check_indexed_files():
     except ImportError:
         try:
             # When run as a script directly
-            from memory_utils import load_cfg, load_index, ROOT
+            from memory_utils import load_cfg, load_index, faiss, ROOT
             from index_codebase import find_files_to_index
             VectorStoreMetadataReadError = Exception
         except ImportError:
             # Last resort: absolute import
-            from memex.scripts.memory_utils import load_cfg, load_index, ROOT
+            from memex.scripts.memory_utils import load_cfg, load_index, faiss, ROOT
             from memex.scripts.index_codebase import find_files_to_index
             VectorStoreMetadataReadError = Exception
 
@@ -70,7 +70,14 @@ def check_indexed_files():
         # Get the reverse map from the metadata
         faiss_to_custom_map = meta.get("_faiss_id_to_custom_id_map_", {})
         
-        for faiss_id in range(index.ntotal):
+        # An IndexIDMap lists the IDs it holds, which need not be 0..ntotal-1
+        # after deletions; fetch them all in one call instead of probing
+        if hasattr(index, "id_map"):
+            present_faiss_ids = faiss.vector_to_array(index.id_map).tolist()
+        else:
+            present_faiss_ids = range(index.ntotal)
+        
+        for faiss_id in present_faiss_ids:
             try:
                 # Get custom ID from the map
                 custom_id = faiss_to_custom_map.get(faiss_id)
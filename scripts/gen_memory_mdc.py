@@ -34,6 +34,22 @@ logging.basicConfig(
     datefmt="%Y-%m-%d %H:%M:%S"
 )
 
+# ───────────────────────────────────────── Search Predicates ────
+# Item types that can appear in the context sections of memory.mdc
+_CONTEXT_TYPES = frozenset({"code_chunk", "snippet", "note"})
+
+def _context_predicate(meta_item: dict, _types: frozenset = _CONTEXT_TYPES) -> bool:
+    """Search predicate: only include code_chunk, snippet, and note items."""
+    return meta_item.get("type") in _types
+
+# Metadata field holding the rendered body of each context item type
+_CONTEXT_BODY_FIELDS = {"snippet": "raw_content", "note": "text", "code_chunk": "content"}
+
+def _has_context_body(meta_item: dict) -> bool:
+    """Return False for context items whose body is empty or whitespace-only."""
+    body = meta_item.get(_CONTEXT_BODY_FIELDS.get(meta_item.get("type"), "content"), "")
+    return bool(body and str(body).strip())
+
 # ───────────────────────────────────────── Helper Formatters ────
 
 def _format_task_for_mdc(task: dict) -> list[str]:
@@ -88,13 +104,14 @@ def _format_context_item_for_mdc(meta: dict) -> list[str]:
     Enhanced to properly handle code_chunk type.
     """
     item_lines = []
-    item_type = meta.get("type")
-    item_id = meta.get("id", "N/A")
+    _g = meta.get  # Bound once; each branch below does several lookups
+    item_type = _g("type")
+    item_id = _g("id", "N/A")
     
     if item_type == "snippet":
-        item_source = meta.get("source", "unknown")
-        item_language = meta.get("language", "text")
-        item_raw_content = meta.get("raw_content", "")
+        item_source = _g("source", "unknown")
+        item_language = _g("language", "text")
+        item_raw_content = _g("raw_content", "")
         
         # Create a well-formatted header
         item_lines.append(f"### 📝 Code Snippet: {item_source}")
@@ -107,8 +124,8 @@ def _format_context_item_for_mdc(meta: dict) -> list[str]:
         item_lines.append("```")
     
     elif item_type == "note":
-        item_text = meta.get("text", "")
-        timestamp = meta.get("timestamp", "")
+        item_text = _g("text", "")
+        timestamp = _g("timestamp", "")
         time_info = f" | **Added:** {timestamp}" if timestamp else ""
         
         item_lines.append(f"### 📋 Development Note")
@@ -121,12 +138,12 @@ def _format_context_item_for_mdc(meta: dict) -> list[str]:
         
     elif item_type == "code_chunk":
         # Handle code chunks from code indexing
-        source_file = meta.get("source_file", "unknown file")
-        language = meta.get("language", "text")
-        start_line = meta.get("start_line", "?")
-        end_line = meta.get("end_line", "?")
-        name = meta.get("name", "")
-        content = meta.get("content", "")
+        source_file = _g("source_file", "unknown file")
+        language = _g("language", "text")
+        start_line = _g("start_line", "?")
+        end_line = _g("end_line", "?")
+        name = _g("name", "")
+        content = _g("content", "")
         
         # Create a descriptive header
         if name:
@@ -202,7 +219,8 @@ def _formulate_query_from_active_tasks(active_tasks: List[Dict[str, Any]], max_t
     query = " ".join(query_parts)
     
     # Log the query for debugging
-    logging.debug(f"Generated context query from tasks: {query[:100]}...")
+    if logging.getLogger().isEnabledFor(logging.DEBUG):
+        logging.debug("Generated context query from tasks: %s...", query[:100])
     
     return query
 
@@ -434,6 +452,7 @@ def make(focus=None, quiet=False) -> tuple[bool, str, str]:
 
     final_mdc_parts = []
     current_total_tokens = 0
+    newline_tokens = len(enc.encode("\n"))
 
     # 0. Header with AI context interpretation guide
     header_block = """
@@ -537,20 +556,20 @@ This file contains the most relevant context for the current development session
                         task_md_segment = "\n".join(task_md_lines) + "\n" 
                         task_tokens = len(enc.encode(task_md_segment))
                         
-                        logging.debug(f"Task #{task_data.get('id')}: '{task_data.get('title')}' requires {task_tokens} tokens")
+                        logging.debug("Task #%s: '%s' requires %d tokens", task_data.get('id'), task_data.get('title'), task_tokens)
 
                         # Total for section includes its own items + header, check against overall budget
                         if current_total_tokens + tasks_section_header_tokens + current_tasks_section_tokens + task_tokens <= max_total_tokens:
-                            temp_task_md_parts.append(task_md_segment)
+                            temp_task_md_parts.append((task_md_segment, task_tokens))
                             current_tasks_section_tokens += task_tokens
                         else:
                             logging.info(f"Task '{task_data.get('title','N/A')}' exceeds token budget. Stopping task additions.")
                             break
                     
                     if temp_task_md_parts:
-                        full_tasks_section_str = tasks_section_header_str + "".join(temp_task_md_parts) + "\n" # Ensure newline after section
-                        # Recalculate actual tokens for the constructed section to be precise
-                        actual_full_tasks_section_tokens = len(enc.encode(full_tasks_section_str))
+                        full_tasks_section_str = tasks_section_header_str + "".join(segment for segment, _ in temp_task_md_parts) + "\n" # Ensure newline after section
+                        # Reuse the per-segment counts instead of re-encoding the assembled section
+                        actual_full_tasks_section_tokens = tasks_section_header_tokens + current_tasks_section_tokens + newline_tokens
                         
                         # Final check with actual tokens
                         if current_total_tokens + actual_full_tasks_section_tokens <= max_total_tokens:
@@ -572,23 +591,21 @@ This file contains the most relevant context for the current development session
     context_results = []
     derived_query = None
     
-    # Try to derive context from active tasks if no focus query is provided
+    # Derive a context query from active tasks when no focus query is provided
     if current_total_tokens < max_total_tokens and not focus and active_yaml_tasks_data:
         try:
-            # Derive a context query from active tasks when no focus is provided
             derived_query = _formulate_query_from_active_tasks(active_yaml_tasks_data)
-            logging.info(f"Derived context query from active tasks: '{derived_query[:100]}...' ({len(derived_query)} chars)")
-            
+            logging.info("Derived context query from active tasks: '%s...' (%d chars)", derived_query[:100], len(derived_query))
+        except Exception as e:
+            logging.error(f"Error deriving context query from active tasks: {e}")
+    
+    # Task-derived context
+    if current_total_tokens < max_total_tokens and derived_query is not None:
+        try:
             if derived_query:
-                # Use the derived query for FAISS search with appropriate predicate
-                def context_predicate(meta_item):
-                    item_type = meta_item.get("type", "")
-                    # Only include code_chunk, snippet, and note types
-                    return item_type in ["code_chunk", "snippet", "note"]
-                
                 # Search based on the derived query with the predicate
-                logging.info(f"Searching for context with derived query, top_k={top_k_context}")
-                search_results = search(derived_query, top_k=top_k_context, pred=context_predicate)
+                logging.info("Searching for context with derived query, top_k=%d", top_k_context)
+                search_results = search(derived_query, top_k=top_k_context, pred=_context_predicate)
                 
                 if search_results:
                     logging.info(f"Found {len(search_results)} context items relevant to active tasks")
@@ -603,6 +620,10 @@ This file contains the most relevant context for the current development session
                     
                     if current_total_tokens + context_section_header_tokens <= max_total_tokens:
                         for meta, score in search_results:
+                            # Items without a body only add header overhead; don't spend tokens on them
+                            if not _has_context_body(meta):
+                                logging.debug("Skipping context item %s: empty content", meta.get('id', 'N/A'))
+                                continue
                             # Use updated _format_context_item_for_mdc that handles all types
                             item_md_lines = _format_context_item_for_mdc(meta)
                             # Each item is a list of lines; join them with double newlines for better separation
@@ -610,22 +631,23 @@ This file contains the most relevant context for the current development session
                             item_tokens = len(enc.encode(item_md_segment))
                             
                             # Add logging to trace retrieved items
-                            item_id = meta.get('id', 'N/A')
-                            item_type = meta.get('type', 'unknown')
-                            logging.info(f"Retrieved context item: type={item_type}, id={item_id}, score={score:.4f}, tokens={item_tokens}")
+                            _g = meta.get
+                            item_id = _g('id', 'N/A')
+                            item_type = _g('type', 'unknown')
+                            logging.info("Retrieved context item: type=%s, id=%s, score=%.4f, tokens=%d", item_type, item_id, score, item_tokens)
                             
                             if current_total_tokens + context_section_header_tokens + current_context_section_tokens + item_tokens <= max_total_tokens:
-                                temp_context_md_parts.append(item_md_segment)
+                                temp_context_md_parts.append((item_md_segment, item_tokens))
                                 current_context_section_tokens += item_tokens
                                 context_results.append(meta)
                             else:
-                                logging.info(f"Context item ID {item_id} ({item_type}) exceeds token budget. Stopping context additions.")
+                                logging.info("Context item ID %s (%s) exceeds token budget. Stopping context additions.", item_id, item_type)
                                 break
                         
                         if temp_context_md_parts:
-                            full_context_section_str = context_section_header_str + "".join(temp_context_md_parts)
-                            # Recalculate actual tokens
-                            actual_full_context_section_tokens = len(enc.encode(full_context_section_str))
+                            full_context_section_str = context_section_header_str + "".join(segment for segment, _ in temp_context_md_parts)
+                            # Reuse the per-item counts instead of re-encoding the assembled section
+                            actual_full_context_section_tokens = context_section_header_tokens + current_context_section_tokens
                             
                             if current_total_tokens + actual_full_context_section_tokens <= max_total_tokens:
                                 final_mdc_parts.append(full_context_section_str)
@@ -647,14 +669,9 @@ This file contains the most relevant context for the current development session
     # Use focus query if provided (original behavior)
     if current_total_tokens < max_total_tokens and focus:
         try:
-            # Update search predicate to include code_chunk, snippet, and note types
-            def context_predicate(meta_item):
-                item_type = meta_item.get("type", "")
-                return item_type in ["code_chunk", "snippet", "note"]
-                
             # Search based on focus with the updated predicate
-            logging.info(f"Searching for context with focus query: '{focus}', top_k={top_k_context}")
-            search_results = search(focus, top_k=top_k_context, pred=context_predicate)
+            logging.info("Searching for context with focus query: '%s', top_k=%d", focus, top_k_context)
+            search_results = search(focus, top_k=top_k_context, pred=_context_predicate)
             
             # Format context items
             if search_results:
@@ -669,6 +686,10 @@ This file contains the most relevant context for the current development session
                 
                 if current_total_tokens + context_section_header_tokens <= max_total_tokens:
                     for meta, score in search_results:
+                        # Items without a body only add header overhead; don't spend tokens on them
+                        if not _has_context_body(meta):
+                            logging.debug("Skipping context item %s: empty content", meta.get('id', 'N/A'))
+                            continue
                         # Use updated _format_context_item_for_mdc that handles all types
                         item_md_lines = _format_context_item_for_mdc(meta)
                         # Each item is a list of lines; join them with double newlines for better separation
@@ -676,22 +697,23 @@ This file contains the most relevant context for the current development session
                         item_tokens = len(enc.encode(item_md_segment))
                         
                         # Add logging to trace retrieved items
-                        item_id = meta.get('id', 'N/A')
-                        item_type = meta.get('type', 'unknown')
-                        logging.info(f"Retrieved context item: type={item_type}, id={item_id}, score={score:.4f}, tokens={item_tokens}")
+                        _g = meta.get
+                        item_id = _g('id', 'N/A')
+                        item_type = _g('type', 'unknown')
+                        logging.info("Retrieved context item: type=%s, id=%s, score=%.4f, tokens=%d", item_type, item_id, score, item_tokens)
                         
                         if current_total_tokens + context_section_header_tokens + current_context_section_tokens + item_tokens <= max_total_tokens:
-                            temp_context_md_parts.append(item_md_segment)
+                            temp_context_md_parts.append((item_md_segment, item_tokens))
                             current_context_section_tokens += item_tokens
                             context_results.append(meta)
                         else:
-                            logging.info(f"Context item ID {item_id} ({item_type}) exceeds token budget. Stopping context additions.")
+                            logging.info("Context item ID %s (%s) exceeds token budget. Stopping context additions.", item_id, item_type)
                             break
                     
                     if temp_context_md_parts:
-                        full_context_section_str = context_section_header_str + "".join(temp_context_md_parts)
-                        # Recalculate actual tokens
-                        actual_full_context_section_tokens = len(enc.encode(full_context_section_str))
+                        full_context_section_str = context_section_header_str + "".join(segment for segment, _ in temp_context_md_parts)
+                        # Reuse the per-item counts instead of re-encoding the assembled section
+                        actual_full_context_section_tokens = context_section_header_tokens + current_context_section_tokens
                         
                         if current_total_tokens + actual_full_context_section_tokens <= max_total_tokens:
                             final_mdc_parts.append(full_context_section_str)
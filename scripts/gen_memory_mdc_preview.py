@@ -4,22 +4,24 @@ This module provides functions to preview what will be included in memory.mdc
 without actually writing the file.
 """
 
+import functools
+import io
 import logging
-from typing import Dict, List, Any, Optional, Tuple
+from typing import Dict, List, Any, Optional, Tuple, Iterable, Iterator, Union, FrozenSet
 
 # Import required modules with robust importing
 try:
     from memory_utils import load_cfg, load_preferences, ROOT
-    from thread_safe_store import search
+    from thread_safe_store import search_batch
     from task_store import TaskStore
 except ImportError:
     try:
         from .memory_utils import load_cfg, load_preferences, ROOT
-        from .thread_safe_store import search
+        from .thread_safe_store import search_batch
         from .task_store import TaskStore
     except ImportError:
         from scripts.memory_utils import load_cfg, load_preferences, ROOT
-        from scripts.thread_safe_store import search
+        from scripts.thread_safe_store import search_batch
         from scripts.task_store import TaskStore
 
 try:
@@ -32,6 +34,8 @@ except ImportError:
 
 def count_tokens(text: str) -> int:
     """Count tokens in text, with fallback to character-based estimation."""
+    if not text:
+        return 0
     if HAS_TIKTOKEN:
         try:
             enc = tiktoken.get_encoding("cl100k_base")
@@ -86,12 +90,162 @@ def get_task_context_query(task_id: str, ts: TaskStore) -> Optional[str]:
         return None
 
 
-def preview_context(task_id: Optional[str] = None, 
+# Item kinds yielded by preview_context, in the order they are produced
+PREVIEW_ITEM_KINDS = ('task', 'preferences', 'active_task', 'snippet', 'note', 'code_chunk', 'error')
+
+# How many items of each kind format_preview_markdown renders
+_PREVIEW_RENDER_LIMITS = {'active_task': 3, 'snippet': 3, 'note': 2, 'code_chunk': 2}
+
+
+def _typed_predicate(type_set: FrozenSet[str], meta: dict) -> bool:
+    """Search predicate matching metadata items whose type is in type_set."""
+    return meta.get('type') in type_set
+
+
+# Search predicates are built once; the vector store calls them per candidate
+_SNIPPET_PRED = functools.partial(_typed_predicate, frozenset({'snippet'}))
+_NOTE_PRED = functools.partial(_typed_predicate, frozenset({'note'}))
+_CODE_CHUNK_PRED = functools.partial(_typed_predicate, frozenset({'code_chunk'}))
+
+
+def _task_to_dict(t, full: bool = True) -> Dict[str, Any]:
+    """Convert a Task object to a plain dict for preview output."""
+    if hasattr(t, 'to_dict'):
+        return t.to_dict()
+    task_dict = {
+        'id': getattr(t, 'id', ''),
+        'title': getattr(t, 'title', ''),
+        'status': getattr(t, 'status', ''),
+        'priority': getattr(t, 'priority', '')
+    }
+    if full:
+        task_dict.update({
+            'progress': getattr(t, 'progress', 0),
+            'description': getattr(t, 'description', ''),
+            'plan': getattr(t, 'plan', []),
+            'notes': getattr(t, 'notes', [])
+        })
+    return task_dict
+
+
+def preview_context(task_id: Optional[str] = None,
                    focus_query: Optional[str] = None,
-                   max_items: int = 10) -> Dict[str, Any]:
+                   max_items: int = 10) -> Iterator[Tuple[str, Any, Optional[float]]]:
+    """
+    Lazily produce the context items that will be included for a task.
+    
+    Items are yielded as ``(kind, payload, score)`` tuples in the order they
+    appear in the preview: the focus task, preferences, other active tasks,
+    then snippets, notes and code chunks in ranked order. Vector store
+    searches only run once the consumer reaches that section, so callers
+    that stop early never pay for them. Search failures are reported as an
+    ``('error', message, None)`` item rather than aborting the stream.
+    
+    Args:
+        task_id: ID of the task to focus on
+        focus_query: Optional custom focus query
+        max_items: Maximum number of items to return
+        
+    Yields:
+        Tuples of (kind, payload, score); score is None for non-search items
+    """
+    # Load configuration
+    cfg = load_cfg()
+    top_k_tasks = cfg.get("prompt", {}).get("top_k_tasks", 5)
+    
+    # Load task store
+    ts = TaskStore()
+    
+    # Get the focus task details
+    if task_id:
+        for t in ts.tasks:
+            if hasattr(t, 'id') and str(t.id) == str(task_id):
+                yield 'task', _task_to_dict(t), None
+                break
+    
+    # Load preferences
+    try:
+        prefs = load_preferences()
+        if prefs:
+            yield 'preferences', prefs, None
+    except:
+        logging.warning("Could not load preferences")
+    
+    # Get other active tasks
+    active_tasks = []
+    for t in ts.tasks:
+        if hasattr(t, 'status') and t.status in ['in_progress', 'todo']:
+            if not task_id or str(t.id) != str(task_id):  # Don't duplicate focus task
+                active_tasks.append(_task_to_dict(t, full=False))
+    
+    # Sort by priority and limit
+    priority_order = {'high': 0, 'medium': 1, 'low': 2}
+    active_tasks.sort(key=lambda t: priority_order.get(t.get('priority', 'low'), 3))
+    for task_dict in active_tasks[:top_k_tasks]:
+        yield 'active_task', task_dict, None
+    
+    # Generate search query
+    query = None
+    if task_id and not focus_query:
+        query = get_task_context_query(task_id, ts)
+    elif focus_query:
+        query = focus_query
+    
+    if not query:
+        return
+    
+    # Search for each type; one embedding and FAISS pass serves all three
+    try:
+        snippet_hits, note_hits, code_chunk_hits = search_batch(
+            [query] * 3, top_k=5, pred=[_SNIPPET_PRED, _NOTE_PRED, _CODE_CHUNK_PRED]
+        )
+        
+        # Get snippets
+        for meta, score in snippet_hits:
+            _g = meta.get
+            yield 'snippet', {
+                'id': _g('id'),
+                'title': _g('title', 'Untitled'),
+                'content': _g('content', ''),
+                'language': _g('language', ''),
+                'score': score
+            }, score
+        
+        # Get notes
+        for meta, score in note_hits:
+            _g = meta.get
+            yield 'note', {
+                'id': _g('id'),
+                'title': _g('title', 'Untitled'),
+                'content': _g('content', ''),
+                'score': score
+            }, score
+        
+        # Get code chunks
+        for meta, score in code_chunk_hits:
+            _g = meta.get
+            yield 'code_chunk', {
+                'id': _g('id'),
+                'file_path': _g('file_path', ''),
+                'content': _g('content', ''),
+                'language': _g('language', ''),
+                'chunk_type': _g('chunk_type', ''),
+                'score': score
+            }, score
+            
+    except Exception as e:
+        logging.error(f"Error searching for context: {e}")
+        yield 'error', f"Search error: {str(e)}", None
+
+
+def preview_context_eager(task_id: Optional[str] = None,
+                          focus_query: Optional[str] = None,
+                          max_items: int = 10) -> Dict[str, Any]:
     """
     Preview what context items will be included for a task.
     
+    Exhausts preview_context() into a dictionary and computes token statistics.
+    
     Args:
         task_id: ID of the task to focus on
         focus_query: Optional custom focus query
@@ -116,117 +270,20 @@ def preview_context(task_id: Optional[str] = None,
         },
         'error': None
     }
+    list_keys = {'active_task': 'tasks', 'snippet': 'snippets', 'note': 'notes', 'code_chunk': 'code_chunks'}
     
     try:
-        # Load configuration
-        cfg = load_cfg()
-        top_k_tasks = cfg.get("prompt", {}).get("top_k_tasks", 5)
-        top_k_context = cfg.get("prompt", {}).get("top_k_context_items", max_items)
-        
-        # Load task store
-        ts = TaskStore()
-        
-        # Get the focus task details
-        if task_id:
-            for t in ts.tasks:
-                if hasattr(t, 'id') and str(t.id) == str(task_id):
-                    task_dict = t.to_dict() if hasattr(t, 'to_dict') else {
-                        'id': getattr(t, 'id', ''),
-                        'title': getattr(t, 'title', ''),
-                        'status': getattr(t, 'status', ''),
-                        'priority': getattr(t, 'priority', ''),
-                        'progress': getattr(t, 'progress', 0),
-                        'description': getattr(t, 'description', ''),
-                        'plan': getattr(t, 'plan', []),
-                        'notes': getattr(t, 'notes', [])
-                    }
-                    result['task'] = task_dict
-                    result['stats']['task_tokens'] = count_tokens(str(task_dict))
-                    break
-        
-        # Load preferences
-        try:
-            prefs = load_preferences()
-            if prefs:
-                result['preferences'] = prefs
-                result['stats']['preference_tokens'] = count_tokens(str(prefs))
-        except:
-            logging.warning("Could not load preferences")
-        
-        # Get other active tasks
-        active_tasks = []
-        for t in ts.tasks:
-            if hasattr(t, 'status') and t.status in ['in_progress', 'todo']:
-                if not task_id or str(t.id) != str(task_id):  # Don't duplicate focus task
-                    task_dict = t.to_dict() if hasattr(t, 'to_dict') else {
-                        'id': getattr(t, 'id', ''),
-                        'title': getattr(t, 'title', ''),
-                        'status': getattr(t, 'status', ''),
-                        'priority': getattr(t, 'priority', '')
-                    }
-                    active_tasks.append(task_dict)
-        
-        # Sort by priority and limit
-        priority_order = {'high': 0, 'medium': 1, 'low': 2}
-        active_tasks.sort(key=lambda t: priority_order.get(t.get('priority', 'low'), 3))
-        result['tasks'] = active_tasks[:top_k_tasks]
-        
-        # Generate search query
-        query = None
-        if task_id and not focus_query:
-            query = get_task_context_query(task_id, ts)
-        elif focus_query:
-            query = focus_query
-        
-        if query:
-            # Define predicates for different types
-            def snippet_pred(meta):
-                return meta.get('type') == 'snippet'
-            
-            def note_pred(meta):
-                return meta.get('type') == 'note'
-            
-            def code_chunk_pred(meta):
-                return meta.get('type') == 'code_chunk'
-            
-            # Search for each type
-            try:
-                # Get snippets
-                snippet_results = search(query, top_k=5, pred=snippet_pred)
-                for meta, score in snippet_results:
-                    result['snippets'].append({
-                        'id': meta.get('id'),
-                        'title': meta.get('title', 'Untitled'),
-                        'content': meta.get('content', ''),
-                        'language': meta.get('language', ''),
-                        'score': score
-                    })
-                
-                # Get notes
-                note_results = search(query, top_k=5, pred=note_pred)
-                for meta, score in note_results:
-                    result['notes'].append({
-                        'id': meta.get('id'),
-                        'title': meta.get('title', 'Untitled'),
-                        'content': meta.get('content', ''),
-                        'score': score
-                    })
-                
-                # Get code chunks
-                chunk_results = search(query, top_k=5, pred=code_chunk_pred)
-                for meta, score in chunk_results:
-                    result['code_chunks'].append({
-                        'id': meta.get('id'),
-                        'file_path': meta.get('file_path', ''),
-                        'content': meta.get('content', ''),
-                        'language': meta.get('language', ''),
-                        'chunk_type': meta.get('chunk_type', ''),
-                        'score': score
-                    })
-                    
-            except Exception as e:
-                logging.error(f"Error searching for context: {e}")
-                result['error'] = f"Search error: {str(e)}"
+        for kind, payload, _score in preview_context(task_id, focus_query, max_items):
+            if kind == 'task':
+                result['task'] = payload
+                result['stats']['task_tokens'] = count_tokens(str(payload))
+            elif kind == 'preferences':
+                result['preferences'] = payload
+                result['stats']['preference_tokens'] = count_tokens(str(payload))
+            elif kind == 'error':
+                result['error'] = payload
+            else:
+                result[list_keys[kind]].append(payload)
         
         # Calculate statistics
         all_items = result['snippets'] + result['notes'] + result['code_chunks']
@@ -252,63 +309,108 @@ def preview_context(task_id: Optional[str] = None,
     return result
 
 
-def format_preview_markdown(preview_data: Dict[str, Any]) -> str:
-    """Format preview data as markdown for display."""
-    if not preview_data.get('success'):
-        return f"❌ Error: {preview_data.get('error', 'Unknown error')}"
-    
-    lines = ["# Memory Context Preview\n"]
-    
-    # Current task
+def _iter_preview_dict(preview_data: Dict[str, Any]) -> Iterator[Tuple[str, Any, Optional[float]]]:
+    """Replay an eager preview dict as the item stream produced by preview_context."""
     if preview_data.get('task'):
-        task = preview_data['task']
-        lines.append("## 🎯 Current Task\n")
-        lines.append(f"**{task.get('title', 'Untitled')}**\n")
-        if task.get('description'):
-            lines.append(f"*{task['description']}*\n")
-        lines.append(f"- Status: {task.get('status', 'unknown')}")
-        lines.append(f"- Priority: {task.get('priority', 'medium')}")
-        lines.append(f"- Progress: {task.get('progress', 0)}%\n")
+        yield 'task', preview_data['task'], None
+    for kind, key in (('active_task', 'tasks'), ('snippet', 'snippets'),
+                      ('note', 'notes'), ('code_chunk', 'code_chunks')):
+        for item in preview_data.get(key) or []:
+            yield kind, item, item.get('score')
+
+
+def format_preview_markdown(preview_data: Union[Dict[str, Any], Iterable[Tuple[str, Any, Optional[float]]]]) -> str:
+    """
+    Format preview data as markdown for display.
     
-    # Other active tasks
-    if preview_data.get('tasks'):
-        lines.append("## 📋 Other Active Tasks\n")
-        for task in preview_data['tasks'][:3]:
-            lines.append(f"- **{task.get('title')}** [{task.get('status')}]")
-        lines.append("")
+    Accepts either the dictionary returned by preview_context_eager() or the
+    item stream from preview_context(). Only the first few items of each kind
+    are rendered; the stream is consumed in a single pass.
+    """
+    if isinstance(preview_data, dict):
+        if not preview_data.get('success'):
+            return f"❌ Error: {preview_data.get('error', 'Unknown error')}"
+        items = _iter_preview_dict(preview_data)
+    else:
+        items = preview_data
     
-    # Relevant snippets
-    if preview_data.get('snippets'):
-        lines.append("## 💾 Relevant Code Snippets\n")
-        for snippet in preview_data['snippets'][:3]:
-            lines.append(f"### {snippet.get('title')}")
-            lines.append(f"```{snippet.get('language', '')}")
-            content = snippet.get('content', '')
-            # Don't truncate content for preview - let the UI handle scrolling
-            lines.append(content)
-            lines.append("```\n")
+    # Lines are written straight to the sink; each one after the title is
+    # preceded by its separator so the output matches a "\n".join of lines.
+    buf = io.StringIO()
+    w = buf.write
+    w("# Memory Context Preview\n")
+    rendered = dict.fromkeys(_PREVIEW_RENDER_LIMITS, 0)
+    open_section = None
     
-    # Relevant notes
-    if preview_data.get('notes'):
-        lines.append("## 📝 Relevant Notes\n")
-        for note in preview_data['notes'][:2]:
-            lines.append(f"**{note.get('title')}**")
-            content = note.get('content', '')
-            # Don't truncate content for preview
-            lines.append(f"{content}\n")
+    try:
+        for kind, item, _score in items:
+            limit = _PREVIEW_RENDER_LIMITS.get(kind)
+            if limit is not None:
+                if rendered[kind] >= limit:
+                    continue
+                rendered[kind] += 1
+            
+            # Close the "other active tasks" list once we move past it
+            if open_section == 'active_task' and kind != 'active_task':
+                w("\n")
+            
+            # Current task
+            if kind == 'task':
+                w("\n## 🎯 Current Task\n")
+                w(f"\n**{item.get('title', 'Untitled')}**\n")
+                if item.get('description'):
+                    w(f"\n*{item['description']}*\n")
+                w(f"\n- Status: {item.get('status', 'unknown')}")
+                w(f"\n- Priority: {item.get('priority', 'medium')}")
+                w(f"\n- Progress: {item.get('progress', 0)}%\n")
+            
+            # Other active tasks
+            elif kind == 'active_task':
+                if open_section != kind:
+                    w("\n## 📋 Other Active Tasks\n")
+                w(f"\n- **{item.get('title')}** [{item.get('status')}]")
+            
+            # Relevant snippets
+            elif kind == 'snippet':
+                if open_section != kind:
+                    w("\n## 💾 Relevant Code Snippets\n")
+                w(f"\n### {item.get('title')}")
+                w(f"\n```{item.get('language', '')}")
+                # Don't truncate content for preview - let the UI handle scrolling
+                w(f"\n{item.get('content', '')}")
+                w("\n```\n")
+            
+            # Relevant notes
+            elif kind == 'note':
+                if open_section != kind:
+                    w("\n## 📝 Relevant Notes\n")
+                w(f"\n**{item.get('title')}**")
+                # Don't truncate content for preview
+                w(f"\n{item.get('content', '')}\n")
+            
+            # Code chunks
+            elif kind == 'code_chunk':
+                if open_section != kind:
+                    w("\n## 🗂️ Relevant Code from Project\n")
+                w(f"\n**{item.get('file_path', 'Unknown file')}**")
+                w(f"\n```{item.get('language', '')}")
+                # Don't truncate content for preview
+                w(f"\n{item.get('content', '')}")
+                w("\n```\n")
+            
+            else:
+                # Preferences and search errors are not rendered in the preview body
+                continue
+            
+            open_section = kind
+    except Exception as e:
+        logging.error(f"Error generating context preview: {e}")
+        return f"❌ Error: {e}"
     
-    # Code chunks
-    if preview_data.get('code_chunks'):
-        lines.append("## 🗂️ Relevant Code from Project\n")
-        for chunk in preview_data['code_chunks'][:2]:
-            lines.append(f"**{chunk.get('file_path', 'Unknown file')}**")
-            lines.append(f"```{chunk.get('language', '')}")
-            content = chunk.get('content', '')
-            # Don't truncate content for preview
-            lines.append(content)
-            lines.append("```\n")
+    if open_section == 'active_task':
+        w("\n")
     
-    return "\n".join(lines)
+    return buf.getvalue()
 
 
 def format_preview_stats(preview_data: Dict[str, Any]) -> str:
@@ -337,7 +439,7 @@ def format_preview_stats(preview_data: Dict[str, Any]) -> str:
 # Test function
 if __name__ == "__main__":
     # Test preview
-    preview = preview_context()
+    preview = preview_context_eager()
     print(format_preview_markdown(preview))
     print("\n---\n")
     print(format_preview_stats(preview))
\ No newline at end of file
@@ -8,26 +8,41 @@ them in the FAISS vector store for retrieval.
 """
 import os
 import sys
+import json
 import pathlib
+import re
 import fnmatch
+import functools
 import logging
 import argparse
-from typing import List, Dict, Any, Optional, Set
+import concurrent.futures
+from typing import List, Dict, Any, Callable, Iterator, Optional, Set
+
+try:
+    import orjson
+except ImportError:  # Optional speed-up; the standard json module is used otherwise
+    orjson = None
 
 # Use proper package imports
 try:
     # When run as a module within the package
-    from .memory_utils import load_cfg, index_code_chunk, delete_code_chunks, ROOT
+    from .memory_utils import (load_cfg, index_code_chunks_batch, delete_code_chunks,
+                               delete_vectors_by_filter, get_vec_dir, load_index,
+                               deferred_saves, flush_index, ROOT)
     from .code_indexer_utils import get_chunker_for_file
 except ImportError:
     # When run as a script directly
     try:
-        from memory_utils import load_cfg, index_code_chunk, delete_code_chunks, ROOT
+        from memory_utils import (load_cfg, index_code_chunks_batch, delete_code_chunks,
+                                  delete_vectors_by_filter, get_vec_dir, load_index,
+                                  deferred_saves, flush_index, ROOT)
         from code_indexer_utils import get_chunker_for_file
     except ImportError:
         # Last resort: absolute import
         try:
-            from memex.scripts.memory_utils import load_cfg, index_code_chunk, delete_code_chunks, ROOT
+            from memex.scripts.memory_utils import (load_cfg, index_code_chunks_batch, delete_code_chunks,
+                                                    delete_vectors_by_filter, get_vec_dir, load_index,
+                                                    deferred_saves, flush_index, ROOT)
             from memex.scripts.code_indexer_utils import get_chunker_for_file
         except ImportError as e:
             logging.error(f"Failed to import required modules: {e}")
@@ -40,55 +55,149 @@ logging.basicConfig(
     datefmt="%Y-%m-%d %H:%M:%S"
 )
 
-def _matches_pattern(path: str, pattern: str) -> bool:
+# Number of chunks buffered before they are written to the vector store
+_COMMIT_BATCH_CHUNKS = 256
+
+# Per-file record of what was last indexed, kept next to the vector store
+_MANIFEST_FILENAME = "code_index_manifest.json"
+
+# Structural pattern shapes that reduce to plain string operations
+_EXT_SUFFIX_RE = re.compile(r"^\*\*/\*(\.[A-Za-z0-9_]+)$")      # **/*.ext
+_DIR_INFIX_RE = re.compile(r"^\*\*/([^*?\[\]/]+)/\*\*$")       # **/name/**
+
+@functools.lru_cache(maxsize=None)
+def _compile_pattern(pattern: str) -> Callable[[str], bool]:
     """
-    Check if a file path matches a glob pattern, properly handling ** wildcards.
+    Compile a glob pattern into a matcher, properly handling ** wildcards.
+    
+    Common shapes (exact paths, ``dir/**/*``, ``**/*.ext``, ``**/name/**``)
+    become plain string comparisons; anything else is translated to a
+    regex. Compiled matchers are cached, so each pattern is translated
+    only once no matter how many paths it is tested against.
     
     Args:
-        path: File path to check (relative to root)
         pattern: Glob pattern that may contain ** wildcards
         
     Returns:
-        True if the path matches the pattern
+        Callable taking a '/'-separated relative path and returning True on a match
     """
-    import re
-    
-    # Normalize paths for comparison
-    path = path.replace('\\', '/')
     pattern = pattern.replace('\\', '/')
     
-    # Debug logging for specific patterns
-    debug_patterns = ['memex/**/*', '.idea/**/*', '.cursor/vecstore/**/*']
-    if pattern in debug_patterns and any(p in path for p in ['memex/', '.idea/', '.cursor/']):
-        logging.debug(f"Checking: path='{path}' against pattern='{pattern}'")
-    
     # For exact match patterns (no wildcards)
     if '*' not in pattern:
-        return path == pattern
+        return lambda path, _exact=pattern: path == _exact
     
     # Handle ** patterns
     if '**' in pattern:
         # For patterns like "dir/**/*" - check if path starts with "dir/"
         if pattern.endswith('/**/*'):
-            prefix = pattern[:-5]  # Remove /**/*
-            result = path.startswith(prefix + '/')
-            if pattern in debug_patterns and any(p in path for p in ['memex/', '.idea/', '.cursor/']):
-                logging.debug(f"  Prefix match: '{prefix}/' -> {result}")
-            return result
+            prefix = pattern[:-5] + '/'  # Remove /**/*
+            return lambda path, _prefix=prefix: path.startswith(_prefix)
+        
+        # "**/*.ext": any nested path ending in .ext (** consumes a leading "/")
+        ext_match = _EXT_SUFFIX_RE.match(pattern)
+        if ext_match:
+            suffix = ext_match.group(1)
+            return lambda path, _suffix=suffix: path.endswith(_suffix) and '/' in path
+        
+        # "**/name/**": a "/name/" segment anywhere in the path
+        dir_match = _DIR_INFIX_RE.match(pattern)
+        if dir_match:
+            infix = f"/{dir_match.group(1)}/"
+            return lambda path, _infix=infix: _infix in path
         
         # For other ** patterns, convert to regex
         regex_pattern = re.escape(pattern)
         regex_pattern = regex_pattern.replace(r'\*\*', '.*')  # ** matches any path
         regex_pattern = regex_pattern.replace(r'\*', '[^/]*')  # * matches any filename part
-        regex_pattern = '^' + regex_pattern + '$'
+        regex = re.compile('^' + regex_pattern + '$')
+        return lambda path, _match=regex.match: _match(path) is not None
+    
+    # For simple patterns without **, use fnmatch semantics
+    # (fnmatch.fnmatch is case-insensitive where the OS normalizes case)
+    flags = re.IGNORECASE if os.path.normcase('A') == 'a' else 0
+    regex = re.compile(fnmatch.translate(pattern), flags)
+    return lambda path, _match=regex.match: _match(path) is not None
+
+def _matches_pattern(path: str, pattern: str) -> bool:
+    """
+    Check if a file path matches a glob pattern, properly handling ** wildcards.
+    
+    Args:
+        path: '/'-separated file path to check (relative to root); callers
+            normalize once per path rather than once per pattern
+        pattern: Glob pattern that may contain ** wildcards
         
-        result = bool(re.match(regex_pattern, path))
-        if pattern in debug_patterns and any(p in path for p in ['memex/', '.idea/', '.cursor/']):
-            logging.debug(f"  Regex: '{regex_pattern}' -> {result}")
-        return result
-    else:
-        # For simple patterns without **, use fnmatch
-        return fnmatch.fnmatch(path, pattern)
+    Returns:
+        True if the path matches the pattern
+    """
+    return _compile_pattern(pattern)(path)
+
+def _split_dir_excludes(patterns: List[str]) -> tuple:
+    """
+    Pull out exclude patterns that only ever exclude whole directories.
+    
+    ``**/name/**`` excludes everything below any nested directory called
+    ``name`` and ``dir/**/*`` everything below ``dir``; both can be applied
+    with a set lookup when the walker reaches the directory, so the files
+    inside are never listed or matched.
+    
+    Returns:
+        (excluded nested directory names, excluded directory paths, remaining patterns)
+    """
+    dir_names = set()
+    dir_paths = set()
+    remaining = []
+    for pattern in patterns:
+        dir_match = _DIR_INFIX_RE.match(pattern)
+        if dir_match:
+            dir_names.add(dir_match.group(1))
+        elif pattern.endswith('/**/*') and not any(c in pattern[:-5] for c in '*?['):
+            dir_paths.add(pattern[:-5])
+        else:
+            remaining.append(pattern)
+    return frozenset(dir_names), frozenset(dir_paths), remaining
+
+def _walk_relative_files(search_root: pathlib.Path, exclude_fns: List[Callable[[str], bool]],
+                         excluded_dir_names: frozenset = frozenset(),
+                         excluded_dir_paths: frozenset = frozenset()) -> Iterator[str]:
+    """
+    Yield '/'-separated paths (relative to search_root) of all files under it.
+    
+    Uses os.scandir so file/directory type comes from the directory read
+    itself instead of an extra stat per entry. Directories are not descended
+    into when they are named in excluded_dir_names (below the top level, as
+    ``**/name/**`` requires), listed in excluded_dir_paths, or match an
+    exclude pattern. Like os.walk, symlinked directories are not followed
+    and unreadable directories are skipped.
+    """
+    stack = [""]
+    while stack:
+        rel_dir = stack.pop()
+        dir_path = os.path.join(search_root, rel_dir) if rel_dir else search_root
+        subdirs = []
+        try:
+            with os.scandir(dir_path) as it:
+                for entry in it:
+                    rel_path = f"{rel_dir}/{entry.name}" if rel_dir else entry.name
+                    try:
+                        is_dir = entry.is_dir()
+                    except OSError:
+                        is_dir = False
+                    if is_dir:
+                        if entry.is_symlink():
+                            continue
+                        if (rel_dir and entry.name in excluded_dir_names) or rel_path in excluded_dir_paths:
+                            continue
+                        if not any(f(rel_path) for f in exclude_fns):
+                            subdirs.append(rel_path)
+                    else:
+                        yield rel_path
+        except OSError as e:
+            logging.debug(f"Skipping unreadable directory {dir_path}: {e}")
+            continue
+        # Push in reverse so directories are visited in scan order, like os.walk
+        stack.extend(reversed(subdirs))
 
 def find_files_to_index(cfg: Dict[str, Any], root_dir: pathlib.Path) -> List[pathlib.Path]:
     """
@@ -140,54 +249,47 @@ def find_files_to_index(cfg: Dict[str, Any], root_dir: pathlib.Path) -> List[pat
     
     all_files = []
     
-    # Walk the directory tree
-    for root, dirs, files in os.walk(search_root):
-        rel_root = pathlib.Path(root).relative_to(search_root)
-        
-        # Skip directories that match exclude patterns
-        dirs_to_remove = []
-        for i, dir_name in enumerate(dirs):
-            rel_dir_path = str(rel_root / dir_name)
-            if any(_matches_pattern(rel_dir_path, pat) for pat in resolved_exclude_patterns):
-                dirs_to_remove.append(i)
+    # Whole-directory excludes become set lookups in the walker; compile the
+    # rest once, outside the per-file loop
+    excluded_dir_names, excluded_dir_paths, file_exclude_patterns = _split_dir_excludes(resolved_exclude_patterns)
+    include_fns = [_compile_pattern(pat) for pat in resolved_include_patterns]
+    exclude_fns = [_compile_pattern(pat) for pat in file_exclude_patterns]
+    
+    # Only pay for the debug path checks when debug logging is on
+    debug = logging.getLogger().isEnabledFor(logging.DEBUG)
+    
+    # Walk the directory tree, pruning excluded directories before descending
+    for rel_file_path in _walk_relative_files(search_root, exclude_fns, excluded_dir_names, excluded_dir_paths):
+        # Debug: log problematic paths
+        trace = debug and any(p in rel_file_path for p in ['memex/', '.idea/', '.cursor/'])
+        if trace:
+            logging.debug(f"Processing file: {rel_file_path}")
         
-        # Remove excluded directories in reverse order to avoid index shifting
-        for i in sorted(dirs_to_remove, reverse=True):
-            del dirs[i]
+        # Skip files that match exclude patterns
+        if any(f(rel_file_path) for f in exclude_fns):
+            if trace:
+                logging.debug(f"  -> Excluded!")
+            continue
         
-        # Check each file against include and exclude patterns
-        for file_name in files:
-            rel_file_path = str(rel_root / file_name)
-            
-            # Debug: log problematic paths
-            if any(p in rel_file_path for p in ['memex/', '.idea/', '.cursor/']):
-                logging.debug(f"Processing file: {rel_file_path}")
-            
-            # Skip files that match exclude patterns
-            if any(_matches_pattern(rel_file_path, pat) for pat in resolved_exclude_patterns):
-                if any(p in rel_file_path for p in ['memex/', '.idea/', '.cursor/']):
-                    logging.debug(f"  -> Excluded!")
-                continue
-            
-            # Add files that match include patterns
-            if any(_matches_pattern(rel_file_path, pat) for pat in resolved_include_patterns):
-                all_files.append(search_root / rel_file_path)
-                if any(p in rel_file_path for p in ['memex/', '.idea/', '.cursor/']):
-                    logging.debug(f"  -> Included!")
+        # Add files that match include patterns
+        if any(f(rel_file_path) for f in include_fns):
+            all_files.append(search_root / rel_file_path)
+            if trace:
+                logging.debug(f"  -> Included!")
     
     logging.info(f"Found {len(all_files)} files to index")
     return all_files
 
-def index_file(file_path: pathlib.Path, cfg: Dict[str, Any]) -> int:
+def iter_file_chunks(file_path: pathlib.Path, cfg: Dict[str, Any]) -> Iterator[Dict[str, Any]]:
     """
-    Index a single file by chunking it and adding to vector store.
+    Yield the chunks of a single file without touching the vector store.
     
     Args:
-        file_path: Path to the file to index
+        file_path: Path to the file to chunk
         cfg: Configuration dictionary
         
-    Returns:
-        Number of chunks indexed
+    Yields:
+        Chunk dictionaries, in file order
     """
     min_chunk_lines = cfg.get("files", {}).get("min_chunk_lines", 5)
     max_chunk_lines = cfg.get("files", {}).get("max_chunk_lines", 100)
@@ -196,36 +298,187 @@ def index_file(file_path: pathlib.Path, cfg: Dict[str, Any]) -> int:
     chunker = get_chunker_for_file(str(file_path))
     if not chunker:
         logging.warning(f"No chunker available for file: {file_path}")
-        return 0
+        return
     
     # Get chunks from the file
-    chunks = chunker(str(file_path), min_lines=min_chunk_lines, max_lines=max_chunk_lines)
+    produced = False
+    for chunk in chunker(str(file_path), min_lines=min_chunk_lines, max_lines=max_chunk_lines):
+        produced = True
+        yield chunk
     
-    if not chunks:
+    if not produced:
         logging.warning(f"No chunks generated for file: {file_path}")
-        return 0
+
+def chunk_file(file_path: pathlib.Path, cfg: Dict[str, Any]) -> List[Dict[str, Any]]:
+    """
+    Split a single file into chunks without touching the vector store.
+    
+    This is pure CPU work with no shared state, so it is safe to run in a
+    worker process.
     
-    # Index each chunk
-    successful_chunks = 0
-    for chunk in chunks:
-        chunk_id = chunk.get("id")
-        content = chunk.get("content", "")
+    Args:
+        file_path: Path to the file to chunk
+        cfg: Configuration dictionary
         
-        if not content or not chunk_id:
-            logging.warning(f"Skipping invalid chunk from {file_path}: missing ID or content")
-            continue
+    Returns:
+        List of chunk dictionaries (empty if the file could not be chunked)
+    """
+    return list(iter_file_chunks(file_path, cfg))
+
+def index_file(file_path: pathlib.Path, cfg: Dict[str, Any]) -> int:
+    """
+    Index a single file by chunking it and adding to vector store.
+    
+    Chunks are streamed into a buffer that is committed every
+    ``_COMMIT_BATCH_CHUNKS`` chunks, so at most one batch is held in
+    memory on top of what the chunker itself needs.
+    
+    Args:
+        file_path: Path to the file to index
+        cfg: Configuration dictionary
+        
+    Returns:
+        Number of chunks indexed
+    """
+    chunks_added = 0
+    buffer = []
+    for chunk in iter_file_chunks(file_path, cfg):
+        buffer.append(chunk)
+        if len(buffer) >= _COMMIT_BATCH_CHUNKS:
+            chunks_added += _commit_chunks([(file_path, buffer)])[0]
+            buffer = []
+    if buffer:
+        chunks_added += _commit_chunks([(file_path, buffer)])[0]
+    return chunks_added
+
+def _commit_chunks(chunked_files: List[tuple]) -> List[int]:
+    """
+    Add the chunks of several files to the vector store in one batch.
+    
+    All chunks are embedded together and the store is saved once.
+    
+    Args:
+        chunked_files: (file_path, chunks) pairs, chunks as produced by chunk_file()
         
-        result = index_code_chunk(chunk_id, content, chunk)
-        if result:
-            successful_chunks += 1
+    Returns:
+        Number of chunks indexed for each file, in the same order
+    """
+    batch = []
+    owners = []
+    for file_idx, (file_path, chunks) in enumerate(chunked_files):
+        for chunk in chunks:
+            chunk_id = chunk.get("id")
+            content = chunk.get("content", "")
+            
+            if not content or not chunk_id:
+                logging.warning(f"Skipping invalid chunk from {file_path}: missing ID or content")
+                continue
+            
+            batch.append((chunk_id, content, chunk))
+            owners.append(file_idx)
+    
+    successful_chunks = [0] * len(chunked_files)
+    if batch:
+        for file_idx, result in zip(owners, index_code_chunks_batch(batch)):
+            if result:
+                successful_chunks[file_idx] += 1
     
-    logging.info(f"Indexed {successful_chunks}/{len(chunks)} chunks from {file_path}")
+    for (file_path, chunks), count in zip(chunked_files, successful_chunks):
+        logging.info(f"Indexed {count}/{len(chunks)} chunks from {file_path}")
     return successful_chunks
 
+def _iter_chunked_files(files_to_index: List[pathlib.Path], cfg: Dict[str, Any], workers: int) -> Iterator[tuple]:
+    """
+    Yield (file_path, chunks, error) for every file, chunking in a process pool.
+    
+    Results are yielded as files finish. Falls back to chunking in this
+    process when only one worker is requested or the pool cannot be used.
+    """
+    done = set()
+    if workers > 1 and len(files_to_index) > 1:
+        try:
+            with concurrent.futures.ProcessPoolExecutor(max_workers=workers) as executor:
+                futures = {executor.submit(chunk_file, fp, cfg): fp for fp in files_to_index}
+                for future in concurrent.futures.as_completed(futures):
+                    file_path = futures[future]
+                    try:
+                        chunks = future.result()
+                    except concurrent.futures.BrokenExecutor:
+                        raise
+                    except Exception as e:
+                        chunks, error = [], e
+                    else:
+                        error = None
+                    done.add(file_path)
+                    yield file_path, chunks, error
+            return
+        except (OSError, concurrent.futures.BrokenExecutor) as e:
+            logging.warning(f"Parallel chunking unavailable ({e}); chunking remaining files sequentially.")
+    
+    for file_path in files_to_index:
+        if file_path in done:
+            continue
+        try:
+            yield file_path, chunk_file(file_path, cfg), None
+        except Exception as e:
+            yield file_path, [], e
+
+def _manifest_path(cfg: Dict[str, Any]) -> pathlib.Path:
+    """Location of the incremental indexing manifest."""
+    return get_vec_dir(cfg) / _MANIFEST_FILENAME
+
+def _load_manifest(cfg: Dict[str, Any]) -> Dict[str, Dict[str, Any]]:
+    """
+    Load the manifest of indexed files.
+    
+    Returns:
+        Mapping of file path -> {"mtime", "size", "chunk_ids"}; empty if missing or unreadable
+    """
+    path = _manifest_path(cfg)
+    try:
+        data = path.read_bytes()
+        manifest = orjson.loads(data) if orjson is not None else json.loads(data)
+    except FileNotFoundError:
+        return {}
+    except (OSError, ValueError) as e:
+        logging.warning(f"Ignoring unreadable index manifest {path}: {e}")
+        return {}
+    return manifest if isinstance(manifest, dict) else {}
+
+def _save_manifest(cfg: Dict[str, Any], manifest: Dict[str, Dict[str, Any]]):
+    """Write the manifest atomically so an interrupted run cannot corrupt it."""
+    path = _manifest_path(cfg)
+    tmp_path = path.with_suffix(".tmp")
+    try:
+        data = orjson.dumps(manifest) if orjson is not None else json.dumps(manifest).encode("utf-8")
+        tmp_path.write_bytes(data)
+        os.replace(tmp_path, path)
+    except OSError as e:
+        logging.error(f"Failed to save index manifest {path}: {e}")
+
+def _file_signature(file_path: pathlib.Path) -> Optional[Dict[str, Any]]:
+    """mtime and size used to detect changed files, or None if the file cannot be stat'ed."""
+    try:
+        st = os.stat(file_path)
+    except OSError:
+        return None
+    return {"mtime": st.st_mtime, "size": st.st_size}
+
 def index_codebase(reindex: bool = False) -> int:
     """
     Index the entire codebase according to config patterns.
     
+    Indexing is incremental: a manifest next to the vector store records
+    each file's mtime, size and chunk IDs. Files that have not changed since
+    the last run are skipped, changed files are re-chunked and their stale
+    chunks removed, and chunks of files that are no longer indexed are
+    deleted. ``reindex`` drops all code chunks and the manifest first.
+    
+    Files are chunked in parallel worker processes (``files.index_workers``
+    in memory.toml, defaulting to the CPU count); chunks are added to the
+    vector store from this process in batches of ``_COMMIT_BATCH_CHUNKS``,
+    and the store files are written once at the end of the run.
+    
     Args:
         reindex: If True, delete all existing code chunks before indexing
         
@@ -238,30 +491,109 @@ def index_codebase(reindex: bool = False) -> int:
         logging.info("Deleting existing code chunks...")
         success_count, failure_count, total_checked = delete_code_chunks()
         logging.info(f"Deleted {success_count} existing code chunks (failed: {failure_count}, checked: {total_checked})")
+        old_manifest = {}
+    else:
+        old_manifest = _load_manifest(cfg)
     
     # Find files to index
     files_to_index = find_files_to_index(cfg, ROOT)
+    workers = cfg.get("files", {}).get("index_workers", os.cpu_count() or 1)
+    
+    # Chunk IDs actually in the store, in case chunks were deleted behind the manifest's back
+    if old_manifest:
+        _, store_meta = load_index()
+    else:
+        store_meta = {}
+    
+    # Only files that changed since the last run need chunking
+    manifest = {}
+    signatures = {}
+    changed_files = []
+    for file_path in files_to_index:
+        key = str(file_path)
+        signature = _file_signature(file_path)
+        previous = old_manifest.get(key)
+        if (signature is not None and previous is not None
+                and previous.get("mtime") == signature["mtime"] and previous.get("size") == signature["size"]
+                and all(chunk_id in store_meta for chunk_id in previous.get("chunk_ids", []))):
+            manifest[key] = previous
+        else:
+            signatures[key] = signature
+            changed_files.append(file_path)
+    unchanged_files = len(files_to_index) - len(changed_files)
     
     # Track indexed files and chunks
     total_chunks = 0
     indexed_files = 0
     skipped_files = 0
     
-    # Process each file
-    for file_path in files_to_index:
+    # Chunked files waiting to be written to the vector store
+    pending = []
+    pending_chunks = 0
+    
+    def flush():
+        nonlocal total_chunks, indexed_files, skipped_files, pending_chunks
         try:
-            chunks_added = index_file(file_path, cfg)
+            counts = _commit_chunks(pending)
+        except Exception as e:
+            logging.error(f"Error indexing batch of {len(pending)} files: {e}")
+            counts = [0] * len(pending)
+        for (file_path, chunks), chunks_added in zip(pending, counts):
             total_chunks += chunks_added
             
             if chunks_added > 0:
                 indexed_files += 1
             else:
                 skipped_files += 1
-        except Exception as e:
-            logging.error(f"Error indexing file {file_path}: {e}")
-            skipped_files += 1
+            
+            # Record the file only if every chunk made it, so failures are retried next run
+            signature = signatures.get(str(file_path))
+            if signature is not None and chunks_added == len(chunks):
+                manifest[str(file_path)] = dict(signature, chunk_ids=[chunk["id"] for chunk in chunks])
+        pending.clear()
+        pending_chunks = 0
+    
+    # Every commit batch updates the store, but the files are written once at
+    # the end, together with the manifest, instead of after each batch
+    with deferred_saves():
+        # Process each changed file
+        for file_path, chunks, error in _iter_chunked_files(changed_files, cfg, workers):
+            if error is not None:
+                logging.error(f"Error indexing file {file_path}: {error}")
+                skipped_files += 1
+                continue
+            if not chunks:
+                skipped_files += 1
+                continue
+            pending.append((file_path, chunks))
+            pending_chunks += len(chunks)
+            if pending_chunks >= _COMMIT_BATCH_CHUNKS:
+                flush()
+        flush()
+        
+        # Chunks recorded last time that the current files no longer produce
+        current_ids = {chunk_id for entry in manifest.values() for chunk_id in entry.get("chunk_ids", [])}
+        stale_ids = {
+            chunk_id
+            for key, entry in old_manifest.items()
+            if manifest.get(key) is not entry
+            for chunk_id in entry.get("chunk_ids", [])
+            if chunk_id not in current_ids
+        }
+        if stale_ids:
+            removed, failed, _ = delete_vectors_by_filter(
+                lambda meta: meta.get("type") == "code_chunk" and meta.get("id") in stale_ids
+            )
+            logging.info(f"Removed {removed} stale code chunks (failed: {failed})")
+        
+        if not flush_index():
+            logging.error("Failed to write the vector store; the manifest is left unchanged so the next run retries.")
+            return total_chunks
+    
+    _save_manifest(cfg, manifest)
     
-    logging.info(f"Indexing complete: {indexed_files} files indexed, {skipped_files} files skipped, {total_chunks} total chunks")
+    logging.info(f"Indexing complete: {indexed_files} files indexed, {unchanged_files} unchanged, "
+                 f"{skipped_files} files skipped, {total_chunks} total chunks")
     return total_chunks
 
 def main(argv=None):
@@ -4,13 +4,16 @@ Memory-bounded IndexManager implementation with automatic cache eviction.
 This module provides a memory-aware version of IndexManager that prevents
 unbounded memory growth through size limits and TTL-based eviction.
 """
+import os
 import sys
 import time
 import logging
 import threading
 import weakref
 import gc
+import itertools
 import psutil
+from collections import OrderedDict, namedtuple
 from typing import Tuple, Dict, Any, Optional
 from datetime import datetime, timedelta
 import pathlib
@@ -42,6 +45,48 @@ def get_memory_utils_functions():
     return _imported_functions
 
 
+def _use_index_mmap(cfg: dict) -> bool:
+    """Whether memory_utils maps the index read-only for this configuration (e.g. "auto" and file size)."""
+    from .memory_utils import _use_index_mmap as use_index_mmap
+    return use_index_mmap(cfg)
+
+
+# Cache hits within this many seconds of the last on-disk check skip stat()
+_MTIME_CHECK_INTERVAL = 1.0
+
+
+def _stat_mtime(path: pathlib.Path) -> float:
+    """Return the file's mtime, or 0 if it does not exist (one syscall)."""
+    try:
+        return os.stat(path).st_mtime
+    except OSError:
+        return 0
+
+
+# Number of metadata items measured when estimating the size of the whole dict
+_META_SIZE_SAMPLE = 32
+
+# In-memory FAISS id maps; sized from their length instead of being walked
+_ID_MAP_KEYS = ("_custom_to_faiss_id_map_", "_faiss_id_to_custom_id_map_")
+
+
+def _shallow_item_size(value: Any) -> int:
+    """Size of a metadata value including its immediate keys/values."""
+    size = sys.getsizeof(value)
+    if isinstance(value, dict):
+        for k, v in value.items():
+            size += sys.getsizeof(k) + sys.getsizeof(v)
+    return size
+
+
+# A cached (index, meta) pair plus the bookkeeping needed for TTL/LRU eviction
+CacheEntry = namedtuple('CacheEntry', 'index meta mtime load_time size')
+
+# Immutable view of the most recently used entry, read without the lock;
+# checked_at is when its files were last confirmed unchanged on disk
+Snapshot = namedtuple('Snapshot', 'key index meta checked_at')
+
+
 class MemoryBoundedIndexManager:
     """
     Memory-bounded version of IndexManager with automatic cache eviction.
@@ -71,11 +116,14 @@ class MemoryBoundedIndexManager:
         self.ttl_seconds = 3600   # Time-to-live for cached entries (1 hour)
         self.check_interval = 60  # How often to check for eviction (seconds)
         
-        # Cache storage
-        self.cache = {}  # key -> (index, meta, metadata)
-        self.access_times = {}  # key -> last access time
-        self.load_times = {}    # key -> load time
-        self.cache_sizes = {}   # key -> estimated size in bytes
+        # Handle on this process, reused for RSS checks
+        self._proc = psutil.Process(os.getpid())
+        
+        # Cache storage: key -> CacheEntry, ordered from least to most recently used
+        self.cache: "OrderedDict[str, CacheEntry]" = OrderedDict()
+        
+        # Replaced (never mutated) under the lock; cache hits read it lock-free
+        self._snapshot: Optional[Snapshot] = None
         
         # Statistics
         self.stats = {
@@ -103,32 +151,58 @@ class MemoryBoundedIndexManager:
         thread = threading.Thread(target=eviction_worker, daemon=True)
         thread.start()
     
-    def _estimate_size(self, index, meta: dict) -> int:
-        """Estimate the memory size of an index and metadata."""
+    def _estimate_size(self, index, meta: dict, mmap_backed: bool = False) -> int:
+        """Estimate the memory size of an index and metadata.
+        
+        Vectors of a memory-mapped index live in the OS page cache rather
+        than the process heap, so only a fixed overhead is counted for them.
+        """
         size = 0
         
         # Estimate FAISS index size
-        if index is not None:
+        if index is not None and mmap_backed:
+            size += 1024
+        elif index is not None:
             try:
                 # FAISS index size approximation
-                # Each vector is d * 4 bytes (float32) + overhead
+                # Each vector is d * 4 bytes (float32) + overhead, unless the
+                # (ID-mapped) index reports a smaller encoded size, e.g. SQ/PQ
                 d = index.d if hasattr(index, 'd') else 0
                 ntotal = index.ntotal if hasattr(index, 'ntotal') else 0
-                size += d * ntotal * 4 + 1024  # Add 1KB overhead
+                code_size = d * 4
+                inner = getattr(index, 'index', index)
+                if hasattr(inner, 'sa_code_size'):
+                    try:
+                        code_size = inner.sa_code_size()
+                    except Exception:
+                        pass
+                size += code_size * ntotal + 1024  # Add 1KB overhead
             except:
                 size += 1024 * 1024  # Default 1MB if we can't estimate
         
-        # Estimate metadata size
-        if meta is not None:
-            # Simple estimation based on string representation
-            meta_str = str(meta)
-            size += len(meta_str.encode('utf-8'))
+        # Estimate metadata size from a sample of items instead of
+        # serializing the whole dict
+        if meta:
+            size += sys.getsizeof(meta)
+            item_count = len(meta)
+            for key in _ID_MAP_KEYS:
+                id_map = meta.get(key)
+                if isinstance(id_map, dict):
+                    size += sys.getsizeof(id_map) + len(id_map) * 128  # key, value and slot per entry
+                    item_count -= 1
+            sample = [
+                _shallow_item_size(value)
+                for key, value in itertools.islice(meta.items(), _META_SIZE_SAMPLE + len(_ID_MAP_KEYS))
+                if key not in _ID_MAP_KEYS
+            ][:_META_SIZE_SAMPLE]
+            if sample:
+                size += sum(sample) * item_count // len(sample)
         
         return size
     
     def _get_total_cache_size(self) -> int:
         """Get the total size of all cached items."""
-        return sum(self.cache_sizes.values())
+        return sum(entry.size for entry in self.cache.values())
     
     def _check_and_evict(self):
         """Check memory usage and evict entries if necessary."""
@@ -137,10 +211,10 @@ class MemoryBoundedIndexManager:
             current_time = time.time()
             
             # Check for TTL expiration
-            expired_keys = []
-            for key, load_time in self.load_times.items():
-                if current_time - load_time > self.ttl_seconds:
-                    expired_keys.append(key)
+            expired_keys = [
+                key for key, entry in self.cache.items()
+                if current_time - entry.load_time > self.ttl_seconds
+            ]
             
             # Evict expired entries
             for key in expired_keys:
@@ -157,85 +231,94 @@ class MemoryBoundedIndexManager:
             if total_size > self.max_memory_mb * 1024 * 1024:
                 # Need to evict based on LRU
                 self._evict_lru(total_size)
-            
-            # Force garbage collection if memory usage is high
-            process = psutil.Process()
-            memory_info = process.memory_info()
-            if memory_info.rss > self.max_memory_mb * 2 * 1024 * 1024:
-                gc.collect()
+                
+                # Force garbage collection if memory usage is high; the RSS
+                # query is skipped entirely while the cache is under its limit
+                if self._proc.memory_info().rss > self.max_memory_mb * 2 * 1024 * 1024:
+                    gc.collect()
     
     def _evict_lru(self, current_size: int):
         """Evict least recently used entries until under memory limit."""
         target_size = int(self.max_memory_mb * 0.8 * 1024 * 1024)  # Target 80% of limit
         
-        # Sort by access time (oldest first)
-        sorted_keys = sorted(
-            self.access_times.keys(),
-            key=lambda k: self.access_times[k]
-        )
-        
-        for key in sorted_keys:
-            if current_size <= target_size:
-                break
-            
-            size = self.cache_sizes.get(key, 0)
-            self._evict_entry(key, reason="Memory limit")
-            current_size -= size
+        # The cache is kept in access order, so the oldest entries come first
+        while self.cache and current_size > target_size:
+            key, entry = self.cache.popitem(last=False)
+            self._drop_snapshot(key)
+            current_size -= entry.size
+            self.stats['evictions'] += 1
+            logging.info(f"Evicted cache entry '{key}': Memory limit")
     
     def _evict_entry(self, key: str, reason: str = "Unknown"):
         """Evict a single cache entry."""
-        if key in self.cache:
-            # Clear the cache entry
-            del self.cache[key]
-            
-            # Clear metadata
-            if key in self.access_times:
-                del self.access_times[key]
-            if key in self.load_times:
-                del self.load_times[key]
-            if key in self.cache_sizes:
-                del self.cache_sizes[key]
-            
+        if self.cache.pop(key, None) is not None:
+            self._drop_snapshot(key)
             self.stats['evictions'] += 1
             logging.info(f"Evicted cache entry '{key}': {reason}")
     
-    def get_index_and_meta(self, force_reload: bool = False) -> Tuple[Any, dict]:
+    def _drop_snapshot(self, key: str):
+        """Stop serving an entry lock-free once it leaves the cache."""
+        snapshot = self._snapshot
+        if snapshot is not None and snapshot.key == key:
+            self._snapshot = None
+    
+    def _fresh_snapshot(self, cache_key: str) -> Optional[Snapshot]:
+        """Return the snapshot if it is for cache_key and was checked recently."""
+        snapshot = self._snapshot
+        if (snapshot is not None and snapshot.key == cache_key
+                and time.time() - snapshot.checked_at < _MTIME_CHECK_INTERVAL):
+            return snapshot
+        return None
+    
+    def get_index_and_meta(self, force_reload: bool = False, check_disk: bool = False) -> Tuple[Any, dict]:
         """
         Get the FAISS index and metadata with memory-bounded caching.
         
+        Hits on the most recently used entry within a second of its last
+        on-disk check are served from an immutable snapshot without taking
+        the lock; everything else (stat, reload, eviction) runs under it.
+        
         Args:
             force_reload: If True, force reload even if cached
+            check_disk: If True, skip the snapshot and compare the files'
+                mtime with the cached entry's; writers need this, since
+                another process may have committed within the last second
             
         Returns:
             Tuple of (index, meta)
         """
+        # Import required functions
+        load_cfg, get_index_path, get_meta_path, _load_index_internal, ROOT = get_memory_utils_functions()
+        
+        cfg = load_cfg()
+        index_path = get_index_path(cfg)
+        meta_path = get_meta_path(cfg)
+        
+        # Create cache key
+        cache_key = f"{index_path}:{meta_path}"
+        
+        if not force_reload and not check_disk:
+            snapshot = self._fresh_snapshot(cache_key)
+            if snapshot is not None:
+                # Unlocked increment: the hit count may undercount under contention
+                self.stats['hits'] += 1
+                return snapshot.index, snapshot.meta
+        
         with self._lock:
-            # Import required functions
-            load_cfg, get_index_path, get_meta_path, _load_index_internal, ROOT = get_memory_utils_functions()
-            
-            cfg = load_cfg()
-            index_path = get_index_path(cfg)
-            meta_path = get_meta_path(cfg)
-            
-            # Create cache key
-            cache_key = f"{index_path}:{meta_path}"
-            
             # Check if we need to reload
             need_reload = force_reload
+            current_mtime = None
             
             if not need_reload and cache_key in self.cache:
+                # Another thread may have just re-checked the files
+                snapshot = None if check_disk else self._fresh_snapshot(cache_key)
+                if snapshot is not None:
+                    self.stats['hits'] += 1
+                    return snapshot.index, snapshot.meta
+                
                 # Check if files have been modified
-                try:
-                    cached_entry = self.cache[cache_key]
-                    cached_mtime = cached_entry[2].get('mtime', 0)
-                    
-                    current_index_mtime = index_path.stat().st_mtime if index_path.exists() else 0
-                    current_meta_mtime = meta_path.stat().st_mtime if meta_path.exists() else 0
-                    current_mtime = max(current_index_mtime, current_meta_mtime)
-                    
-                    if current_mtime > cached_mtime:
-                        need_reload = True
-                except Exception:
+                current_mtime = max(_stat_mtime(index_path), _stat_mtime(meta_path))
+                if current_mtime != self.cache[cache_key].mtime:
                     need_reload = True
             else:
                 need_reload = True
@@ -246,30 +329,31 @@ class MemoryBoundedIndexManager:
                 logging.info(f"Loading FAISS index and metadata from disk (load #{self.stats['loads']})")
                 
                 try:
-                    index, meta = _load_index_internal()
+                    # Stat before loading so a write racing the load is picked up next time
+                    if current_mtime is None:
+                        current_mtime = max(_stat_mtime(index_path), _stat_mtime(meta_path))
+                    
+                    # Decide on mapping here, so the size estimate matches how the index was read
+                    mmap_backed = _use_index_mmap(cfg)
+                    index, meta = _load_index_internal(use_mmap=mmap_backed)
                     
                     # Calculate metadata
                     current_time = time.time()
-                    current_index_mtime = index_path.stat().st_mtime if index_path.exists() else 0
-                    current_meta_mtime = meta_path.stat().st_mtime if meta_path.exists() else 0
-                    current_mtime = max(current_index_mtime, current_meta_mtime)
-                    
-                    metadata = {
-                        'mtime': current_mtime,
-                        'load_time': current_time
-                    }
                     
                     # Estimate size
-                    size = self._estimate_size(index, meta)
+                    size = self._estimate_size(index, meta, mmap_backed=mmap_backed)
                     
-                    # Store in cache
-                    self.cache[cache_key] = (index, meta, metadata)
-                    self.access_times[cache_key] = current_time
-                    self.load_times[cache_key] = current_time
-                    self.cache_sizes[cache_key] = size
+                    # Store in cache as the most recently used entry
+                    self.cache[cache_key] = CacheEntry(index, meta, current_mtime, current_time, size)
+                    self.cache.move_to_end(cache_key)
+                    self._snapshot = Snapshot(cache_key, index, meta, current_time)
                     
-                    # Check if we need immediate eviction
-                    self._check_and_evict()
+                    # Enforce the memory limit right away; TTL expiry and the
+                    # process-level checks are left to the background thread
+                    total_size = self._get_total_cache_size()
+                    self.stats['peak_memory_bytes'] = max(self.stats['peak_memory_bytes'], total_size)
+                    if total_size > self.max_memory_mb * 1024 * 1024:
+                        self._evict_lru(total_size)
                     
                     return index, meta
                     
@@ -279,12 +363,47 @@ class MemoryBoundedIndexManager:
             else:
                 # Use cached version
                 self.stats['hits'] += 1
-                self.access_times[cache_key] = time.time()
+                self.cache.move_to_end(cache_key)
                 
                 cached_entry = self.cache[cache_key]
+                self._snapshot = Snapshot(cache_key, cached_entry.index, cached_entry.meta, time.time())
                 logging.debug(f"Using cached FAISS index and metadata (hit #{self.stats['hits']})")
                 
-                return cached_entry[0], cached_entry[1]
+                return cached_entry.index, cached_entry.meta
+    
+    def put(self, index: Any, meta: dict):
+        """
+        Cache an index and metadata that were just written to disk.
+        
+        The entry takes the files' current mtime, so the next
+        get_index_and_meta() serves these objects instead of re-reading
+        the files it just wrote; later writes by others still reload.
+        
+        Args:
+            index: FAISS index as saved
+            meta: Metadata dictionary as saved
+        """
+        load_cfg, get_index_path, get_meta_path, _, _ = get_memory_utils_functions()
+        
+        cfg = load_cfg()
+        index_path = get_index_path(cfg)
+        meta_path = get_meta_path(cfg)
+        cache_key = f"{index_path}:{meta_path}"
+        
+        with self._lock:
+            current_mtime = max(_stat_mtime(index_path), _stat_mtime(meta_path))
+            current_time = time.time()
+            # Writers hand over their private in-RAM copy, which is never mapped
+            size = self._estimate_size(index, meta)
+            
+            self.cache[cache_key] = CacheEntry(index, meta, current_mtime, current_time, size)
+            self.cache.move_to_end(cache_key)
+            self._snapshot = Snapshot(cache_key, index, meta, current_time)
+            
+            total_size = self._get_total_cache_size()
+            self.stats['peak_memory_bytes'] = max(self.stats['peak_memory_bytes'], total_size)
+            if total_size > self.max_memory_mb * 1024 * 1024:
+                self._evict_lru(total_size)
     
     def invalidate(self, specific_path: Optional[str] = None):
         """
@@ -305,9 +424,7 @@ class MemoryBoundedIndexManager:
             else:
                 # Clear all cache
                 self.cache.clear()
-                self.access_times.clear()
-                self.load_times.clear()
-                self.cache_sizes.clear()
+                self._snapshot = None
                 logging.info("All cached indices invalidated")
     
     def get_stats(self) -> Dict[str, Any]:
@@ -354,9 +471,9 @@ _memory_bounded_index_manager = MemoryBoundedIndexManager()
 
 
 # Wrapper functions for compatibility
-def get_index_and_meta(force_reload: bool = False) -> Tuple[Any, dict]:
+def get_index_and_meta(force_reload: bool = False, check_disk: bool = False) -> Tuple[Any, dict]:
     """Get the FAISS index and metadata using memory-bounded caching."""
-    return _memory_bounded_index_manager.get_index_and_meta(force_reload)
+    return _memory_bounded_index_manager.get_index_and_meta(force_reload, check_disk)
 
 
 def invalidate_cache(specific_path: Optional[str] = None):
@@ -6,23 +6,49 @@ from __future__ import annotations
 import os
 import json
 import pathlib
+import contextlib
 import functools
+import hashlib
+import importlib
 import logging
 import typing as _t
 import threading
 import time
 
 import numpy as np
-import faiss
-from sentence_transformers import SentenceTransformer
 import tomli
 import yaml
 
+try:
+    import orjson
+except ImportError:  # Optional speed-up; the standard json module is used otherwise
+    orjson = None
+
 # ───────────────────────────────────────── Logging Setup ────
 # Basic logging for library functions, application scripts can set their own handlers/format.
 # logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(module)s - %(message)s')
 # Decided to let executable scripts set their own basicConfig.
 
+# ───────────────────────────────────────── Lazy Imports ────
+class _LazyModule:
+    """Stand-in for a heavy module, imported on first attribute access.
+    
+    faiss and sentence_transformers pull in PyTorch, MKL and GPU probing at
+    import time; scripts that only read the config never pay for that."""
+    
+    def __init__(self, name: str):
+        self._name = name
+        self._module = None
+    
+    def __getattr__(self, attr: str):
+        if self._module is None:
+            # import_module serializes concurrent first imports on the import lock
+            self._module = importlib.import_module(self._name)
+        return getattr(self._module, attr)
+
+faiss = _LazyModule("faiss")
+sentence_transformers = _LazyModule("sentence_transformers")
+
 # ───────────────────────────────────────── Constants & Config ────
 ROOT = pathlib.Path(__file__).resolve().parents[1]
 CFG_PATH = ROOT / "memory.toml"
@@ -82,6 +108,22 @@ DEFAULT_CFG = {
 
 DEFAULT_BOOTSTRAP_CFG_STRUCTURE = DEFAULT_CFG.copy()
 
+# (cfg, ROOT, (cursor base, vec dir)) for the config last resolved; holding cfg
+# keeps its id from being reused, and config dicts are never mutated
+_store_dirs_cache: tuple | None = None
+
+def _store_dirs(cfg: Dict[str, Any]) -> tuple[Path, Path]:
+    """The .cursor base path and vector store directory for cfg, joined once per config."""
+    global _store_dirs_cache
+    cached = _store_dirs_cache
+    if cached is not None and cached[0] is cfg and cached[1] == ROOT:
+        return cached[2]
+    cursor_rel_path = cfg.get("system", {}).get("cursor_output_dir_relative_to_memex_root", "..")
+    cursor_base = ROOT / cursor_rel_path
+    dirs = (cursor_base, cursor_base / ".cursor" / "vecstore")
+    _store_dirs_cache = (cfg, ROOT, dirs)
+    return dirs
+
 def get_cursor_output_base_path(cfg: Optional[Dict[str, Any]] = None) -> Path:
     """Get the base path for .cursor directory based on configuration.
     
@@ -93,8 +135,7 @@ def get_cursor_output_base_path(cfg: Optional[Dict[str, Any]] = None) -> Path:
     """
     if cfg is None:
         cfg = load_cfg()
-    cursor_rel_path = cfg.get("system", {}).get("cursor_output_dir_relative_to_memex_root", "..")
-    return ROOT / cursor_rel_path
+    return _store_dirs(cfg)[0]
 
 def get_vec_dir(cfg: Optional[Dict[str, Any]] = None) -> Path:
     """Get the vector store directory path based on configuration.
@@ -105,8 +146,9 @@ def get_vec_dir(cfg: Optional[Dict[str, Any]] = None) -> Path:
     Returns:
         Path to the vector store directory (.cursor/vecstore).
     """
-    cursor_base = get_cursor_output_base_path(cfg)
-    return cursor_base / ".cursor" / "vecstore"
+    if cfg is None:
+        cfg = load_cfg()
+    return _store_dirs(cfg)[1]
 
 def get_index_path(cfg: Optional[Dict[str, Any]] = None) -> Path:
     """Get the FAISS index file path based on configuration.
@@ -145,13 +187,23 @@ def get_tasks_file_path(cfg=None):
     # Return the absolute path
     return ROOT / tasks_file_rel_path
 
+@functools.lru_cache(maxsize=1)
+def _load_cfg_cached(cfg_path: str, mtime_ns: int, size: int) -> dict:
+    """Parse memory.toml; cached per (path, mtime, size) so edits are picked up."""
+    with open(cfg_path, "rb") as f:
+        return tomli.load(f)
+
 def load_cfg() -> dict:
-    if not CFG_PATH.exists():
+    """Load memory.toml, re-parsing it only when the file has changed.
+    
+    The returned dict is shared between callers and must not be mutated."""
+    try:
+        st = os.stat(CFG_PATH)
+    except OSError:
         logging.warning(f"Config file {CFG_PATH} not found, using default configuration.")
         return DEFAULT_CFG
     try:
-        with CFG_PATH.open("rb") as f:
-            return tomli.load(f)
+        return _load_cfg_cached(str(CFG_PATH), st.st_mtime_ns, st.st_size)
     except tomli.TOMLDecodeError as e:
         logging.error(f"Error parsing {CFG_PATH}: {e}. Using default configuration.")
         return DEFAULT_CFG
@@ -193,26 +245,45 @@ except ImportError:
             """Initialize the basic index manager"""
             self.index = None
             self.meta = None
+            # (index, meta) pair, replaced as a whole so lock-free readers never see a mix
+            self._cached = None
             self.last_load_time = 0
             self.load_count = 0
             self.hit_count = 0
             
-        def get_index_and_meta(self, force_reload=False):
-            """Get the FAISS index and metadata"""
+        def get_index_and_meta(self, force_reload=False, check_disk=False):
+            """Get the FAISS index and metadata; cache hits do not take the lock
+            
+            check_disk is accepted for compatibility; this fallback does not track file changes."""
+            cached = self._cached
+            if cached is not None and not force_reload:
+                # Unlocked increment: the hit count may undercount under contention
+                self.hit_count += 1
+                return cached
             with self._lock:
-                if self.index is None or self.meta is None or force_reload:
+                if self._cached is None or force_reload:
                     self.load_count += 1
                     self.index, self.meta = _load_index_internal()
+                    self._cached = (self.index, self.meta) if self.index is not None and self.meta is not None else None
                     self.last_load_time = time.time()
                     logging.info(f"FAISS index loaded (fallback mode, count: {self.load_count})")
                 else:
                     self.hit_count += 1
                 return self.index, self.meta
                 
+        def put(self, index, meta):
+            """Cache an index and metadata that were just written to disk"""
+            with self._lock:
+                self.index = index
+                self.meta = meta
+                self._cached = (index, meta)
+            
         def invalidate(self):
             """Invalidate the cached index and metadata"""
-            self.index = None
-            self.meta = None
+            with self._lock:
+                self._cached = None
+                self.index = None
+                self.meta = None
             logging.info("FAISS index cache invalidated (fallback mode)")
             
         def get_stats(self):
@@ -229,9 +300,9 @@ except ImportError:
 _index_manager = IndexManager()
 
 @functools.lru_cache
-def model() -> SentenceTransformer:
+def model() -> sentence_transformers.SentenceTransformer:
     try:
-        return SentenceTransformer(_MODEL_NAME)
+        return sentence_transformers.SentenceTransformer(_MODEL_NAME)
     except (OSError, ImportError, RuntimeError) as e:
         logging.error(f"Failed to load SentenceTransformer model '{_MODEL_NAME}': {e}")
         raise
@@ -239,7 +310,9 @@ def model() -> SentenceTransformer:
         logging.error(f"Unexpected error loading SentenceTransformer model '{_MODEL_NAME}': {e}")
         raise
 
+@functools.lru_cache(maxsize=1)
 def vec_dim() -> int:
+    """Embedding dimension of the model, cached: it cannot change within a process."""
     try:
         return model().get_sentence_embedding_dimension()
     except (AttributeError, RuntimeError) as e:
@@ -249,15 +322,258 @@ def vec_dim() -> int:
         logging.error(f"Unexpected error getting vector dimension from model: {e}")
         raise
 
+# Texts whose embeddings embed() keeps (queries, task and snippet texts repeat often)
+_EMBED_CACHE_SIZE = 10_000
+
+@functools.lru_cache(maxsize=_EMBED_CACHE_SIZE)
 def embed(text: str) -> np.ndarray:
+    """Embed text as a normalized float32 vector.
+    
+    Results are LRU-cached per text (embed.cache_clear() empties the cache),
+    so the returned array is shared and read-only; copy it to modify it."""
     try:
-        return model().encode(text, normalize_embeddings=True).astype("float32")
+        vector = model().encode(text, normalize_embeddings=True, convert_to_numpy=True, show_progress_bar=False)
+        # FAISS needs C-contiguous float32; no copy when the model already returns that
+        vector = np.ascontiguousarray(vector, dtype="float32")
+        vector.setflags(write=False)
+        return vector
     except Exception as e:
         logging.error(f"Failed to embed text: {e}")
         # Return a zero vector of appropriate dimension or raise error
         # Returning zero vector might lead to silent failures in search
         raise # Or return np.zeros(vec_dim(), dtype="float32") if that's preferred
 
+# Number of texts the model encodes per forward pass in embed_batch
+_EMBED_BATCH_SIZE = 64
+
+def embed_batch(texts: list[str], batch_size: int = _EMBED_BATCH_SIZE) -> np.ndarray:
+    """Embed several texts with one model call, batch_size texts per forward pass.
+
+    Duplicate texts (license headers, boilerplate chunks) are encoded once and
+    their row is repeated in the result.
+
+    Returns:
+        A C-contiguous (len(texts), dim) float32 matrix of normalized embeddings.
+    """
+    texts = list(texts)
+    if not texts:
+        return np.zeros((0, vec_dim()), dtype="float32")
+    # Map each text to the row of its first occurrence
+    unique_rows: dict[str, int] = {}
+    row_of = [unique_rows.setdefault(text, len(unique_rows)) for text in texts]
+    try:
+        vectors = model().encode(list(unique_rows), batch_size=batch_size, normalize_embeddings=True,
+                                 convert_to_numpy=True, show_progress_bar=False)
+        vectors = np.ascontiguousarray(vectors, dtype="float32")
+        if len(unique_rows) == len(texts):
+            return vectors
+        return vectors[np.asarray(row_of, dtype="int64")]
+    except Exception as e:
+        logging.error(f"Failed to embed batch of {len(texts)} texts: {e}")
+        raise
+
+def _json_loads(data: bytes) -> _t.Any:
+    """Parse metadata JSON, using orjson when it is installed."""
+    if orjson is not None:
+        return orjson.loads(data)
+    return json.loads(data.decode("utf-8"))
+
+def _json_default(obj: _t.Any) -> _t.Any:
+    """json.dumps fallback for the NumPy values orjson serializes natively."""
+    if isinstance(obj, (np.generic, np.ndarray)):
+        return obj.tolist()
+    raise TypeError(f"Object of type {type(obj).__name__} is not JSON serializable")
+
+def _json_dumps(obj: _t.Any) -> bytes:
+    """Serialize metadata to compact UTF-8 JSON, using orjson when it is installed.
+    
+    Non-string keys (e.g. the integer keys of the reverse ID map) are written
+    as strings, as json.dumps does. NumPy scalars and arrays (e.g. int64 IDs
+    or scores in item metadata) are written as plain numbers and lists."""
+    if orjson is not None:
+        return orjson.dumps(obj, option=orjson.OPT_NON_STR_KEYS | orjson.OPT_SERIALIZE_NUMPY)
+    return json.dumps(obj, ensure_ascii=False, separators=(",", ":"), default=_json_default).encode("utf-8")
+
+def _replace_file(path: pathlib.Path, write: _t.Callable[[pathlib.Path], None]) -> None:
+    """Write a file via write(tmp_path) and rename it over path in one step.
+    
+    Other processes never see a half-written file, and readers that have
+    the old file memory-mapped keep a consistent view of it."""
+    tmp_path = path.with_name(path.name + ".tmp")
+    try:
+        write(tmp_path)
+        os.replace(tmp_path, path)
+    except BaseException:
+        tmp_path.unlink(missing_ok=True)
+        raise
+
+# FAISS index_factory description of the default (and fallback) flat index
+_DEFAULT_INDEX_FACTORY = "Flat"
+
+# index_factory descriptions for the vector_store.precision shorthand
+_PRECISION_INDEX_FACTORIES = {"fp32": "Flat", "fp16": "SQfp16", "int8": "SQ8"}
+
+# What vector_store.index_factory = "auto" stands for, per precision: exact search
+# while the store is small, then 256 inverted lists once it reaches ~10k vectors (39 * 256)
+_AUTO_INDEX_FACTORIES = {"fp32": "IVF256,Flat", "fp16": "IVF256,SQfp16", "int8": "IVF256,SQ8"}
+
+# IVF indexes are trained once the store holds this many vectors per inverted list,
+# the minimum faiss k-means asks for (vector_store.train_size overrides it)
+_IVF_TRAIN_POINTS_PER_LIST = 39
+
+# Vectors a trained scalar quantizer (e.g. "SQ8") is trained on, unless
+# vector_store.train_size overrides it; training only finds each component's range
+_SQ_TRAIN_SIZE = 2048
+
+# Inverted lists scanned per query when vector_store.nprobe is not set
+_DEFAULT_NPROBE = 8
+
+def _configured_index_factory(cfg: Dict[str, Any]) -> str:
+    """The faiss.index_factory description chosen by the vector_store settings."""
+    store_cfg = cfg.get("vector_store", {})
+    description = store_cfg.get("index_factory")
+    if description is None or description == "auto":
+        factories = _AUTO_INDEX_FACTORIES if description == "auto" else _PRECISION_INDEX_FACTORIES
+        precision = store_cfg.get("precision", "fp32")
+        description = factories.get(precision)
+        if description is None:
+            logging.error(f"Unknown vector_store.precision '{precision}'; expected one of "
+                          f"{', '.join(factories)}. Using fp32.")
+            description = factories["fp32"]
+    return description
+
+def _ivf_of(index: faiss.Index):
+    """The IndexIVF inside index (e.g. behind an IndexIDMap), or None if it has none."""
+    if not isinstance(index, faiss.Index):
+        return None  # SWIG would chase .this on arbitrary objects (e.g. mocks) indefinitely
+    try:
+        return faiss.extract_index_ivf(index)
+    except (RuntimeError, TypeError):
+        return None
+
+def _is_scalar_quantizer(index: faiss.Index) -> bool:
+    """Whether index is a (non-IVF) scalar quantizer index such as "SQ8"."""
+    return isinstance(faiss.downcast_index(index), faiss.IndexScalarQuantizer)
+
+def _create_index(dim: int, cfg: Dict[str, Any]) -> faiss.Index:
+    """Create an empty ID-mapped FAISS index for the vector store.
+    
+    The inner index comes from ``vector_store.index_factory`` in memory.toml
+    (a faiss.index_factory description such as "SQfp16"), or else from
+    ``vector_store.precision`` ("fp32"; "fp16", which stores each vector
+    component as a 16-bit float and halves memory; or "int8", a quarter).
+    The store starts empty and is updated in place, so the index must
+    support remove_ids; otherwise (e.g. "HNSW32") a flat index is used
+    instead. Descriptions that need training, IVF ones such as
+    "IVF1024,PQ32" or "IVF4096_HNSW32,Flat" (HNSW as the coarse quantizer)
+    and scalar quantizers such as "SQ8", start flat: _train_index_if_due()
+    converts the store once it holds enough vectors to train on.
+    
+    Embeddings are normalized, so the index ranks by inner product, which
+    orders results exactly like L2 distance with less work per vector."""
+    description = _configured_index_factory(cfg)
+    if description != _DEFAULT_INDEX_FACTORY:
+        try:
+            base_index = faiss.index_factory(dim, description, faiss.METRIC_INNER_PRODUCT)
+            if not base_index.is_trained:
+                if _ivf_of(base_index) is None and not _is_scalar_quantizer(base_index):
+                    raise ValueError("index needs training before vectors can be added")
+                logging.info(f"Vector store starts as a flat index and switches to '{description}' "
+                             f"once it holds enough vectors to train on.")
+            else:
+                id_mapped_index = faiss.IndexIDMap(base_index)
+                id_mapped_index.remove_ids(np.array([], dtype="int64"))  # Raises if removal is unsupported
+                return id_mapped_index
+        except Exception as e:
+            logging.error(f"Cannot use FAISS index '{description}' for the vector store ({e}); "
+                          f"falling back to '{_DEFAULT_INDEX_FACTORY}'.")
+    # Create an IndexFlatIP index and wrap it with IndexIDMap
+    base_index = faiss.IndexFlatIP(dim)
+    return faiss.IndexIDMap(base_index)
+
+def _apply_search_params(index: faiss.Index, cfg: Dict[str, Any]) -> None:
+    """Set nprobe (``vector_store.nprobe``) on IVF indexes; other indexes are left alone."""
+    ivf = _ivf_of(index)
+    if ivf is not None:
+        ivf.nprobe = int(cfg.get("vector_store", {}).get("nprobe", _DEFAULT_NPROBE))
+
+def _train_index_if_due(index: faiss.Index, cfg: Dict[str, Any]) -> faiss.Index:
+    """Convert a flat store to the configured trained index once it is large enough to train.
+    
+    Returns the new IndexIDMap, holding the same vectors under the same IDs,
+    or index itself when no index needing training is configured, the store
+    was already converted, or it holds fewer than ``vector_store.train_size``
+    vectors (default: 39 per inverted list for IVF, _SQ_TRAIN_SIZE for a
+    scalar quantizer)."""
+    description = _configured_index_factory(cfg)
+    if (description == _DEFAULT_INDEX_FACTORY or not isinstance(index, faiss.IndexIDMap)
+            or _ivf_of(index) is not None or index.ntotal == 0):
+        return index
+    try:
+        trained_index = faiss.index_factory(index.d, description, faiss.METRIC_INNER_PRODUCT)
+    except Exception:
+        return index  # Already reported by _create_index
+    if trained_index.is_trained:
+        return index
+    ivf = _ivf_of(trained_index)
+    if ivf is not None:
+        default_train_size = _IVF_TRAIN_POINTS_PER_LIST * ivf.nlist
+    elif _is_scalar_quantizer(trained_index) and isinstance(faiss.downcast_index(index.index), faiss.IndexFlat):
+        default_train_size = _SQ_TRAIN_SIZE
+    else:
+        return index
+    
+    train_size = int(cfg.get("vector_store", {}).get("train_size", default_train_size))
+    if index.ntotal < train_size:
+        return index
+    
+    logging.info(f"Training FAISS index '{description}' on {index.ntotal} vectors.")
+    vectors = index.index.reconstruct_n(0, index.ntotal)
+    ids = faiss.vector_to_array(index.id_map)
+    trained_index.train(vectors)
+    id_mapped_index = faiss.IndexIDMap(trained_index)
+    id_mapped_index.add_with_ids(vectors, ids)
+    _apply_search_params(id_mapped_index, cfg)
+    return id_mapped_index
+
+def _uses_inner_product(index: faiss.Index) -> bool:
+    """Whether FAISS search results from index are inner products rather than squared L2 distances."""
+    return getattr(index, "metric_type", faiss.METRIC_L2) == faiss.METRIC_INNER_PRODUCT
+
+def _is_flat_l2_store(index: faiss.Index) -> bool:
+    """Whether index is an older IndexIDMap over IndexFlatL2, whose vectors can be re-added as-is."""
+    return (isinstance(index, faiss.IndexIDMap) and not _uses_inner_product(index)
+            and isinstance(faiss.downcast_index(index.index), faiss.IndexFlatL2))
+
+def _migrate_l2_index(index: faiss.Index, cfg: Dict[str, Any]) -> faiss.Index:
+    """Move an older flat L2 store to the inner-product index new stores get.
+    
+    Embeddings are normalized, so ranking is unchanged and searches return
+    cosine similarities directly. Returns index itself for any other index."""
+    if not _is_flat_l2_store(index):
+        return index
+    logging.info(f"Converting the FAISS index from L2 distance to inner product ({index.ntotal} vectors).")
+    migrated = _create_index(index.d, cfg)
+    if index.ntotal:
+        migrated.add_with_ids(index.index.reconstruct_n(0, index.ntotal), faiss.vector_to_array(index.id_map))
+    return migrated
+
+# Set once the "index still uses L2" warning has been logged
+_l2_index_warned = False
+
+def _warn_if_l2_index(index: faiss.Index) -> None:
+    """Log a one-time warning when an existing store was created with the older L2 metric."""
+    global _l2_index_warned
+    if _l2_index_warned or _uses_inner_product(index):
+        return
+    _l2_index_warned = True
+    if _is_flat_l2_store(index):
+        logging.warning("The FAISS index uses L2 distance; it is converted to inner product, which is faster "
+                        "for normalized embeddings and ranks identically, the next time the store is saved.")
+    else:
+        logging.warning("The FAISS index uses L2 distance; new stores use inner product, which is faster "
+                        "for normalized embeddings and ranks identically. Rebuild the vector store to switch.")
+
 def _ensure_store():
     try:
         cfg = load_cfg()
@@ -266,60 +582,149 @@ def _ensure_store():
         meta_path = get_meta_path(cfg)
         
         vec_dir.mkdir(parents=True, exist_ok=True)
-        current_dim = vec_dim()
         if not index_path.exists():
+            current_dim = vec_dim()
             logging.info(f"FAISS index not found at {index_path}. Creating new index with dim {current_dim}.")
-            # Create an IndexFlatL2 index and wrap it with IndexIDMap
-            base_index = faiss.IndexFlatL2(current_dim)
-            id_mapped_index = faiss.IndexIDMap(base_index)
-            faiss.write_index(id_mapped_index, str(index_path))
+            id_mapped_index = _create_index(current_dim, cfg)
+            _replace_file(index_path, lambda tmp_path: faiss.write_index(id_mapped_index, str(tmp_path)))
             
             # When creating a new index, also ensure metadata is fresh and has the map
             if meta_path.exists():
                 try:
                     # Attempt to load existing meta to preserve other data if any
-                    meta = json.loads(meta_path.read_text(encoding="utf-8"))
-                except json.JSONDecodeError:
+                    meta = _json_loads(meta_path.read_bytes())
+                except ValueError:
                     meta = {} # Corrupted or empty, start fresh
             else: # This else corresponds to `if META_PATH.exists()`
                 meta = {}
             # These operations are for the new index case, after meta is initialized
             meta["_custom_to_faiss_id_map_"] = meta.get("_custom_to_faiss_id_map_", {})
-            meta_path.write_text(json.dumps(meta, ensure_ascii=False, indent=2), encoding="utf-8")
+            meta_data = _json_dumps(meta)
+            _replace_file(meta_path, lambda tmp_path: tmp_path.write_bytes(meta_data))
 
         elif not meta_path.exists(): # Index exists, but no metadata
             logging.info(f"Metadata file not found at {meta_path} but index exists. Creating empty metadata with ID map.")
-            meta = {"_custom_to_faiss_id_map_": {}}
-            meta_path.write_text(json.dumps(meta, ensure_ascii=False, indent=2), encoding="utf-8")
-        else: # Both exist, check index dimension and ensure map in metadata during load_index
-            try:
-                temp_index = faiss.read_index(str(index_path))
-                if temp_index.d != current_dim:
-                    logging.warning(
-                        f"Existing FAISS index dimension ({temp_index.d}) "
-                        f"differs from model dimension ({current_dim}). "
-                        f"Consider re-initializing the store if model changed."
-                    )
-            except Exception as e:
-                logging.warning(f"Could not verify dimension of existing FAISS index: {e}")
-            # Ensure map exists in metadata - this will be handled by load_index robustly
+            meta_data = _json_dumps({"_custom_to_faiss_id_map_": {}})
+            _replace_file(meta_path, lambda tmp_path: tmp_path.write_bytes(meta_data))
+        # When both exist, load_index checks the index dimension and the map in metadata
 
     except Exception as e:
         logging.error(f"Failed to ensure vector store directories/files: {e}")
         raise
 
-def _load_index_internal() -> tuple[faiss.Index | None, dict]:
+# With vector_store.mmap = "auto", index files at least this large are memory-mapped
+_MMAP_AUTO_MIN_BYTES = 256 * 1024 * 1024
+
+def _use_index_mmap(cfg: Optional[Dict[str, Any]] = None) -> bool:
+    """Whether the FAISS index should be memory-mapped (``vector_store.mmap`` in memory.toml).
+    
+    "auto" maps the index only once its file reaches _MMAP_AUTO_MIN_BYTES,
+    where reading it fully would be slow and costly in RAM."""
+    if cfg is None:
+        cfg = load_cfg()
+    setting = cfg.get("vector_store", {}).get("mmap", False)
+    if setting == "auto":
+        try:
+            return get_index_path(cfg).stat().st_size >= _MMAP_AUTO_MIN_BYTES
+        except OSError:
+            return False
+    return bool(setting)
+
+# Bookkeeping entries in metadata.json that are not stored items
+_RESERVED_META_KEYS = frozenset({"_custom_to_faiss_id_map_", "_faiss_id_to_custom_id_map_", "_next_faiss_id_"})
+
+def _normalize_id_map(custom_to_faiss_map: dict) -> dict:
+    """Return custom_to_faiss_map with every FAISS ID as a Python int.
+    
+    Done once when metadata is loaded, so writers can update the map in place
+    without re-coercing it; IDs that are not integers are kept as they are."""
+    try:
+        faiss_ids = np.fromiter(custom_to_faiss_map.values(), dtype=np.int64, count=len(custom_to_faiss_map))
+        return dict(zip(custom_to_faiss_map.keys(), faiss_ids.tolist()))
+    except (ValueError, TypeError, OverflowError):
+        pass
+    
+    normalized = {}
+    for custom_id, faiss_id_val in custom_to_faiss_map.items():
+        try:
+            normalized[custom_id] = int(faiss_id_val)
+        except (ValueError, TypeError):
+            normalized[custom_id] = faiss_id_val
+    return normalized
+
+def _build_reverse_id_map(custom_to_faiss_map: dict) -> dict[int, str]:
+    """Build the FAISS ID -> custom ID map from the custom ID -> FAISS ID map.
+    
+    Well-formed maps are converted in one pass through NumPy; entries whose
+    FAISS ID is not an integer are skipped with a warning."""
+    try:
+        faiss_ids = np.fromiter(custom_to_faiss_map.values(), dtype=np.int64, count=len(custom_to_faiss_map))
+        return dict(zip(faiss_ids.tolist(), custom_to_faiss_map.keys()))
+    except (ValueError, TypeError, OverflowError):
+        pass
+    
+    reverse_map = {}
+    for custom_id, faiss_id_val in custom_to_faiss_map.items():
+        try:
+            # Ensure faiss_id_val is a valid integer for the key of the reverse map
+            reverse_map[int(faiss_id_val)] = custom_id
+        except (ValueError, TypeError):
+            logging.warning(f"Skipping invalid FAISS ID '{faiss_id_val}' for custom ID '{custom_id}' during reverse map construction in load_index.")
+    return reverse_map
+
+# Set once the "index dimension differs from the model's" warning has been logged
+_dim_mismatch_warned = False
+
+def _warn_if_dim_mismatch(index: faiss.Index) -> None:
+    """Log a one-time warning when the index was built for a different embedding dimension."""
+    global _dim_mismatch_warned
+    if _dim_mismatch_warned:
+        return
+    try:
+        current_dim = vec_dim()
+    except Exception as e:
+        logging.warning(f"Could not verify dimension of existing FAISS index: {e}")
+        return
+    if index.d != current_dim:
+        _dim_mismatch_warned = True
+        logging.warning(
+            f"Existing FAISS index dimension ({index.d}) "
+            f"differs from model dimension ({current_dim}). "
+            f"Consider re-initializing the store if model changed."
+        )
+
+def _read_index_file(index_path: pathlib.Path, use_mmap: bool) -> faiss.Index:
+    """Read the FAISS index, memory-mapped read-only when use_mmap is set."""
+    if use_mmap:
+        io_flags = faiss.IO_FLAG_MMAP | faiss.IO_FLAG_READ_ONLY | getattr(faiss, "IO_FLAG_MMAP_IFC", 0)
+        return faiss.read_index(str(index_path), io_flags)
+    return faiss.read_index(str(index_path))
+
+def _load_index_internal(use_mmap: bool | None = None) -> tuple[faiss.Index | None, dict]:
     """Internal function that actually loads the index from disk.
-    This is used by the IndexManager and should not be called directly."""
+    This is used by the IndexManager and should not be called directly.
+    
+    With use_mmap (defaults to the ``vector_store.mmap`` setting) the index is
+    mapped read-only (faiss.IO_FLAG_MMAP | IO_FLAG_READ_ONLY, plus
+    IO_FLAG_MMAP_IFC for flat codes where faiss supports it), so pages are
+    read from disk on demand and shared between processes. Writers then load
+    their own mutable copy through _load_index_for_write()."""
     _ensure_store() # Ensures files exist
     try:
         cfg = load_cfg()
         index_path = get_index_path(cfg)
         meta_path = get_meta_path(cfg)
         
-        index = faiss.read_index(str(index_path))
-        meta_text = meta_path.read_text(encoding="utf-8")
-        meta = json.loads(meta_text)
+        if use_mmap is None:
+            use_mmap = _use_index_mmap(cfg)
+        index = _read_index_file(index_path, use_mmap)
+        _warn_if_l2_index(index)
+        _apply_search_params(index, cfg)
+        # Checking the dimension loads the model; vector_store.verify_dim = false
+        # lets read-only consumers (listing, health checks) skip that
+        if cfg.get("vector_store", {}).get("verify_dim", True):
+            _warn_if_dim_mismatch(index)
+        meta = _json_loads(meta_path.read_bytes())
         
         # Ensure the custom ID to FAISS ID map exists in the loaded metadata
         if "_custom_to_faiss_id_map_" not in meta:
@@ -329,15 +734,9 @@ def _load_index_internal() -> tuple[faiss.Index | None, dict]:
         # X.2.2: Ensure FAISS IDs in the custom_to_faiss_map are integers
         # And rebuild the _faiss_id_to_custom_id_map_ (reverse map)
         # This ensures the reverse map is always correct in memory after loading.
-        custom_to_faiss_map_loaded = meta.get("_custom_to_faiss_id_map_", {})
-        faiss_id_to_custom_id_map_rebuilt = {}
-        for custom_id, faiss_id_val in custom_to_faiss_map_loaded.items():
-            try:
-                # Ensure faiss_id_val is a valid integer for the key of the reverse map
-                faiss_id_int_key = int(faiss_id_val)
-                faiss_id_to_custom_id_map_rebuilt[faiss_id_int_key] = custom_id
-            except (ValueError, TypeError):
-                logging.warning(f"Skipping invalid FAISS ID '{faiss_id_val}' for custom ID '{custom_id}' during reverse map construction in load_index.")
+        custom_to_faiss_map_loaded = _normalize_id_map(meta["_custom_to_faiss_id_map_"])
+        meta["_custom_to_faiss_id_map_"] = custom_to_faiss_map_loaded
+        faiss_id_to_custom_id_map_rebuilt = _build_reverse_id_map(custom_to_faiss_map_loaded)
         
         # Store the rebuilt reverse map in meta
         meta["_faiss_id_to_custom_id_map_"] = faiss_id_to_custom_id_map_rebuilt
@@ -351,7 +750,8 @@ def _load_index_internal() -> tuple[faiss.Index | None, dict]:
         logging.error(f"Error decoding metadata.json: {e}. Returning empty metadata with ID map.")
         # Attempt to preserve the index if it's loadable
         try:
-            index = faiss.read_index(str(get_index_path()))
+            index = _read_index_file(get_index_path(), bool(use_mmap))
+            _apply_search_params(index, load_cfg())
         except Exception as index_e:
             logging.error(f"Failed to load FAISS index after metadata decode error: {index_e}")
             index = None
@@ -360,7 +760,7 @@ def _load_index_internal() -> tuple[faiss.Index | None, dict]:
         logging.error(f"Failed to load FAISS index or metadata: {e}")
         return None, {"_custom_to_faiss_id_map_": {}}
 
-def load_index(force_reload=False) -> tuple[faiss.Index | None, dict]:
+def load_index(force_reload=False, check_disk=False) -> tuple[faiss.Index | None, dict]:
     """Load the FAISS index and metadata.
     
     This function now uses the IndexManager to cache the index and prevent
@@ -368,26 +768,111 @@ def load_index(force_reload=False) -> tuple[faiss.Index | None, dict]:
     
     Args:
         force_reload: If True, force reloading the index even if cached
+        check_disk: If True, check the files on disk for changes even if
+            they were checked within the IndexManager's read throttle
         
     Returns:
         Tuple of (index, meta)
     """
-    return _index_manager.get_index_and_meta(force_reload=force_reload)
-
+    # Inside deferred_saves() the latest state may not be on disk yet
+    pending = _pending_save
+    if pending is not None:
+        return pending
+    return _index_manager.get_index_and_meta(force_reload=force_reload, check_disk=check_disk)
+
+def _load_index_for_write() -> tuple[faiss.Index | None, dict]:
+    """Load an index/metadata pair that may be modified in place and saved.
+    
+    The cached index is used unless it is memory-mapped read-only, in which
+    case a private in-RAM copy is read; save_index() then invalidates the
+    cached mapping. The cache is only used if the files are unchanged on
+    disk, so a write never starts from a state older than another process's
+    last commit."""
+    if _pending_save is None and _use_index_mmap():
+        return _load_index_internal(use_mmap=False)
+    return load_index(check_disk=True)
+
+
+# Nesting depth of deferred_saves() blocks, and the (index, meta) pair they
+# have saved but not yet written, which load_index serves meanwhile
+_deferred_save_depth = 0
+_pending_save: tuple | None = None
+_deferred_save_lock = threading.RLock()
+
+@contextlib.contextmanager
+def deferred_saves():
+    """Coalesce the store writes made inside the block into one write at its end.
+    
+    save_index() calls made in the block only record the latest index and
+    metadata, which load_index() then returns; the files are written once when
+    the outermost block exits (also on error, keeping the changes made so far).
+    Deferral is process-wide, so saves from other threads are coalesced too.
+    Use it around bursts of add_or_replace/delete_vector calls, e.g. ingestion::
+    
+        with deferred_saves():
+            for item_id, text, meta in items:
+                add_or_replace(item_id, text, meta)
+    """
+    global _deferred_save_depth
+    with _deferred_save_lock:
+        _deferred_save_depth += 1
+    try:
+        yield
+    finally:
+        with _deferred_save_lock:
+            _deferred_save_depth -= 1
+            if _deferred_save_depth == 0:
+                flush_index()
+
+def flush_index() -> bool:
+    """Write a save deferred by deferred_saves() now.
+    
+    If the write fails the changes stay pending, so load_index() keeps
+    serving them and a later flush_index() or save_index() retries it.
+    
+    Returns:
+        bool: True if there was nothing to write or the write succeeded
+    """
+    global _pending_save
+    with _deferred_save_lock:
+        pending = _pending_save
+        if pending is None:
+            return True
+        if not _write_index(*pending):
+            # The cached index and metadata were modified in place by the writers
+            _index_manager.invalidate()
+            return False
+        _pending_save = None
+        return True
 
 def save_index(index: faiss.Index, meta: dict):
     """Save FAISS index and metadata to disk.
     
-    This function also invalidates the IndexManager cache to ensure
-    the next load_index call gets the freshest data.
+    The saved index and metadata then replace the IndexManager's cached
+    copy, so the next load_index call does not re-read what was just
+    written. A memory-mapped index is re-mapped from the new file instead.
+    Inside deferred_saves() the write is postponed to the end of the block.
     
     Args:
         index: FAISS index to save
         meta: Metadata dictionary to save
         
     Returns:
-        bool: True if save was successful, False otherwise
+        bool: True if save was successful (or deferred), False otherwise
     """
+    global _pending_save
+    with _deferred_save_lock:
+        if _deferred_save_depth:
+            _pending_save = (index, meta)
+            return True
+        if _pending_save is not None:
+            # Supersedes a deferred save whose write failed
+            _pending_save = (index, meta)
+            return flush_index()
+    return _write_index(index, meta)
+
+def _write_index(index: faiss.Index, meta: dict) -> bool:
+    """Write index and metadata to disk and refresh the IndexManager's cache (see save_index)."""
     try:
         cfg = load_cfg()
         index_path = get_index_path(cfg)
@@ -397,31 +882,41 @@ def save_index(index: faiss.Index, meta: dict):
         vec_dir = get_vec_dir(cfg)
         vec_dir.mkdir(parents=True, exist_ok=True)
         
+        # Move older L2 stores to inner product, and switch to the configured
+        # IVF index once there is enough data to train it
+        index = _migrate_l2_index(index, cfg)
+        index = _train_index_if_due(index, cfg)
+        
         # Write FAISS index
-        faiss.write_index(index, str(index_path))
+        _replace_file(index_path, lambda tmp_path: faiss.write_index(index, str(tmp_path)))
         
         # X.2.3: BEGIN SANITIZATION FOR JSON SERIALIZATION
-        # Sanitize _custom_to_faiss_id_map_ to ensure FAISS IDs are Python int
-        sanitized_custom_to_faiss_map = {
-            custom_id: int(f_id)
-            for custom_id, f_id in meta.get("_custom_to_faiss_id_map_", {}).items()
-        }
-        meta["_custom_to_faiss_id_map_"] = sanitized_custom_to_faiss_map
-
-        # Rebuild _faiss_id_to_custom_id_map_ from the sanitized map
-        # This ensures its keys are also Python int - will be rebuilt on load, so no need to save
-        sanitized_faiss_to_custom_map = {
-            int(f_id): custom_id
-            for custom_id, f_id in sanitized_custom_to_faiss_map.items()
-        }
-        meta["_faiss_id_to_custom_id_map_"] = sanitized_faiss_to_custom_map
+        # The write paths keep both ID maps in sync with Python int FAISS IDs
+        # (load_index normalizes them), so they are only rebuilt for metadata
+        # whose reverse map is missing or out of step with the forward map
+        custom_to_faiss_map = meta.get("_custom_to_faiss_id_map_", {})
+        faiss_to_custom_map = meta.get("_faiss_id_to_custom_id_map_")
+        if faiss_to_custom_map is None or len(faiss_to_custom_map) != len(custom_to_faiss_map):
+            # Convert all FAISS IDs to Python int in one NumPy pass (raises on a non-integer ID)
+            sanitized_faiss_ids = np.fromiter(custom_to_faiss_map.values(), dtype=np.int64,
+                                              count=len(custom_to_faiss_map)).tolist()
+            meta["_custom_to_faiss_id_map_"] = dict(zip(custom_to_faiss_map.keys(), sanitized_faiss_ids))
+            # Kept in memory only, load rebuilds it
+            meta["_faiss_id_to_custom_id_map_"] = dict(zip(sanitized_faiss_ids, custom_to_faiss_map.keys()))
         # END SANITIZATION
 
-        # Write metadata
-        meta_path.write_text(json.dumps(meta, ensure_ascii=False, indent=2), encoding="utf-8")
+        # Write metadata (compact: this runs on every store update) without the
+        # redundant reverse map; meta itself is left intact for cached readers
+        meta_to_write = {k: v for k, v in meta.items() if k != "_faiss_id_to_custom_id_map_"}
+        meta_data = _json_dumps(meta_to_write)
+        _replace_file(meta_path, lambda tmp_path: tmp_path.write_bytes(meta_data))
         
-        # Invalidate the cache in IndexManager to ensure fresh data on next load
-        _index_manager.invalidate()
+        # Serve what was just written on the next load; with mmap the
+        # writer's private in-RAM copy is dropped and the new file re-mapped
+        if _use_index_mmap(cfg):
+            _index_manager.invalidate()
+        else:
+            _index_manager.put(index, meta)
         
         return True
     except Exception as e:
@@ -442,8 +937,9 @@ def check_vector_store_integrity() -> dict:
     2. Orphaned metadata: Metadata entries without corresponding FAISS ID mappings
     3. Missing metadata: FAISS IDs mapped to custom IDs that don't have metadata entries
     
-    For IndexIDMap indices, a sampling approach is used to efficiently check for missing vectors
-    by testing a representative sample of IDs rather than every ID.
+    For IndexIDMap indices the check is exact: the IDs stored in the index are read
+    once from its id_map and compared with the mapped IDs, which also finds vectors
+    that no custom ID maps to (orphaned vectors).
     
     Returns:
         dict: A summary of the integrity check with these keys:
@@ -523,17 +1019,29 @@ def check_vector_store_integrity() -> dict:
         custom_to_faiss_map = meta.get("_custom_to_faiss_id_map_", {})
         # Ensure FAISS IDs in map are integers for comparison; they should be from sanitization on save
         # but good for robustness during check if loaded from an older/unsanitized state.
-        custom_to_faiss_map = {k: int(v) for k, v in custom_to_faiss_map.items()}
+        # Converted once into an array that the set operations below reuse.
+        mapped_custom_ids = list(custom_to_faiss_map.keys())
+        mapped_faiss_ids = np.fromiter(custom_to_faiss_map.values(), dtype=np.int64,
+                                       count=len(mapped_custom_ids))
+        custom_to_faiss_map = dict(zip(mapped_custom_ids, mapped_faiss_ids.tolist()))
 
-        faiss_ids_in_map = set(custom_to_faiss_map.values())
         custom_ids_in_map = set(custom_to_faiss_map.keys())
         
-        result['summary']['mapped_vectors_count'] = len(custom_to_faiss_map)
-        result['summary']['faiss_index_size'] = index.ntotal
+        # Local aliases for the parts of the result updated per entry below
+        issues = result['issues']
+        summary = result['summary']
+        details = result['details']
+        
+        summary['mapped_vectors_count'] = len(custom_to_faiss_map)
+        summary['faiss_index_size'] = index.ntotal
         
         # Check metadata entries (excluding the map itself)
-        metadata_item_keys = {k for k in meta.keys() if k not in ["_custom_to_faiss_id_map_", "_faiss_id_to_custom_id_map_"]}
-        result['summary']['metadata_entries'] = len(metadata_item_keys)
+        metadata_item_keys = meta.keys() - _RESERVED_META_KEYS
+        summary['metadata_entries'] = len(metadata_item_keys)
+        
+        # Mismatches between metadata and the map, computed once with set algebra
+        orphaned_metadata_ids = metadata_item_keys - custom_ids_in_map
+        missing_metadata_ids = custom_ids_in_map - metadata_item_keys
 
         # 1. Check for FAISS IDs in map that are not in the actual FAISS index (Missing Vectors)
         #    This requires testing if the ID actually exists in the index
@@ -541,132 +1049,38 @@ def check_vector_store_integrity() -> dict:
             try:
                 # Approach for checking if FAISS IDs are actually in the index
                 if isinstance(index, faiss.IndexIDMap):
-                    # For IndexIDMap, we need to verify if mapped FAISS IDs actually exist in the index
-                    # We'll implement a more accurate approach using search and sample testing
-                    
-                    # Get all FAISS IDs from the map
-                    faiss_ids_to_check = list(faiss_ids_in_map)
-                    missing_vectors_count = 0
-                    verified_ids = set()
-                    
-                    # APPROACH 1: Sampling-based check
-                    # Test a sample of IDs to determine if they exist
-                    # This is more efficient than testing all IDs if there are many
-                    sample_size = min(100, len(faiss_ids_to_check))  # Limit sample size
+                    # The IDMap stores every external ID it holds; materialize them once
+                    # and compare them with the mapped IDs using NumPy set operations
+                    present_faiss_ids = faiss.vector_to_array(index.id_map).astype(np.int64, copy=False)
                     
-                    if sample_size > 0:
-                        # Get sample IDs
-                        import random
-                        sample_ids = random.sample(faiss_ids_to_check, sample_size)
-                        
-                        for faiss_id in sample_ids:
-                            # Get the custom ID for better error reporting
-                            custom_id = next((cid for cid, fid in custom_to_faiss_map.items() if int(fid) == faiss_id), None)
-                            
-                            # Try to verify if the ID exists using search with a dummy vector
-                            # This is more reliable than reconstruct which requires sequential IDs
-                            try:
-                                # Create a dummy query vector with the same dimension as the index
-                                dummy_vector = np.zeros((1, index.d), dtype="float32")
-                                
-                                # Search with the dummy vector and k=index.ntotal to get all vectors
-                                # This is inefficient but more reliable than reconstruct for IndexIDMap
-                                distances, found_ids = index.search(dummy_vector, index.ntotal)
-                                
-                                # Convert all found IDs to Python ints for comparison
-                                found_ids_set = set(int(id) for id in found_ids[0] if id != -1)
-                                
-                                # Check if our ID is among the found IDs
-                                if int(faiss_id) not in found_ids_set:
-                                    missing_vectors_count += 1
-                                    result['details']['missing_vectors'].append({
-                                        'custom_id': custom_id,
-                                        'faiss_id': int(faiss_id),
-                                        'found_by': 'search_sampling'
-                                    })
-                                else:
-                                    verified_ids.add(int(faiss_id))
-                            except Exception as e:
-                                logging.warning(f"Error checking FAISS ID {faiss_id} existence: {e}")
-                        
-                        # Calculate estimated missing percentage based on the sample
-                        if sample_size > 0:
-                            missing_pct = (missing_vectors_count / sample_size) * 100
-                            
-                            # Update the overall missing vectors count with an estimate
-                            if missing_pct > 0:
-                                # Estimate total missing vectors based on sample percentage
-                                estimated_missing = int((missing_pct / 100) * len(faiss_ids_to_check))
-                                result['summary']['missing_vectors'] = estimated_missing
-                                result['issues'].append(
-                                    f"Estimated {estimated_missing} vectors ({missing_pct:.1f}%) are missing from the FAISS index "
-                                    f"based on sampling {sample_size} of {len(faiss_ids_to_check)} mapped IDs."
-                                )
-                                # If significant percentage is missing, mark as error
-                                if missing_pct > 10:  # If more than 10% are missing, it's an error
-                                    result['status'] = 'error'
-                    
-                    # APPROACH 2: Direct existence check for each metadata entry
-                    # This approach checks each metadata entry's mapped FAISS ID
-                    # to determine if it's actually present in the index
+                    missing_positions = np.flatnonzero(~np.isin(mapped_faiss_ids, present_faiss_ids))
+                    missing = list(zip([mapped_custom_ids[pos] for pos in missing_positions.tolist()],
+                                       mapped_faiss_ids[missing_positions].tolist()))
+                    details['missing_vectors'].extend(
+                        {'custom_id': custom_id, 'faiss_id': faiss_id, 'found_by': 'id_map'}
+                        for custom_id, faiss_id in missing
+                    )
+                    summary['missing_vectors'] += len(missing)
+                    issues.extend(
+                        f"Custom ID '{custom_id}' is mapped to FAISS ID {faiss_id} which does not exist in the index."
+                        for custom_id, faiss_id in missing
+                    )
                     
-                    # For each metadata entry, check if its FAISS ID exists
-                    for custom_id in metadata_item_keys:
-                        if custom_id in custom_to_faiss_map:
-                            faiss_id = int(custom_to_faiss_map[custom_id])
-                            
-                            # Skip IDs we already verified in the sampling phase
-                            if faiss_id in verified_ids:
-                                continue
-                                
-                            # Try direct methods to check if ID exists
-                            exists = False
-                            
-                            # Method 1: Try to reconstruct the vector (may fail if ID is non-sequential)
-                            try:
-                                # For IndexIDMap, reconstruct() takes *internal* idx, not external ID
-                                # So this approach has limitations for IndexIDMap
-                                vector = index.reconstruct(faiss_id)
-                                exists = True
-                            except RuntimeError:
-                                # This error is expected if the ID doesn't exist
-                                # But it could also occur if the ID is valid but not sequential
-                                pass
-                            except Exception as e:
-                                logging.debug(f"Error during vector reconstruction for ID {faiss_id}: {e}")
-                            
-                            # If we couldn't verify existence, mark as potentially missing
-                            if not exists and faiss_id not in verified_ids:
-                                result['details']['missing_vectors'].append({
-                                    'custom_id': custom_id,
-                                    'faiss_id': faiss_id,
-                                    'found_by': 'direct_check'
-                                })
-                                result['summary']['missing_vectors'] += 1
-                                result['issues'].append(
-                                    f"Custom ID '{custom_id}' is mapped to FAISS ID {faiss_id} which may not exist in the index."
-                                )
-                                if result['status'] != 'error':
-                                    result['status'] = 'warning'
+                    orphaned_faiss_ids = np.setdiff1d(present_faiss_ids, mapped_faiss_ids)
+                    if orphaned_faiss_ids.size:
+                        summary['orphaned_vectors'] = int(orphaned_faiss_ids.size)
+                        details['orphaned_vectors'] = orphaned_faiss_ids.tolist()
                 
                 else: # Not an IndexIDMap (e.g., IndexFlatL2 directly)
                     # For standard indices, IDs are implicitly 0 to ntotal-1
-                    present_faiss_ids_in_index = set(range(index.ntotal))
-                    
-                    for custom_id in metadata_item_keys:
-                        if custom_id not in custom_ids_in_map:
-                            result['status'] = 'warning'
-                            result['issues'].append(f"Metadata for '{custom_id}' exists but no FAISS ID mapping.")
-                            result['summary']['orphaned_metadata_entries'] += 1
-                            result['details']['orphaned_metadata'].append(custom_id)
-                        else:
-                            # Has mapping, check if corresponding vector is in FAISS
-                            faiss_id = custom_to_faiss_map[custom_id]
-                            if faiss_id not in present_faiss_ids_in_index: # For non-IndexIDMap
-                                result['status'] = 'error' # Critical if mapped but not in index
-                                result['issues'].append(f"Vector for '{custom_id}' (FAISS ID {faiss_id}) is mapped but missing from FAISS index.")
-                                result['summary']['missing_vectors'] += 1
-                                result['details']['missing_vectors'].append(custom_id)
+                    for custom_id in sorted(metadata_item_keys & custom_ids_in_map):
+                        # Has metadata and mapping, check if corresponding vector is in FAISS
+                        faiss_id = custom_to_faiss_map[custom_id]
+                        if not 0 <= faiss_id < index.ntotal: # For non-IndexIDMap
+                            result['status'] = 'error' # Critical if mapped but not in index
+                            issues.append(f"Vector for '{custom_id}' (FAISS ID {faiss_id}) is mapped but missing from FAISS index.")
+                            summary['missing_vectors'] += 1
+                            details['missing_vectors'].append(custom_id)
                 
                 # Check for FAISS IDs in the map that are out of bounds for index.ntotal
                 # This applies more directly if we weren't using IndexIDMap, or if index.ntotal is the source of truth for max ID.
@@ -676,43 +1090,42 @@ def check_vector_store_integrity() -> dict:
 
             except Exception as e:
                 result['status'] = 'error'
-                result['issues'].append(f"Error during FAISS index analysis: {str(e)}")
-                result['details']['reconstruction_errors'].append(str(e))
+                issues.append(f"Error during FAISS index analysis: {str(e)}")
+                details['reconstruction_errors'].append(str(e))
         
-        # 2. Check for metadata entries that are not in the custom_to_faiss_map (Orphaned Metadata)
-        for custom_id in metadata_item_keys:
-            if custom_id not in custom_ids_in_map:
-                # This was partially covered above, but ensure it's caught if the FAISS analysis part was skipped/failed
-                if "Metadata for '{custom_id}' exists but no FAISS ID mapping." not in result['issues']:
-                    result['status'] = 'warning'
-                    result['issues'].append(f"Metadata for '{custom_id}' exists but no FAISS ID mapping.")
-                    result['summary']['orphaned_metadata_entries'] += 1
-                    result['details']['orphaned_metadata'].append(custom_id)
-
-        # 3. Check for custom_ids in the map that do not have corresponding metadata entries (Missing Metadata / Orphaned Map Entry)
-        for custom_id in custom_ids_in_map:
-            if custom_id not in metadata_item_keys:
-                # Check if metadata might exist under the FAISS ID key (old data format)
-                faiss_id_for_custom_entry = custom_to_faiss_map.get(custom_id)
-                if faiss_id_for_custom_entry is not None and str(faiss_id_for_custom_entry) in metadata_item_keys:
-                    result['status'] = 'error'  # This is a critical data format error
-                    result['issues'].append(
-                        f"CRITICAL MISMATCH: Metadata for custom ID '{custom_id}' is keyed by its FAISS ID '{str(faiss_id_for_custom_entry)}' instead of its custom ID. "
-                        "This indicates an old data format. Run migration script or re-index."
-                    )
-                    result['details'].setdefault('incorrectly_keyed_metadata', []).append({
-                        'custom_id': custom_id,
-                        'expected_key': custom_id,
-                        'found_key': str(faiss_id_for_custom_entry)
-                    })
-                    result['summary'].setdefault('incorrectly_keyed_items_count', 0)
-                    result['summary']['incorrectly_keyed_items_count'] += 1
-                else:
-                    # Original "Missing Metadata" issue
+        # 2. Metadata entries that are not in the custom_to_faiss_map (Orphaned Metadata)
+        orphaned_metadata = sorted(orphaned_metadata_ids)
+        if orphaned_metadata:
+            if result['status'] != 'error': # Don't downgrade from error to warning
+                result['status'] = 'warning'
+            issues.extend(f"Metadata for '{custom_id}' exists but no FAISS ID mapping." for custom_id in orphaned_metadata)
+            summary['orphaned_metadata_entries'] += len(orphaned_metadata)
+            details['orphaned_metadata'].extend(orphaned_metadata)
+
+        # 3. Custom IDs in the map that do not have corresponding metadata entries (Missing Metadata / Orphaned Map Entry)
+        for custom_id in sorted(missing_metadata_ids):
+            # Check if metadata might exist under the FAISS ID key (old data format)
+            faiss_id_for_custom_entry = custom_to_faiss_map.get(custom_id)
+            faiss_id_key = str(faiss_id_for_custom_entry) if faiss_id_for_custom_entry is not None else None
+            if faiss_id_key is not None and faiss_id_key in metadata_item_keys:
+                result['status'] = 'error'  # This is a critical data format error
+                issues.append(
+                    f"CRITICAL MISMATCH: Metadata for custom ID '{custom_id}' is keyed by its FAISS ID '{faiss_id_key}' instead of its custom ID. "
+                    "This indicates an old data format. Run migration script or re-index."
+                )
+                details.setdefault('incorrectly_keyed_metadata', []).append({
+                    'custom_id': custom_id,
+                    'expected_key': custom_id,
+                    'found_key': faiss_id_key
+                })
+                summary['incorrectly_keyed_items_count'] = summary.get('incorrectly_keyed_items_count', 0) + 1
+            else:
+                # Original "Missing Metadata" issue
+                if result['status'] != 'error': # Don't downgrade from error to warning
                     result['status'] = 'warning'
-                    result['issues'].append(f"FAISS ID mapping for '{custom_id}' exists but no metadata entry found under custom ID or FAISS ID key.")
-                    result['summary']['missing_metadata_entries'] += 1
-                    result['details']['missing_metadata'].append(custom_id)
+                issues.append(f"FAISS ID mapping for '{custom_id}' exists but no metadata entry found under custom ID or FAISS ID key.")
+                summary['missing_metadata_entries'] += 1
+                details['missing_metadata'].append(custom_id)
         
         # Update status based on issues found and generate appropriate recommendations
         if result['summary']['missing_vectors'] > 0:
@@ -842,37 +1255,87 @@ def check_vector_store_integrity() -> dict:
     
     return result
 
-def add_or_replace(id_: int | str, text: str, metadata: dict):
-    """Adds or replaces a vector and its metadata."""
-    index, meta = load_index()
-    if index is None:
-        logging.error("Cannot add/replace vector: FAISS index not loaded.")
-        return None
+def _reserve_faiss_ids(meta: dict, count: int = 1) -> int:
+    """Reserve count new FAISS IDs and return the first one.
+    
+    IDs come from a counter persisted in meta as ``_next_faiss_id_``, so new
+    IDs are never reused after a delete and assigning one does not scan the
+    ID map. Stores saved before the counter existed start it at max ID + 1."""
+    next_id = meta.get("_next_faiss_id_")
+    if next_id is None:
+        next_id = max(meta.get("_custom_to_faiss_id_map_", {}).values(), default=-1) + 1
+    meta["_next_faiss_id_"] = next_id + count
+    return next_id
+
+
+# str() forms of missing IDs (None, null, NaN) that must not become custom IDs
+# (compared case-insensitively)
+_INVALID_ID_STRINGS = frozenset(("none", "null", "nan"))
+
+def _is_valid_custom_id(custom_id_str: str) -> bool:
+    """Whether custom_id_str can key a stored item: not blank and not a missing-value placeholder."""
+    return bool(custom_id_str) and not custom_id_str.isspace() and custom_id_str.lower() not in _INVALID_ID_STRINGS
+
+# Item metadata key holding a hash of the embedded text and model, so an
+# item whose text is unchanged is updated without embedding it again
+_CONTENT_HASH_KEY = "content_sha"
+
+def _content_hash(text: str) -> str:
+    """Hash identifying the vector text embeds to: the text and the embedding model."""
+    return hashlib.sha1(f"{_MODEL_NAME}\0{text}".encode("utf-8")).hexdigest()
+
+def _has_embedded_text(meta: dict, custom_id_str: str, content_sha: str) -> bool:
+    """Whether the store already holds the vector of the text hashed as content_sha for custom_id_str."""
+    existing = meta.get(custom_id_str)
+    return (isinstance(existing, dict) and existing.get(_CONTENT_HASH_KEY) == content_sha
+            and custom_id_str in meta.get("_custom_to_faiss_id_map_", {}))
 
-    # Ensure metadata has the custom_id field
-    metadata["id"] = str(id_) # Store custom ID also in the metadata item itself
+def add_or_replace(id_: int | str, text: str, metadata: dict):
+    """Adds or replaces a vector and its metadata.
+    
+    When the stored item was embedded from the same text, only its metadata
+    is replaced; the text is not embedded again."""
     custom_id_str = str(id_)  # Use string form for map keys
 
     # Validate we have a proper custom ID
-    if custom_id_str is None or custom_id_str.lower() == "none" or not custom_id_str.strip():
+    if not _is_valid_custom_id(custom_id_str):
         logging.error(f"Cannot add/replace vector with invalid custom ID: {custom_id_str}")
         return None
 
-    embedding = embed(text)
-    vector = np.array([embedding], dtype="float32")
+    index, meta = _load_index_for_write()
+    if index is None:
+        logging.error("Cannot add/replace vector: FAISS index not loaded.")
+        return None
 
-    custom_to_faiss_map = meta.get("_custom_to_faiss_id_map_", {})
-    # Ensure FAISS IDs in map are integers for processing
-    custom_to_faiss_map = {k: int(v) for k, v in custom_to_faiss_map.items()}
+    # Ensure metadata has the custom_id field
+    metadata["id"] = custom_id_str # Store custom ID also in the metadata item itself
+    metadata[_CONTENT_HASH_KEY] = _content_hash(text)
+
+    if _has_embedded_text(meta, custom_id_str, metadata[_CONTENT_HASH_KEY]):
+        meta[custom_id_str] = metadata
+        if not save_index(index, meta): # pragma: no cover
+            logging.error(f"Failed to save index/metadata after updating '{custom_id_str}'.")
+            return None
+        logging.info(f"Text for custom ID '{custom_id_str}' is unchanged; metadata updated without re-embedding.")
+        return custom_id_str
+
+    # embed() already returns float32, so this is a (1, dim) view rather than a copy
+    vector = embed(text).reshape(1, -1)
+
+    # FAISS IDs in the map are already Python ints (load_index normalizes
+    # them), so the map is updated in place rather than copied
+    custom_to_faiss_map = meta.setdefault("_custom_to_faiss_id_map_", {})
     
     faiss_id_to_update = None
     is_update = False
+    # One-element ID array; an update passes the same array to remove_ids and add_with_ids
+    faiss_id_array = None
 
     if custom_id_str in custom_to_faiss_map:
         faiss_id_to_update = custom_to_faiss_map[custom_id_str]
+        faiss_id_array = np.array([faiss_id_to_update], dtype=np.int64)
         try:
-            # Ensure faiss_id_to_update is a Python int before creating numpy array
-            index.remove_ids(np.array([int(faiss_id_to_update)], dtype=np.int64))
+            index.remove_ids(faiss_id_array)
             is_update = True
             logging.info(f"Vector for custom ID '{custom_id_str}' (FAISS ID {faiss_id_to_update}) removed for update.")
         except RuntimeError as e: # pragma: no cover
@@ -882,56 +1345,22 @@ def add_or_replace(id_: int | str, text: str, metadata: dict):
             is_update = False # Treat as new addition if removal failed
             # Remove from map if removal failed, to avoid re-using a potentially problematic ID
             if custom_id_str in custom_to_faiss_map:
-                del custom_to_faiss_map[custom_id_str]
+                meta.get("_faiss_id_to_custom_id_map_", {}).pop(custom_to_faiss_map.pop(custom_id_str), None)
 
 
     if faiss_id_to_update is not None: #This means it's an update and old vector was removed
         new_faiss_id = int(faiss_id_to_update) # Reuse the same FAISS ID, ensure it's Python int
     else: # New item or update failed and now treating as new
-        # Determine a new FAISS ID.
-        # For IndexIDMap, we need an ID that is not currently in use.
-        # A robust way is to find the maximum ID currently in the FAISS index (if possible) 
-        # or in our map, and increment from there, ensuring it's not in use.
-        
-        # Get all FAISS IDs currently in the map.
-        current_faiss_ids_in_map = set(custom_to_faiss_map.values())
-        
-        # Start searching for a new ID from 0 or max_id + 1
-        # Max ID could be from map or from index.ntotal (as a hint of highest possible ID if map is sparse)
-        # However, index.ntotal for IndexIDMap is just the count, not necessarily max ID.
-        
-        if not current_faiss_ids_in_map:
-            # If map is empty, start checking from ID 0.
-            # If index.ntotal is also 0, ID 0 is fine.
-            # If index.ntotal > 0 but map is empty, it implies orphaned vectors.
-            # We should still try to use low IDs if they are available in the FAISS index itself.
-            next_potential_id = 0
-        else:
-            next_potential_id = max(current_faiss_ids_in_map) + 1
-
-        # For IndexIDMap, we must ensure the ID is not already physically in the index.
-        # The id_map component of IndexIDMap can check this.
-        # Note: faiss.IndexIDMap does not directly expose a Pythonic way to iterate all present IDs
-        # or check existence of a specific ID without searching/reconstructing.
-        # The `index.id_map.size()` gives count of unique IDs ever added (if direct map access), not current.
-        # `index.ntotal` is the current number of vectors.
-        # The most reliable way with IndexIDMap is to pick a candidate ID and try to add.
-        # FAISS itself might handle re-adding an ID if it supports it, or error.
-        # add_with_ids should replace if the ID exists, but we already removed.
-        # So, the chosen `next_potential_id` should be okay.
-        # If we want truly unique, increment `next_potential_id` until `index.reconstruct(id)` fails or similar (complex).
-        # The `max(map_ids) + 1` is generally a safe strategy for new IDs *managed by us*.
-        new_faiss_id = int(next_potential_id)
+        new_faiss_id = _reserve_faiss_ids(meta)
+        faiss_id_array = np.array([new_faiss_id], dtype=np.int64)
 
 
     # Add to FAISS index with the chosen/new FAISS ID
-    # Ensure the ID is np.int64 for add_with_ids
-    index.add_with_ids(vector, np.array([new_faiss_id], dtype=np.int64))
+    index.add_with_ids(vector, faiss_id_array)
     
-    # Update mappings - ensure new_faiss_id is Python int for storage in JSON
+    # Update both mappings in place - ensure new_faiss_id is Python int for storage in JSON
     custom_to_faiss_map[custom_id_str] = int(new_faiss_id) 
-    # meta["_faiss_id_to_custom_id_map_"] will be rebuilt by save_index from the sanitized custom_to_faiss_map
-    meta["_custom_to_faiss_id_map_"] = custom_to_faiss_map
+    meta.setdefault("_faiss_id_to_custom_id_map_", {})[int(new_faiss_id)] = custom_id_str
     
     # CRITICAL: Store the metadata using the custom_id_str as the key, not the FAISS ID
     meta[custom_id_str] = metadata
@@ -947,14 +1376,99 @@ def add_or_replace(id_: int | str, text: str, metadata: dict):
         return None
 
 
-def delete_vector(id_: int | str):
-    """Deletes a vector and its metadata by custom ID."""
-    index, meta = load_index()
+def add_or_replace_batch(items: list[tuple[int | str, str, dict]]) -> list[str | None]:
+    """Adds or replaces several vectors and their metadata in one pass.
+
+    All texts are embedded with a single model call, vectors are added to
+    FAISS with one add_with_ids call, and the store is saved once. Items
+    whose stored text is unchanged only have their metadata replaced.
+
+    Args:
+        items: (id_, text, metadata) tuples, as accepted by add_or_replace().
+
+    Returns:
+        For each item, its custom ID string if it was stored, otherwise None.
+    """
+    results: list[str | None] = [None] * len(items)
+    if not items:
+        return results
+
+    index, meta = _load_index_for_write()
     if index is None:
-        logging.error("Cannot delete vector: FAISS index not loaded.")
-        return False
+        logging.error("Cannot add/replace vectors: FAISS index not loaded.")
+        return results
+
+    # Validate IDs; a later item with the same custom ID wins
+    positions_by_custom_id: dict[str, int] = {}
+    for pos, (id_, _text, metadata) in enumerate(items):
+        custom_id_str = str(id_)
+        if not _is_valid_custom_id(custom_id_str):
+            logging.error(f"Cannot add/replace vector with invalid custom ID: {custom_id_str}")
+            continue
+        metadata["id"] = custom_id_str # Store custom ID also in the metadata item itself
+        positions_by_custom_id.pop(custom_id_str, None)
+        positions_by_custom_id[custom_id_str] = pos
+
+    if not positions_by_custom_id:
+        return results
+
+    # Only items whose text changed since it was embedded need a new vector
+    custom_ids = []
+    positions = []
+    for custom_id_str, pos in positions_by_custom_id.items():
+        text, metadata = items[pos][1], items[pos][2]
+        metadata[_CONTENT_HASH_KEY] = _content_hash(text)
+        if not _has_embedded_text(meta, custom_id_str, metadata[_CONTENT_HASH_KEY]):
+            custom_ids.append(custom_id_str)
+            positions.append(pos)
+
+    # FAISS IDs in the map are already Python ints (load_index normalizes
+    # them), so the map is updated in place rather than copied
+    custom_to_faiss_map = meta.setdefault("_custom_to_faiss_id_map_", {})
+    ids_to_replace = [custom_to_faiss_map[cid] for cid in custom_ids if cid in custom_to_faiss_map]
+
+    if custom_ids:
+        vectors = embed_batch([items[pos][1] for pos in positions])
+
+        # Existing items keep their FAISS ID; their old vectors are removed in one call
+        if ids_to_replace:
+            index.remove_ids(np.array(ids_to_replace, dtype=np.int64))
+
+        next_potential_id = _reserve_faiss_ids(meta, len(custom_ids) - len(ids_to_replace))
+        faiss_to_custom_map = meta.setdefault("_faiss_id_to_custom_id_map_", {})
+        new_faiss_ids = []
+        for custom_id_str in custom_ids:
+            faiss_id = custom_to_faiss_map.get(custom_id_str)
+            if faiss_id is None:
+                faiss_id = next_potential_id
+                next_potential_id += 1
+                custom_to_faiss_map[custom_id_str] = faiss_id
+                faiss_to_custom_map[faiss_id] = custom_id_str
+            new_faiss_ids.append(faiss_id)
+
+        index.add_with_ids(vectors, np.array(new_faiss_ids, dtype=np.int64))
 
-    custom_id_str = str(id_)
+    # CRITICAL: Store the metadata using the custom_id_str as the key, not the FAISS ID
+    for custom_id_str, pos in positions_by_custom_id.items():
+        meta[custom_id_str] = items[pos][2]
+
+    if not save_index(index, meta): # pragma: no cover
+        logging.error(f"Failed to save index/metadata after adding/replacing {len(positions_by_custom_id)} items.")
+        return results
+
+    logging.info(f"Added/updated {len(custom_ids)} vectors in one batch ({len(ids_to_replace)} replaced, "
+                 f"{len(positions_by_custom_id) - len(custom_ids)} unchanged).")
+    for pos, (id_, _text, _metadata) in enumerate(items):
+        custom_id_str = str(id_)
+        if custom_id_str in positions_by_custom_id:
+            results[pos] = custom_id_str
+    return results
+
+
+def _remove_vector_entry(index: faiss.Index, meta: dict, custom_id_str: str) -> bool:
+    """Remove one custom ID's vector and metadata from a loaded index/meta pair.
+    
+    The caller is responsible for saving the index afterwards."""
     custom_to_faiss_map = meta.get("_custom_to_faiss_id_map_", {})
 
     if custom_id_str not in custom_to_faiss_map:
@@ -992,8 +1506,6 @@ def delete_vector(id_: int | str):
             del faiss_to_custom_map[faiss_int_id]
             meta["_faiss_id_to_custom_id_map_"] = faiss_to_custom_map
         
-        save_index(index, meta)
-        logging.info(f"Successfully processed deletion for custom ID '{custom_id_str}'.")
         return True
         
     except Exception as e:
@@ -1001,6 +1513,26 @@ def delete_vector(id_: int | str):
         return False
 
 
+def delete_vector(id_: int | str):
+    """Deletes a vector and its metadata by custom ID."""
+    index, meta = _load_index_for_write()
+    if index is None:
+        logging.error("Cannot delete vector: FAISS index not loaded.")
+        return False
+
+    custom_id_str = str(id_)
+    if not _remove_vector_entry(index, meta, custom_id_str):
+        return False
+
+    try:
+        save_index(index, meta)
+    except Exception as e:
+        logging.error(f"Error saving index after deleting custom ID '{custom_id_str}': {e}")
+        return False
+    logging.info(f"Successfully processed deletion for custom ID '{custom_id_str}'.")
+    return True
+
+
 def delete_vectors_by_filter(pred: _t.Callable[[dict], bool]):
     """
     Delete multiple vectors and their metadata based on a predicate function.
@@ -1011,39 +1543,148 @@ def delete_vectors_by_filter(pred: _t.Callable[[dict], bool]):
     Returns:
         Tuple of (success_count, failure_count, total_checked)
     """
-    index, meta = load_index()
+    index, meta = _load_index_for_write()
     if index is None:
         logging.error("Cannot delete vectors: FAISS index not loaded.")
         return 0, 0, 0
     
     custom_to_faiss_map = meta.get("_custom_to_faiss_id_map_", {})
     custom_ids_to_delete = []
+    faiss_ids_to_delete = []
     total_checked = 0
     
-    # First, identify all vectors to delete
+    # First, identify all vectors to delete, collecting their FAISS IDs as we go
     for custom_id_str, faiss_int_id in custom_to_faiss_map.items():
         # Check if metadata exists for this custom ID
-        if custom_id_str in meta and isinstance(meta[custom_id_str], dict):
-            metadata = meta[custom_id_str]
+        metadata = meta.get(custom_id_str)
+        if isinstance(metadata, dict):
             total_checked += 1
             
             if pred(metadata):
                 custom_ids_to_delete.append(custom_id_str)
+                faiss_ids_to_delete.append(faiss_int_id)
     
-    # Then delete them
-    success_count = 0
-    failure_count = 0
+    if not custom_ids_to_delete:
+        logging.info("Deleted 0 vectors based on filter predicate.")
+        return 0, 0, total_checked
+    
+    # Then delete them with a single remove_ids call and a single save
+    faiss_ids = np.array(faiss_ids_to_delete, dtype=np.int64)
+    try:
+        remove_count = index.remove_ids(faiss_ids)
+    except Exception as e:
+        logging.error(f"Error removing {len(custom_ids_to_delete)} vectors from FAISS index: {e}")
+        return 0, len(custom_ids_to_delete), total_checked
+    if isinstance(remove_count, int) and remove_count < len(custom_ids_to_delete):
+        logging.warning(
+            f"Only {remove_count} of {len(custom_ids_to_delete)} matched vectors were found in the FAISS index. "
+            f"Metadata will still be cleaned up."
+        )
+    
+    faiss_to_custom_map = meta.get("_faiss_id_to_custom_id_map_", {})
     for custom_id_str in custom_ids_to_delete:
-        if delete_vector(custom_id_str):
-            success_count += 1
-        else:
-            failure_count += 1
+        meta.pop(custom_id_str, None)
+        faiss_to_custom_map.pop(custom_to_faiss_map.pop(custom_id_str), None)
+    
+    success_count = len(custom_ids_to_delete)
+    try:
+        saved = save_index(index, meta)
+    except Exception as e:
+        logging.error(f"Error saving index after filtered deletion: {e}")
+        saved = False
+    if not saved:
+        logging.error(f"Failed to save index after deleting {success_count} vectors by filter.")
+        return 0, success_count, total_checked
     
     logging.info(f"Deleted {success_count} vectors based on filter predicate.")
-    if failure_count > 0:
-        logging.warning(f"Failed to delete {failure_count} vectors.")
+    return success_count, 0, total_checked
+
+def _search_all_items(meta: dict, top_k: int, pred: _t.Callable[[dict], bool] | None, offset: int) -> list[tuple[dict, float]]:
+    """Return stored items matching pred without a semantic query (empty-query search).
+    
+    Items come in ID map (insertion) order, and the scan stops as soon as the
+    requested page is filled, so a small page costs O(offset + top_k) lookups
+    rather than a walk over the whole store."""
+    logging.info("[memory_utils.search] Empty query received. Returning items based on predicate.") # LOGGING
+    page_end = offset + top_k
+    all_items = []
+    if page_end <= 0:
+        return all_items
+    # Iterate over custom IDs stored in the map
+    for custom_id_str in meta.get("_custom_to_faiss_id_map_", {}):
+        # Metadata items are keyed by custom_id_str in the 'meta' dict itself (excluding internal maps)
+        metadata_item = meta.get(custom_id_str)
+        if metadata_item is not None:
+            if pred is None or pred(metadata_item):
+                all_items.append((metadata_item, 1.0)) # Score 1.0 for non-semantic matches
+                if len(all_items) >= page_end:
+                    break
+        else:
+            # This case should ideally not happen if data is consistent
+            logging.warning(f"[memory_utils.search] Orphaned custom_id '{custom_id_str}' in map, but no corresponding metadata entry.")
     
-    return success_count, failure_count, total_checked
+    # No specific sorting for empty query, relies on dict iteration order (Python 3.7+)
+    logging.info(f"[memory_utils.search] Empty query: Found {len(all_items)} items before offset/top_k.") # LOGGING
+    # Apply offset and top_k
+    return all_items[offset : page_end]
+
+def _collect_search_hits(query: str, distances_row, faiss_ids_row, meta: dict, top_k: int,
+                         pred: _t.Callable[[dict], bool] | None, offset: int,
+                         inner_product: bool = False) -> list[tuple[dict, float]]:
+    """Turn one row of FAISS search output into (metadata, score) results for a query.
+    
+    With inner_product the row already holds cosine similarities; otherwise it
+    holds squared L2 distances between normalized vectors."""
+    results = []
+    # Get the reverse map from FAISS ID to custom ID string
+    # This should be already rebuilt during load_index
+    faiss_to_custom_map = meta.get("_faiss_id_to_custom_id_map_", {})
+    
+    logging.info(f"[memory_utils.search] FAISS raw search for '{query}' returned {len(faiss_ids_row)} results before filtering.") # LOGGING
+
+    # Similarity scores for the whole row at once, higher is better.
+    # Inner-product indexes return cos_sim directly for normalized embeddings.
+    # Older IndexFlatL2 stores return d^2 = 2 - 2*cos_sim, so cos_sim = 1 - d^2/2.
+    scores_row = np.asarray(distances_row, dtype=np.float64)
+    if not inner_product:
+        scores_row = 1.0 - scores_row * 0.5
+
+    # Drop FAISS padding (-1, fewer results than requested) with one mask, then
+    # convert the row of numpy IDs to Python ints (the reverse map's keys, rebuilt
+    # at load time) and look up every custom ID in one pass
+    faiss_ids_row = np.asarray(faiss_ids_row)
+    valid = faiss_ids_row != -1
+    faiss_int_ids = faiss_ids_row[valid].tolist()
+    scores = scores_row[valid].tolist()
+    custom_ids = [faiss_to_custom_map.get(faiss_int_id) for faiss_int_id in faiss_int_ids]
+    # Only format the per-result debug message when it would be emitted
+    debug_enabled = logging.getLogger().isEnabledFor(logging.DEBUG)
+
+    for faiss_int_id, custom_id_str, score in zip(faiss_int_ids, custom_ids, scores):
+        if not custom_id_str:
+            logging.warning(f"[memory_utils.search] FAISS ID {faiss_int_id} not found in faiss_to_custom_map. Skipping.")
+            continue
+            
+        # Metadata items are keyed by custom_id_str in the 'meta' dict itself
+        metadata_item = meta.get(custom_id_str)
+        if not metadata_item:
+            logging.warning(f"[memory_utils.search] Custom ID '{custom_id_str}' (from FAISS ID {faiss_int_id}) not found in metadata. Skipping.")
+            continue
+        
+        # Predicate check
+        predicate_passed = pred is None or pred(metadata_item)
+        if debug_enabled:
+            logging.debug(f"[memory_utils.search] Checking item: ID='{custom_id_str}', Type='{metadata_item.get('type')}'. Predicate passed: {predicate_passed}") # DEBUG LOGGING
+        if predicate_passed:
+            results.append((metadata_item, score))
+    
+    logging.info(f"[memory_utils.search] Query '{query}': Processed {len(faiss_ids_row)} raw FAISS results. Found {len(results)} items matching predicate before offset and top_k.") # LOGGING
+    
+    # Apply offset and then limit to top_k after predicate filtering and scoring
+    # This ensures the predicate is applied first.
+    final_results = results[offset : offset + top_k]
+    logging.info(f"[memory_utils.search] Query '{query}': Returning {len(final_results)} final results after offset and top_k.") # LOGGING
+    return final_results
 
 def search(query: str, top_k: int = 5, pred: _t.Callable[[dict], bool] | None = None, offset: int = 0) -> list[tuple[dict, float]]:
     """Search for text in the vector store. 
@@ -1055,7 +1696,9 @@ def search(query: str, top_k: int = 5, pred: _t.Callable[[dict], bool] | None =
         offset: Offset for pagination (not directly supported by FAISS search, handled post-search).
         
     Returns:
-        List of tuples, where each tuple contains (metadata, score).
+        List of tuples, where each tuple contains (metadata, score). The score is
+        the cosine similarity to the query (higher is better, at most 1.0); an
+        empty query returns items with score 1.0.
     """
     index, meta = load_index()
     if index is None:
@@ -1064,29 +1707,9 @@ def search(query: str, top_k: int = 5, pred: _t.Callable[[dict], bool] | None =
 
     logging.info(f"[memory_utils.search] Received query: '{query}', top_k: {top_k}") # LOGGING
 
-    custom_to_faiss_map = meta.get("_custom_to_faiss_id_map_", {})
-    faiss_to_custom_map = meta.get("_faiss_id_to_custom_id_map_", {})
-    
     # If no query, return all items matching predicate (if any), respecting top_k and offset
     if not query.strip():
-        logging.info("[memory_utils.search] Empty query received. Returning items based on predicate.") # LOGGING
-        all_items = []
-        # Iterate over custom IDs stored in the map
-        for custom_id_str, faiss_int_id in custom_to_faiss_map.items():
-            # Metadata items are keyed by custom_id_str in the 'meta' dict itself (excluding internal maps)
-            if custom_id_str in meta:
-                metadata_item = meta[custom_id_str]
-                if pred is None or pred(metadata_item):
-                    all_items.append((metadata_item, 1.0)) # Score 1.0 for non-semantic matches
-            else:
-                # This case should ideally not happen if data is consistent
-                logging.warning(f"[memory_utils.search] Orphaned custom_id '{custom_id_str}' in map, but no corresponding metadata entry.")
-        
-        # Sort by a default criteria if needed, e.g., 'updated_at' or 'id' if available in metadata
-        # For now, no specific sorting for empty query, relies on dict iteration order (Python 3.7+)
-        logging.info(f"[memory_utils.search] Empty query: Found {len(all_items)} items before offset/top_k.") # LOGGING
-        # Apply offset and top_k
-        return all_items[offset : offset + top_k]
+        return _search_all_items(meta, top_k, pred, offset)
 
     try:
         query_vector = embed(query)
@@ -1094,7 +1717,7 @@ def search(query: str, top_k: int = 5, pred: _t.Callable[[dict], bool] | None =
         logging.error(f"[memory_utils.search] Failed to embed query '{query}': {e}")
         return []
 
-    # FAISS search returns distances (L2 squared) and labels (FAISS integer IDs)
+    # FAISS search returns distances (inner products, or L2 squared for older stores) and labels (FAISS integer IDs)
     # Need to adjust k for search if offset is used, then slice later.
     # This is inefficient for large offsets but FAISS doesn't support offset directly.
     # For typical small top_k, it's acceptable.
@@ -1107,55 +1730,80 @@ def search(query: str, top_k: int = 5, pred: _t.Callable[[dict], bool] | None =
         logging.error(f"[memory_utils.search] FAISS index.search failed for query '{query}': {e}")
         return []
 
-    results = []
-    # Get the reverse map from FAISS ID to custom ID string
-    # This should be already rebuilt during load_index
+    return _collect_search_hits(query, distances[0], faiss_ids[0], meta, top_k, pred, offset,
+                                inner_product=_uses_inner_product(index))
+
+def search_batch(queries: list[str], top_k: int = 5,
+                 pred: _t.Callable[[dict], bool] | _t.Sequence[_t.Callable[[dict], bool] | None] | None = None,
+                 offset: int = 0) -> list[list[tuple[dict, float]]]:
+    """Search for several texts at once, sharing one embedding pass and one FAISS call.
+    
+    Identical query texts are embedded and searched only once, so the same
+    query can be repeated with a different predicate per position.
     
-    logging.info(f"[memory_utils.search] FAISS raw search for '{query}' returned {len(faiss_ids[0])} results before filtering.") # LOGGING
-    raw_results_count = 0
+    Args:
+        queries: Texts to search for.
+        top_k: Number of results to return per query.
+        pred: Optional predicate to filter results, or a sequence with one
+            predicate (or None) per query.
+        offset: Offset for pagination, applied per query.
+        
+    Returns:
+        One result list per query, in the same order as `queries`; each has the
+        same shape as the return value of search().
+    """
+    if not queries:
+        return []
 
-    for i, faiss_int_id in enumerate(faiss_ids[0]):
-        raw_results_count += 1
-        if faiss_int_id == -1:  # No more results or padding from FAISS
-            continue
+    if pred is None or callable(pred):
+        preds = [pred] * len(queries)
+    else:
+        preds = list(pred)
+        if len(preds) != len(queries):
+            raise ValueError(f"search_batch got {len(preds)} predicates for {len(queries)} queries")
 
-        # Convert numpy.int64 (or other int types from FAISS) to standard Python int for dict key lookup
-        faiss_int_id_py = int(faiss_int_id)
+    index, meta = load_index()
+    if index is None:
+        logging.error("Cannot search: FAISS index not loaded.")
+        return [[] for _ in queries]
 
-        # Use the reverse map to get the custom ID
-        custom_id_str = faiss_to_custom_map.get(faiss_int_id_py)
-        if not custom_id_str:
-            logging.warning(f"[memory_utils.search] FAISS ID {faiss_int_id_py} not found in faiss_to_custom_map. Skipping.")
-            continue
-            
-        # Metadata items are keyed by custom_id_str in the 'meta' dict itself
-        metadata_item = meta.get(custom_id_str)
-        if not metadata_item:
-            logging.warning(f"[memory_utils.search] Custom ID '{custom_id_str}' (from FAISS ID {faiss_int_id_py}) not found in metadata. Skipping.")
-            continue
-        
-        # Predicate check
-        predicate_passed = pred is None or pred(metadata_item)
-        logging.debug(f"[memory_utils.search] Checking item: ID='{custom_id_str}', Type='{metadata_item.get('type')}'. Predicate passed: {predicate_passed}") # DEBUG LOGGING
-        if predicate_passed:
-            # Similarity score (1.0 - distance for normalized embeddings, or use raw distance)
-            # Assuming normalized embeddings, higher score is better (closer to 1.0)
-            # Max L2 distance for normalized vectors is 2, so (2 - dist) / 2 gives 0-1 score.
-            # Or, if distances are small, 1 - dist is common. Let's use a simple positive score.
-            # SentenceTransformer usually returns cosine similarity, not L2. 
-            # If using index.search with IndexFlatL2, distances are L2. 
-            # If model.encode normalizes, then L2 distance d^2 = 2 - 2*cos_sim.
-            # So cos_sim = 1 - d^2/2. Higher is better.
-            score = 1.0 - (distances[0][i] / 2.0) # Crude similarity from L2, higher is better
-            results.append((metadata_item, score))
-    
-    logging.info(f"[memory_utils.search] Query '{query}': Processed {raw_results_count} raw FAISS results. Found {len(results)} items matching predicate before offset and top_k.") # LOGGING
-    
-    # Apply offset and then limit to top_k after predicate filtering and scoring
-    # This ensures the predicate is applied first.
-    final_results = results[offset : offset + top_k]
-    logging.info(f"[memory_utils.search] Query '{query}': Returning {len(final_results)} final results after offset and top_k.") # LOGGING
-    return final_results
+    logging.info(f"[memory_utils.search_batch] Received {len(queries)} queries, top_k: {top_k}") # LOGGING
+
+    batch_results: list[list[tuple[dict, float]]] = [[] for _ in queries]
+    semantic_positions = []
+    for pos, query in enumerate(queries):
+        if query.strip():
+            semantic_positions.append(pos)
+        else:
+            batch_results[pos] = _search_all_items(meta, top_k, preds[pos], offset)
+
+    if not semantic_positions:
+        return batch_results
+
+    # One matrix row per distinct query text
+    query_rows = {}
+    for pos in semantic_positions:
+        query_rows.setdefault(queries[pos], len(query_rows))
+    semantic_queries = list(query_rows)
+    try:
+        query_matrix = embed_batch(semantic_queries)
+    except Exception as e:
+        logging.error(f"[memory_utils.search_batch] Failed to embed {len(semantic_queries)} queries: {e}")
+        return batch_results
+
+    search_k = top_k + offset
+    try:
+        distances, faiss_ids = index.search(query_matrix, search_k)
+    except Exception as e:
+        logging.error(f"[memory_utils.search_batch] FAISS index.search failed for {len(semantic_queries)} queries: {e}")
+        return batch_results
+
+    inner_product = _uses_inner_product(index)
+    for pos in semantic_positions:
+        row = query_rows[queries[pos]]
+        batch_results[pos] = _collect_search_hits(queries[pos], distances[row], faiss_ids[row], meta, top_k, preds[pos], offset,
+                                                  inner_product=inner_product)
+    return batch_results
 
 def count_items(pred: _t.Callable[[dict], bool] | None = None) -> int:
     """
@@ -1173,20 +1821,26 @@ def count_items(pred: _t.Callable[[dict], bool] | None = None) -> int:
             logging.error("Failed to load metadata for counting items.")
             return 0
         
-        # Count items that match the predicate and are actual items (not the ID map)
-        count = 0
-        for key, value in meta.items():
-            if key != "_custom_to_faiss_id_map_" and isinstance(value, dict):
-                if not pred or pred(value):
-                    count += 1
-        
-        return count
+        # Count items that match the predicate and are actual items (not the ID maps)
+        items = (value for key, value in meta.items()
+                 if key not in _RESERVED_META_KEYS and isinstance(value, dict))
+        if pred is None:
+            return sum(1 for _ in items)
+        return sum(1 for value in items if pred(value))
     except Exception as e:
         logging.error(f"Error counting items: {e}")
         return 0
 
 # ───────────────────────────────────────── Utils ────
+@functools.lru_cache(maxsize=8)
+def _load_preferences_cached(path: str, mtime_ns: int, size: int) -> dict:
+    """Parse a preferences YAML file; cached per (path, mtime, size) so edits are picked up."""
+    return yaml.safe_load(pathlib.Path(path).read_text(encoding="utf-8")) or {}
+
 def load_preferences(cfg: dict, memex_root: pathlib.Path = None) -> dict:
+    """Load the preferences YAML, re-parsing it only when the file has changed.
+    
+    The returned dict is shared between callers and must not be mutated."""
     if memex_root is None:
         memex_root = ROOT
     
@@ -1198,11 +1852,13 @@ def load_preferences(cfg: dict, memex_root: pathlib.Path = None) -> dict:
         return {}
 
     path = memex_root / pref_file_rel_path
-    if not path.exists():
+    try:
+        st = os.stat(path)
+    except OSError:
         logging.info(f"Preferences file {path} not found. Returning empty preferences.")
         return {}
     try:
-        return yaml.safe_load(path.read_text(encoding="utf-8")) or {}
+        return _load_preferences_cached(str(path), st.st_mtime_ns, st.st_size)
     except yaml.YAMLError as e:
         logging.error(f"Error parsing preferences file {path}: {e}. Returning empty preferences.")
         return {}
@@ -1210,6 +1866,44 @@ def load_preferences(cfg: dict, memex_root: pathlib.Path = None) -> dict:
         logging.error(f"Error reading preferences file {path}: {e}. Returning empty preferences.")
         return {}
 
+_CODE_CHUNK_REQUIRED_FIELDS = ("source_file", "language", "start_line", "end_line")
+
+def _embeds_chunk_header(cfg: dict) -> bool:
+    """Whether code chunks are embedded with their "<language> code from <file>:" header line
+    (``files.embed_chunk_header``, default true); without it only the code is embedded."""
+    return bool(cfg.get("files", {}).get("embed_chunk_header", True))
+
+def _prepare_code_chunk(content: str, metadata: dict, include_header: bool = True) -> str | None:
+    """Validate and fill in code chunk metadata; return the text to embed, or None if invalid.
+    
+    With include_header the text starts with the chunk's language, name and
+    source file; otherwise it is the content alone, leaving fewer tokens
+    for the model to encode (the fields stay in metadata for filtering)."""
+    # Ensure required metadata fields
+    for field in _CODE_CHUNK_REQUIRED_FIELDS:
+        if field not in metadata:
+            logging.error(f"Missing required metadata field '{field}' for code chunk.")
+            return None
+    
+    # Ensure the metadata has the correct type
+    metadata["type"] = "code_chunk"
+    
+    # Store the raw content in metadata
+    metadata["content"] = content
+    if not include_header:
+        return content
+    
+    # Create a rich description for embedding
+    language = metadata.get("language", "unknown")
+    source_file = metadata.get("source_file", "unknown")
+    name = metadata.get("name", "")
+    
+    if name:
+        embedding_description = f"{language} function '{name}' from {source_file}:\n{content}"
+    else:
+        embedding_description = f"{language} code from {source_file}:\n{content}"
+    return embedding_description
+
 def index_code_chunk(chunk_id: str, content: str, metadata: dict) -> str:
     """
     Index a code chunk in the vector store.
@@ -1223,28 +1917,9 @@ def index_code_chunk(chunk_id: str, content: str, metadata: dict) -> str:
         The chunk_id if successfully indexed, None otherwise
     """
     try:
-        # Ensure required metadata fields
-        required_fields = ["source_file", "language", "start_line", "end_line"]
-        for field in required_fields:
-            if field not in metadata:
-                logging.error(f"Missing required metadata field '{field}' for code chunk.")
-                return None
-        
-        # Ensure the metadata has the correct type
-        metadata["type"] = "code_chunk"
-        
-        # Create a rich description for embedding
-        language = metadata.get("language", "unknown")
-        source_file = metadata.get("source_file", "unknown")
-        name = metadata.get("name", "")
-        
-        if name:
-            embedding_description = f"{language} function '{name}' from {source_file}:\n{content}"
-        else:
-            embedding_description = f"{language} code from {source_file}:\n{content}"
-        
-        # Store the raw content in metadata
-        metadata["content"] = content
+        embedding_description = _prepare_code_chunk(content, metadata, _embeds_chunk_header(load_cfg()))
+        if embedding_description is None:
+            return None
         
         # Add to vector store
         return add_or_replace(chunk_id, embedding_description, metadata)
@@ -1253,6 +1928,36 @@ def index_code_chunk(chunk_id: str, content: str, metadata: dict) -> str:
         logging.error(f"Failed to index code chunk '{chunk_id}': {e}")
         return None
 
+def index_code_chunks_batch(chunks: list[tuple[str, str, dict]]) -> list[str | None]:
+    """
+    Index several code chunks with one embedding call and one store save.
+    
+    Args:
+        chunks: (chunk_id, content, metadata) tuples, as accepted by index_code_chunk()
+        
+    Returns:
+        For each chunk, its chunk_id if successfully indexed, None otherwise
+    """
+    results: list[str | None] = [None] * len(chunks)
+    batch_items = []
+    batch_positions = []
+    include_header = _embeds_chunk_header(load_cfg())
+    for pos, (chunk_id, content, metadata) in enumerate(chunks):
+        embedding_description = _prepare_code_chunk(content, metadata, include_header)
+        if embedding_description is not None:
+            batch_items.append((chunk_id, embedding_description, metadata))
+            batch_positions.append(pos)
+    
+    if not batch_items:
+        return results
+    
+    try:
+        for pos, result in zip(batch_positions, add_or_replace_batch(batch_items)):
+            results[pos] = result
+    except Exception as e:
+        logging.error(f"Failed to index batch of {len(batch_items)} code chunks: {e}")
+    return results
+
 def delete_code_chunks():
     """
     Delete all code chunks from the vector store.
@@ -1262,6 +1967,11 @@ def delete_code_chunks():
     """
     return delete_vectors_by_filter(lambda meta: meta.get("type") == "code_chunk")
 
+@functools.lru_cache(maxsize=4096)
+def _normalize_chunk_path(source_file: str) -> str:
+    """source_file as a normalized, forward-slash path for chunk IDs."""
+    return str(pathlib.Path(source_file)).replace("\\", "/")
+
 def generate_chunk_id(source_file: str, start_line: int, end_line: int, content_hash: str = None) -> str:
     """
     Generate a deterministic ID for a code chunk based on file and line numbers.
@@ -1275,10 +1985,8 @@ def generate_chunk_id(source_file: str, start_line: int, end_line: int, content_
     Returns:
         A string ID for the chunk
     """
-    import hashlib
-    
-    # Normalize the source file path
-    normalized_path = str(pathlib.Path(source_file)).replace("\\", "/")
+    # Normalize the source file path (cached: a file yields many chunks)
+    normalized_path = _normalize_chunk_path(source_file)
     
     # Create a base ID from file and line numbers
     base_id = f"{normalized_path}:{start_line}-{end_line}"
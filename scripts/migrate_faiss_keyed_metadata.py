@@ -8,13 +8,17 @@ instead of custom ID keys, then re-keys them to use the correct custom ID format
 The main symptom this fixes is when the Memory tab in the UI shows no items despite having data.
 """
 
-import json
 import logging
 import argparse
 import shutil
 from pathlib import Path
 from datetime import datetime
-from typing import Dict, Any, List, Set
+from typing import Dict, Any, List, Optional, Set
+
+try:
+    import ijson
+except ImportError:  # Optional: streams the dry run; the file is loaded whole otherwise
+    ijson = None
 
 # Set up relative imports
 import sys
@@ -22,9 +26,9 @@ project_root = Path(__file__).resolve().parent.parent
 sys.path.insert(0, str(project_root))
 
 try:
-    from scripts.memory_utils import load_cfg, get_meta_path, load_index
+    from scripts.memory_utils import load_cfg, get_meta_path, load_index, _json_loads, _json_dumps, _replace_file
 except ImportError:
-    from memex.scripts.memory_utils import load_cfg, get_meta_path, load_index
+    from memex.scripts.memory_utils import load_cfg, get_meta_path, load_index, _json_loads, _json_dumps, _replace_file
 
 
 def identify_incorrectly_keyed_items(meta: Dict[str, Any]) -> List[Dict[str, str]]:
@@ -59,13 +63,61 @@ def identify_incorrectly_keyed_items(meta: Dict[str, Any]) -> List[Dict[str, str
     return incorrectly_keyed
 
 
-def migrate_metadata_keys(meta: Dict[str, Any], dry_run: bool = False) -> Dict[str, Any]:
+def identify_incorrectly_keyed_items_streaming(meta_path: Path) -> List[Dict[str, str]]:
+    """
+    Identify incorrectly keyed items by reading metadata.json incrementally (requires ijson).
+    
+    Only the ID map, the top-level keys and the type of entries that may be
+    keyed by FAISS ID are kept, never the whole metadata dictionary.
+    
+    Args:
+        meta_path: Path to the metadata.json file
+        
+    Returns:
+        The same list identify_incorrectly_keyed_items() returns for the file's contents
+    """
+    custom_to_faiss_map = {}
+    faiss_id_strs = None  # Known once the ID map has been read
+    top_level_keys = set()
+    item_types = {}
+    
+    with open(meta_path, 'rb') as f:
+        for key, value in ijson.kvitems(f, ''):
+            top_level_keys.add(key)
+            if key == "_custom_to_faiss_id_map_":
+                custom_to_faiss_map = value
+                faiss_id_strs = {str(faiss_id) for faiss_id in custom_to_faiss_map.values()}
+                # Drop entries seen before the map that no FAISS ID points to
+                item_types = {k: t for k, t in item_types.items() if k in faiss_id_strs}
+            elif isinstance(value, dict) and not key.startswith("_"):
+                if faiss_id_strs is None or key in faiss_id_strs:
+                    item_types[key] = value.get('type', 'unknown')
+    
+    incorrectly_keyed = []
+    for custom_id, faiss_id in custom_to_faiss_map.items():
+        faiss_id_str = str(faiss_id)
+        if faiss_id_str in item_types and custom_id not in top_level_keys:
+            incorrectly_keyed.append({
+                'custom_id': custom_id,
+                'faiss_id': faiss_id_str,
+                'expected_key': custom_id,
+                'found_key': faiss_id_str,
+                'item_type': item_types[faiss_id_str]
+            })
+    
+    return incorrectly_keyed
+
+
+def migrate_metadata_keys(meta: Dict[str, Any], dry_run: bool = False,
+                          incorrectly_keyed: Optional[List[Dict[str, str]]] = None) -> Dict[str, Any]:
     """
     Migrate metadata from FAISS ID keys to custom ID keys.
     
     Args:
         meta: The metadata dictionary to migrate
         dry_run: If True, don't modify the dictionary, just return what would be changed
+        incorrectly_keyed: Result of identify_incorrectly_keyed_items(meta), if the
+            caller already has it; computed here otherwise
         
     Returns:
         Dictionary with migration statistics
@@ -76,7 +128,8 @@ def migrate_metadata_keys(meta: Dict[str, Any], dry_run: bool = False) -> Dict[s
         'errors': []
     }
     
-    incorrectly_keyed = identify_incorrectly_keyed_items(meta)
+    if incorrectly_keyed is None:
+        incorrectly_keyed = identify_incorrectly_keyed_items(meta)
     
     for item in incorrectly_keyed:
         custom_id = item['custom_id']
@@ -85,15 +138,14 @@ def migrate_metadata_keys(meta: Dict[str, Any], dry_run: bool = False) -> Dict[s
         
         try:
             if not dry_run:
-                # Copy metadata from FAISS ID key to custom ID key
-                meta[custom_id] = meta[faiss_id_str].copy()
+                # Move the metadata from the FAISS ID key to the custom ID key
+                item_meta = meta.pop(faiss_id_str)
                 
                 # Ensure the 'id' field in metadata matches the custom_id
-                if 'id' in meta[custom_id]:
-                    meta[custom_id]['id'] = custom_id
+                if 'id' in item_meta:
+                    item_meta['id'] = custom_id
                 
-                # Remove the old FAISS ID key
-                del meta[faiss_id_str]
+                meta[custom_id] = item_meta
                 
                 # Verify the migration
                 if custom_id in meta and faiss_id_str not in meta:
@@ -173,12 +225,16 @@ def main():
         
         logging.info(f"Loading metadata from: {meta_path}")
         
-        # Load current metadata
-        with open(meta_path, 'r', encoding='utf-8') as f:
-            meta = json.load(f)
-        
-        # Identify items that need migration
-        incorrectly_keyed = identify_incorrectly_keyed_items(meta)
+        if args.dry_run and ijson is not None:
+            # A dry run only reports, so the metadata is streamed rather than loaded
+            meta = None
+            incorrectly_keyed = identify_incorrectly_keyed_items_streaming(meta_path)
+        else:
+            # Load current metadata (orjson when installed, as the vector store does)
+            meta = _json_loads(meta_path.read_bytes())
+            
+            # Identify items that need migration
+            incorrectly_keyed = identify_incorrectly_keyed_items(meta)
         
         if not incorrectly_keyed:
             logging.info("No incorrectly keyed metadata found. Migration not needed.")
@@ -191,12 +247,7 @@ def main():
         
         if args.dry_run:
             logging.info("\n=== DRY RUN MODE - No changes will be made ===")
-            stats = migrate_metadata_keys(meta, dry_run=True)
-            logging.info(f"Would migrate {stats['items_migrated']} items")
-            if stats['errors']:
-                logging.warning(f"Would encounter {len(stats['errors'])} errors:")
-                for error in stats['errors']:
-                    logging.warning(f"  {error}")
+            logging.info(f"Would migrate {len(incorrectly_keyed)} items")
             return 0
         
         # Create backup unless explicitly disabled
@@ -206,11 +257,11 @@ def main():
         
         # Perform migration
         logging.info("Starting migration...")
-        stats = migrate_metadata_keys(meta, dry_run=False)
+        stats = migrate_metadata_keys(meta, dry_run=False, incorrectly_keyed=incorrectly_keyed)
         
-        # Save migrated metadata
-        with open(meta_path, 'w', encoding='utf-8') as f:
-            json.dump(meta, f, ensure_ascii=False, indent=2)
+        # Save migrated metadata the way the vector store does: compact and atomically replaced
+        data = _json_dumps(meta)
+        _replace_file(meta_path, lambda tmp_path: tmp_path.write_bytes(data))
         
         # Report results
         logging.info(f"Migration completed successfully!")
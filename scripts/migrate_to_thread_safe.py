@@ -7,7 +7,9 @@ import os
 import re
 import pathlib
 import logging
-from typing import List, Tuple
+import functools
+import concurrent.futures
+from typing import List, Optional, Tuple
 
 logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
 
@@ -49,87 +51,75 @@ def find_python_files(root_dir: pathlib.Path) -> List[pathlib.Path]:
     return python_files
 
 
+# Every import style update_imports handles names memory_utils, so files
+# without this substring are skipped before decoding or running the patterns
+MEMORY_UTILS_NEEDLE = b'memory_utils'
+
+# from memory_utils / .memory_utils / scripts.memory_utils / memex.scripts.memory_utils import function
+FROM_IMPORT_PATTERN = re.compile(
+    r'from\s+(\.|scripts\.|memex\.scripts\.)?memory_utils\s+import\s+([^#\n]+)', re.MULTILINE
+)
+
+# import memory_utils / import scripts.memory_utils
+DIRECT_IMPORT_PATTERN = re.compile(r'^import\s+(?:scripts\.)?memory_utils\s*$', re.MULTILINE)
+
+
 def update_imports(file_path: pathlib.Path, dry_run: bool = False) -> List[str]:
     """Update imports in a Python file to use thread-safe versions."""
     changes = []
     
     try:
-        content = file_path.read_text(encoding='utf-8')
+        raw = file_path.read_bytes()
+        if MEMORY_UTILS_NEEDLE not in raw:
+            return changes
+        
+        content = raw.decode('utf-8')
         original_content = content
         
-        # Pattern to match various import styles
-        patterns = [
-            # from memory_utils import function
-            (r'from\s+(?:\.)?memory_utils\s+import\s+([^#\n]+)',
-             'from_import'),
-            # from scripts.memory_utils import function
-            (r'from\s+scripts\.memory_utils\s+import\s+([^#\n]+)',
-             'from_scripts_import'),
-            # from memex.scripts.memory_utils import function
-            (r'from\s+memex\.scripts\.memory_utils\s+import\s+([^#\n]+)',
-             'from_memex_import'),
-            # import memory_utils
-            (r'^import\s+memory_utils\s*$',
-             'direct_import'),
-            # import scripts.memory_utils
-            (r'^import\s+scripts\.memory_utils\s*$',
-             'scripts_import'),
-        ]
+        matches = list(FROM_IMPORT_PATTERN.finditer(content))
         
-        for pattern, import_type in patterns:
-            matches = list(re.finditer(pattern, content, re.MULTILINE))
+        for match in reversed(matches):  # Process in reverse to maintain positions
+            # Relative imports are rewritten as plain 'from memory_utils' imports
+            module_prefix = '' if match.group(1) in (None, '.') else match.group(1)
+            imports_str = match.group(2)
+            
+            # Parse the imported items
+            imports = [item.strip() for item in imports_str.split(',')]
+            
+            # Separate thread-safe functions from others
+            thread_safe_imports = []
+            other_imports = []
+            
+            for imp in imports:
+                # Handle 'as' aliases
+                base_name = imp.split(' as ')[0].strip()
+                
+                if base_name in THREAD_SAFE_FUNCTIONS:
+                    thread_safe_imports.append(imp)
+                else:
+                    other_imports.append(imp)
             
-            for match in reversed(matches):  # Process in reverse to maintain positions
-                if import_type in ['from_import', 'from_scripts_import', 'from_memex_import']:
-                    imports_str = match.group(1)
-                    
-                    # Parse the imported items
-                    imports = [item.strip() for item in imports_str.split(',')]
-                    
-                    # Separate thread-safe functions from others
-                    thread_safe_imports = []
-                    other_imports = []
-                    
-                    for imp in imports:
-                        # Handle 'as' aliases
-                        base_name = imp.split(' as ')[0].strip()
-                        
-                        if base_name in THREAD_SAFE_FUNCTIONS:
-                            thread_safe_imports.append(imp)
-                        else:
-                            other_imports.append(imp)
-                    
-                    if thread_safe_imports:
-                        # Build new import statements
-                        new_imports = []
-                        
-                        # Keep non-thread-safe imports from memory_utils
-                        if other_imports:
-                            if import_type == 'from_import':
-                                new_imports.append(f"from memory_utils import {', '.join(other_imports)}")
-                            elif import_type == 'from_scripts_import':
-                                new_imports.append(f"from scripts.memory_utils import {', '.join(other_imports)}")
-                            elif import_type == 'from_memex_import':
-                                new_imports.append(f"from memex.scripts.memory_utils import {', '.join(other_imports)}")
-                        
-                        # Add thread-safe imports
-                        if import_type == 'from_import':
-                            new_imports.append(f"from thread_safe_store import {', '.join(thread_safe_imports)}")
-                        elif import_type == 'from_scripts_import':
-                            new_imports.append(f"from scripts.thread_safe_store import {', '.join(thread_safe_imports)}")
-                        elif import_type == 'from_memex_import':
-                            new_imports.append(f"from memex.scripts.thread_safe_store import {', '.join(thread_safe_imports)}")
-                        
-                        # Replace the import
-                        new_import_line = '\n'.join(new_imports)
-                        content = content[:match.start()] + new_import_line + content[match.end():]
-                        
-                        changes.append(f"Updated import: {match.group(0)} -> {new_import_line}")
+            if thread_safe_imports:
+                # Build new import statements
+                new_imports = []
                 
-                elif import_type in ['direct_import', 'scripts_import']:
-                    # For direct imports, we need to check usage in the file
-                    # This is more complex and might need manual review
-                    changes.append(f"Warning: Direct import found that may need manual review: {match.group(0)}")
+                # Keep non-thread-safe imports from memory_utils
+                if other_imports:
+                    new_imports.append(f"from {module_prefix}memory_utils import {', '.join(other_imports)}")
+                
+                # Add thread-safe imports
+                new_imports.append(f"from {module_prefix}thread_safe_store import {', '.join(thread_safe_imports)}")
+                
+                # Replace the import
+                new_import_line = '\n'.join(new_imports)
+                content = content[:match.start()] + new_import_line + content[match.end():]
+                
+                changes.append(f"Updated import: {match.group(0)} -> {new_import_line}")
+        
+        for match in DIRECT_IMPORT_PATTERN.finditer(content):
+            # For direct imports, we need to check usage in the file
+            # This is more complex and might need manual review
+            changes.append(f"Warning: Direct import found that may need manual review: {match.group(0)}")
         
         # Check if there were any changes
         if content != original_content:
@@ -146,7 +136,26 @@ def update_imports(file_path: pathlib.Path, dry_run: bool = False) -> List[str]:
     return changes
 
 
-def main(dry_run: bool = False):
+def _update_all_imports(python_files: List[pathlib.Path], dry_run: bool, workers: int) -> List[List[str]]:
+    """
+    Run update_imports on every file, in a process pool when more than one worker is requested.
+    
+    Falls back to processing the files in this process when the pool cannot
+    be used; rewrites a broken pool already made are then missing from the
+    returned changes.
+    """
+    update = functools.partial(update_imports, dry_run=dry_run)
+    if workers > 1 and len(python_files) > 1:
+        try:
+            with concurrent.futures.ProcessPoolExecutor(max_workers=workers) as executor:
+                return list(executor.map(update, python_files, chunksize=32))
+        except (OSError, concurrent.futures.BrokenExecutor) as e:
+            logging.warning(f"Parallel migration unavailable ({e}); processing files sequentially.")
+    
+    return [update(file_path) for file_path in python_files]
+
+
+def main(dry_run: bool = False, workers: Optional[int] = None):
     """Main migration function."""
     # Find the memex root directory
     script_dir = pathlib.Path(__file__).resolve().parent
@@ -161,8 +170,9 @@ def main(dry_run: bool = False):
     
     # Process each file
     all_changes = []
-    for file_path in python_files:
-        changes = update_imports(file_path, dry_run)
+    if workers is None:
+        workers = os.cpu_count() or 1
+    for file_path, changes in zip(python_files, _update_all_imports(python_files, dry_run, workers)):
         if changes:
             all_changes.extend([(file_path, change) for change in changes])
     
@@ -190,6 +200,7 @@ if __name__ == "__main__":
     
     parser = argparse.ArgumentParser(description="Migrate to thread-safe vector store operations")
     parser.add_argument("--dry-run", action="store_true", help="Show what would be changed without making changes")
+    parser.add_argument("--workers", type=int, default=None, help="Number of processes to use (default: CPU count)")
     
     args = parser.parse_args()
-    main(dry_run=args.dry_run)
\ No newline at end of file
+    main(dry_run=args.dry_run, workers=args.workers)
\ No newline at end of file
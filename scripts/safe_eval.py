@@ -5,8 +5,10 @@ This module provides a restricted evaluator that only allows safe operations
 on metadata dictionaries, preventing code injection attacks.
 """
 import ast
+import functools
 import operator
 import logging
+from types import CodeType
 from typing import Any, Dict, Optional
 
 # Define allowed operators
@@ -70,10 +72,115 @@ ALLOWED_CONTAINER_METHODS = {
 }
 
 
-class SafeEvaluator(ast.NodeVisitor):
+# Block access to dangerous attributes that could lead to code execution;
+# any other attribute starting with an underscore is refused as well
+DANGEROUS_ATTRIBUTES = {
+    '__class__', '__bases__', '__mro__', '__subclasses__',
+    '__globals__', '__locals__', '__dict__', '__getattribute__',
+    '__setattr__', '__delattr__', '__import__', '__builtins__',
+    '__code__', '__func_globals__', '__func_closure__'
+}
+
+# AST node types an expression may consist of (operators are checked against ALLOWED_OPERATORS)
+_ALLOWED_NODES = (
+    ast.Expression, ast.BoolOp, ast.UnaryOp, ast.Compare, ast.BinOp,
+    ast.Call, ast.Attribute, ast.Subscript, ast.Name, ast.Load,
+    ast.Constant, ast.List, ast.Tuple, ast.Dict,
+)
+
+_OPERATOR_NODES = (ast.boolop, ast.unaryop, ast.cmpop, ast.operator)
+
+# Global name under which compiled expressions reach _checked_method
+_METHOD_GUARD = '__safe_method__'
+
+
+def validate_ast(tree: ast.AST) -> None:
+    """
+    Check that a parsed expression only uses allowed operations.
+    
+    Args:
+        tree: The expression's AST, as returned by ast.parse(expression, mode='eval')
+        
+    Raises:
+        ValueError: If the expression contains unsafe operations
     """
-    A safe AST evaluator that only allows specific operations.
+    # Attributes that are called as methods; ast.walk reaches each Call before its func
+    method_funcs = set()
+    for node in ast.walk(tree):
+        if isinstance(node, _OPERATOR_NODES):
+            if type(node) not in ALLOWED_OPERATORS:
+                raise ValueError(f"Unsupported operator: {type(node).__name__}")
+        elif isinstance(node, ast.keyword):
+            # A keyword such as key= could hand a bound method to a builtin unchecked
+            raise ValueError("Keyword arguments are not allowed")
+        elif not isinstance(node, _ALLOWED_NODES):
+            raise ValueError(f"Unsupported operation: {type(node).__name__}")
+        elif isinstance(node, ast.Call):
+            if isinstance(node.func, ast.Name):
+                if node.func.id not in ALLOWED_BUILTINS:
+                    raise ValueError(f"Function '{node.func.id}' is not allowed")
+            elif isinstance(node.func, ast.Attribute):
+                method_name = node.func.attr
+                if method_name not in ALLOWED_STRING_METHODS and method_name not in ALLOWED_CONTAINER_METHODS:
+                    raise ValueError(f"Method '{method_name}' is not allowed")
+                method_funcs.add(id(node.func))
+            elif isinstance(node.func, ast.Lambda):
+                raise ValueError("Unsupported operation: lambda functions are not allowed")
+            else:
+                raise ValueError("Complex function calls are not allowed")
+        elif isinstance(node, ast.Attribute):
+            if node.attr in DANGEROUS_ATTRIBUTES or node.attr.startswith('_'):
+                raise ValueError(f"Access to attribute '{node.attr}' is not allowed for security reasons")
+            if id(node) not in method_funcs:
+                # Only obj.method(...) calls are checked against the receiver's type
+                raise ValueError(f"Attribute '{node.attr}' may only be used as a method call")
+        elif isinstance(node, ast.Dict) and None in node.keys:
+            raise ValueError("Unsupported operation: dict unpacking")
+
+
+def _checked_method(obj: Any, method_name: str) -> Any:
+    """Return obj's method if it is allowed for obj's type."""
+    if isinstance(obj, str) and method_name in ALLOWED_STRING_METHODS:
+        return getattr(obj, method_name)
+    if isinstance(obj, (dict, list)) and method_name in ALLOWED_CONTAINER_METHODS:
+        return getattr(obj, method_name)
+    raise ValueError(f"Method '{method_name}' is not allowed for {type(obj).__name__}")
+
+
+class _GuardMethodCalls(ast.NodeTransformer):
+    """Rewrite obj.method(...) as __safe_method__(obj, 'method')(...)."""
+    
+    def visit_Call(self, node):
+        self.generic_visit(node)
+        if isinstance(node.func, ast.Attribute):
+            guard = ast.Name(id=_METHOD_GUARD, ctx=ast.Load())
+            node.func = ast.copy_location(
+                ast.Call(func=guard, args=[node.func.value, ast.Constant(node.func.attr)], keywords=[]),
+                node.func
+            )
+        return node
+
+
+# Compiled expressions see no builtins; ALLOWED_BUILTINS are passed with the variables
+_EVAL_GLOBALS = {'__builtins__': {}, _METHOD_GUARD: _checked_method}
+
+
+@functools.lru_cache(maxsize=256)
+def _compile_cached(expression: str) -> CodeType:
+    """Vet and compile an expression once; a filter is evaluated for every metadata item."""
+    tree = ast.parse(expression, mode='eval')
+    validate_ast(tree)
+    tree = ast.fix_missing_locations(_GuardMethodCalls().visit(tree))
+    return compile(tree, '<safe_eval>', 'eval')
+
+
+class SafeEvaluator:
+    """
+    A safe expression evaluator that only allows specific operations.
     Prevents arbitrary code execution while allowing useful filter expressions.
+    
+    Expressions are checked once by validate_ast() and then run as compiled
+    bytecode that can only reach the given variables and ALLOWED_BUILTINS.
     """
     
     def __init__(self, variables: Dict[str, Any]):
@@ -84,7 +191,6 @@ class SafeEvaluator(ast.NodeVisitor):
             variables: Dictionary of variable names to their values
         """
         self.variables = variables
-        self.stack = []
     
     def evaluate(self, expression: str) -> Any:
         """
@@ -101,190 +207,14 @@ class SafeEvaluator(ast.NodeVisitor):
             SyntaxError: If the expression has invalid syntax
         """
         try:
-            # Parse the expression into an AST
-            tree = ast.parse(expression, mode='eval')
-            
-            # Evaluate the AST
-            return self.visit(tree.body)
+            code = _compile_cached(expression)
+            # Allowed builtins take precedence, so call targets are always the vetted functions
+            return eval(code, _EVAL_GLOBALS, {**self.variables, **ALLOWED_BUILTINS})
             
         except SyntaxError as e:
             raise SyntaxError(f"Invalid expression syntax: {e}")
         except Exception as e:
             raise ValueError(f"Error evaluating expression: {e}")
-    
-    def visit_Expression(self, node):
-        """Visit an Expression node."""
-        return self.visit(node.body)
-    
-    def visit_BoolOp(self, node):
-        """Visit a boolean operation (and/or)."""
-        op = ALLOWED_OPERATORS.get(type(node.op))
-        if op is None:
-            raise ValueError(f"Unsupported boolean operator: {type(node.op).__name__}")
-        
-        # Evaluate all values
-        values = [self.visit(val) for val in node.values]
-        
-        # Apply the operator
-        result = values[0]
-        for val in values[1:]:
-            result = op(result, val)
-        return result
-    
-    def visit_UnaryOp(self, node):
-        """Visit a unary operation (not, -, +)."""
-        op = ALLOWED_OPERATORS.get(type(node.op))
-        if op is None:
-            raise ValueError(f"Unsupported unary operator: {type(node.op).__name__}")
-        
-        operand = self.visit(node.operand)
-        return op(operand)
-    
-    def visit_Compare(self, node):
-        """Visit a comparison operation."""
-        left = self.visit(node.left)
-        
-        for op, comparator in zip(node.ops, node.comparators):
-            op_func = ALLOWED_OPERATORS.get(type(op))
-            if op_func is None:
-                raise ValueError(f"Unsupported comparison operator: {type(op).__name__}")
-            
-            right = self.visit(comparator)
-            
-            # Perform the comparison
-            if not op_func(left, right):
-                return False
-            
-            # For chained comparisons
-            left = right
-        
-        return True
-    
-    def visit_BinOp(self, node):
-        """Visit a binary operation."""
-        op = ALLOWED_OPERATORS.get(type(node.op))
-        if op is None:
-            raise ValueError(f"Unsupported binary operator: {type(node.op).__name__}")
-        
-        left = self.visit(node.left)
-        right = self.visit(node.right)
-        
-        return op(left, right)
-    
-    def visit_Call(self, node):
-        """Visit a function call."""
-        # Get the function name
-        if isinstance(node.func, ast.Name):
-            func_name = node.func.id
-            if func_name in ALLOWED_BUILTINS:
-                func = ALLOWED_BUILTINS[func_name]
-                args = [self.visit(arg) for arg in node.args]
-                return func(*args)
-            else:
-                raise ValueError(f"Function '{func_name}' is not allowed")
-        
-        # Handle method calls (e.g., string.lower())
-        elif isinstance(node.func, ast.Attribute):
-            obj = self.visit(node.func.value)
-            method_name = node.func.attr
-            
-            # Check if the method is allowed based on the object type
-            if isinstance(obj, str) and method_name in ALLOWED_STRING_METHODS:
-                method = getattr(obj, method_name)
-                args = [self.visit(arg) for arg in node.args]
-                return method(*args)
-            elif isinstance(obj, (dict, list)) and method_name in ALLOWED_CONTAINER_METHODS:
-                method = getattr(obj, method_name)
-                args = [self.visit(arg) for arg in node.args]
-                return method(*args)
-            else:
-                raise ValueError(f"Method '{method_name}' is not allowed for {type(obj).__name__}")
-        
-        # Handle lambda functions specifically
-        elif isinstance(node.func, ast.Lambda):
-            raise ValueError("Unsupported operation: lambda functions are not allowed")
-        
-        else:
-            raise ValueError("Complex function calls are not allowed")
-    
-    def visit_Attribute(self, node):
-        """Visit an attribute access (e.g., obj.attr)."""
-        obj = self.visit(node.value)
-        
-        # Block access to dangerous attributes that could lead to code execution
-        dangerous_attrs = {
-            '__class__', '__bases__', '__mro__', '__subclasses__',
-            '__globals__', '__locals__', '__dict__', '__getattribute__',
-            '__setattr__', '__delattr__', '__import__', '__builtins__',
-            '__code__', '__func_globals__', '__func_closure__'
-        }
-        
-        if node.attr in dangerous_attrs:
-            raise ValueError(f"Access to attribute '{node.attr}' is not allowed for security reasons")
-        
-        # Only allow attribute access on dictionaries using dot notation
-        # This is mainly for convenience, as dict.get() is preferred
-        if hasattr(obj, node.attr):
-            return getattr(obj, node.attr)
-        else:
-            raise AttributeError(f"Object has no attribute '{node.attr}'")
-    
-    def visit_Subscript(self, node):
-        """Visit a subscript operation (e.g., obj[key])."""
-        obj = self.visit(node.value)
-        
-        if isinstance(node.slice, ast.Index):
-            # Python < 3.9 compatibility
-            key = self.visit(node.slice.value)
-        else:
-            key = self.visit(node.slice)
-        
-        try:
-            return obj[key]
-        except (KeyError, IndexError, TypeError) as e:
-            raise ValueError(f"Invalid subscript access: {e}")
-    
-    def visit_Name(self, node):
-        """Visit a variable name."""
-        if node.id in self.variables:
-            return self.variables[node.id]
-        else:
-            raise NameError(f"Variable '{node.id}' is not defined")
-    
-    def visit_Constant(self, node):
-        """Visit a constant value."""
-        return node.value
-    
-    # For Python 3.7 compatibility
-    def visit_Num(self, node):
-        """Visit a number."""
-        return node.n
-    
-    def visit_Str(self, node):
-        """Visit a string."""
-        return node.s
-    
-    def visit_NameConstant(self, node):
-        """Visit a name constant (True, False, None)."""
-        return node.value
-    
-    def visit_List(self, node):
-        """Visit a list literal."""
-        return [self.visit(elt) for elt in node.elts]
-    
-    def visit_Tuple(self, node):
-        """Visit a tuple literal."""
-        return tuple(self.visit(elt) for elt in node.elts)
-    
-    def visit_Dict(self, node):
-        """Visit a dict literal."""
-        keys = [self.visit(k) for k in node.keys]
-        values = [self.visit(v) for v in node.values]
-        return dict(zip(keys, values))
-    
-    def generic_visit(self, node):
-        """Called for nodes that don't have a specific visit method."""
-        raise ValueError(f"Unsupported operation: {type(node).__name__}")
 
 
 def safe_eval(expression: str, variables: Dict[str, Any]) -> Any:
@@ -329,8 +259,8 @@ def validate_expression(expression: str) -> Optional[str]:
         None if valid, error message if invalid
     """
     try:
-        # Try to parse the expression
-        ast.parse(expression, mode='eval')
+        # Try to parse and vet the expression
+        _compile_cached(expression)
         
         # Try to evaluate with a dummy meta_item
         dummy_meta = {
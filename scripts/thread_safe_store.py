@@ -10,7 +10,7 @@ import logging
 import functools
 import time
 import os
-from typing import Any, Callable, Dict, Optional, Tuple
+from typing import Any, Callable, Dict, List, Optional, Sequence, Tuple, Union
 from contextlib import contextmanager
 import filelock
 import pathlib
@@ -19,9 +19,13 @@ import pathlib
 try:
     from memory_utils import (
         add_or_replace as _add_or_replace,
+        add_or_replace_batch as _add_or_replace_batch,
+        deferred_saves as _deferred_saves,
+        flush_index as _flush_index,
         delete_vector as _delete_vector,
         delete_vectors_by_filter as _delete_vectors_by_filter,
         search as _search,
+        search_batch as _search_batch,
         count_items as _count_items,
         save_index as _save_index,
         load_index as _load_index,
@@ -31,9 +35,13 @@ try:
 except ImportError:
     from .memory_utils import (
         add_or_replace as _add_or_replace,
+        add_or_replace_batch as _add_or_replace_batch,
+        deferred_saves as _deferred_saves,
+        flush_index as _flush_index,
         delete_vector as _delete_vector,
         delete_vectors_by_filter as _delete_vectors_by_filter,
         search as _search,
+        search_batch as _search_batch,
         count_items as _count_items,
         save_index as _save_index,
         load_index as _load_index,
@@ -181,6 +189,15 @@ def add_or_replace(id_: int | str, text: str, metadata: dict):
     return _add_or_replace(id_, text, metadata)
 
 
+@with_write_lock
+def add_or_replace_batch(items: List[Tuple[int | str, str, dict]]):
+    """
+    Thread-safe version of add_or_replace_batch.
+    Adds or replaces several vectors with one embedding pass and one save.
+    """
+    return _add_or_replace_batch(items)
+
+
 @with_write_lock
 def delete_vector(id_: int | str):
     """
@@ -208,6 +225,17 @@ def search(query: str, top_k: int = 5, pred: Optional[Callable[[dict], bool]] =
     return _search(query, top_k, pred, offset)
 
 
+@with_read_lock
+def search_batch(queries: List[str], top_k: int = 5,
+                 pred: Union[Callable[[dict], bool], Sequence[Optional[Callable[[dict], bool]]], None] = None,
+                 offset: int = 0):
+    """
+    Thread-safe version of search_batch.
+    Search for several texts with a single embedding pass.
+    """
+    return _search_batch(queries, top_k, pred, offset)
+
+
 @with_read_lock
 def count_items(pred: Optional[Callable[[dict], bool]] = None) -> int:
     """
@@ -235,6 +263,27 @@ def save_index(index: Any, meta: dict) -> bool:
     return _save_index(index, meta)
 
 
+@contextmanager
+def deferred_saves():
+    """
+    Thread-safe version of deferred_saves.
+    Holds the write lock for the whole block, so other threads and processes
+    never read or overwrite the store while its writes are still pending.
+    """
+    with _vector_store_lock.write_lock():
+        with _deferred_saves():
+            yield
+
+
+@with_write_lock
+def flush_index() -> bool:
+    """
+    Thread-safe version of flush_index.
+    Write a save deferred by deferred_saves() now.
+    """
+    return _flush_index()
+
+
 def get_lock_stats() -> Dict[str, Any]:
     """Get statistics about vector store lock usage."""
     return _vector_store_lock.get_stats()
@@ -293,6 +342,7 @@ try:
         load_cfg,
         load_preferences,
         index_code_chunk,
+        index_code_chunks_batch,
         delete_code_chunks,
         generate_chunk_id,
         check_vector_store_integrity,
@@ -309,6 +359,7 @@ except ImportError:
         load_cfg,
         load_preferences,
         index_code_chunk,
+        index_code_chunks_batch,
         delete_code_chunks,
         generate_chunk_id,
         check_vector_store_integrity,
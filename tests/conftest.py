@@ -62,13 +62,17 @@ def comments_only_tasks_path(fixture_path):
 @pytest.fixture
 def mock_sentence_transformer():
     """Mock the SentenceTransformer class where it is used in memory_utils."""
-    # Target where SentenceTransformer is looked up in memory_utils.py
-    with patch("scripts.memory_utils.SentenceTransformer") as mock_st_class:
+    # Target where SentenceTransformer is looked up in memory_utils.py (on its lazily imported module)
+    with patch("scripts.memory_utils.sentence_transformers.SentenceTransformer") as mock_st_class:
         mock_instance = mock_st_class.return_value
         # Configure the mock instance, e.g., encode, get_sentence_embedding_dimension
         mock_instance.encode.return_value = np.array([0.1, 0.2, 0.3, 0.4], dtype=np.float32)
         mock_instance.get_sentence_embedding_dimension.return_value = 4 # Consistent small dimension for tests
+        # Vectors cached by embed() must come from this mock, not an earlier model
+        from scripts import memory_utils
+        memory_utils.embed.cache_clear()
         yield mock_st_class # Yield the mock class itself
+        memory_utils.embed.cache_clear()
 
 
 @pytest.fixture
@@ -225,6 +225,21 @@ class TestIndexCodebase(unittest.TestCase):
         self.assertIn("python function 'test_function'", args[1])
         self.assertEqual(args[2], metadata)
     
+    @mock.patch('memex.scripts.memory_utils.add_or_replace')
+    def test_index_code_chunk_without_header(self, mock_add_or_replace):
+        """Test that files.embed_chunk_header = false embeds only the chunk content."""
+        from ..scripts import memory_utils
+        
+        content = "def test_function():\n    return 'test'"
+        metadata = {"source_file": "test.py", "language": "python", "start_line": 1, "end_line": 2}
+        
+        with mock.patch.object(memory_utils, 'load_cfg', return_value={"files": {"embed_chunk_header": False}}):
+            memory_utils.index_code_chunk("test:chunk:id", content, metadata)
+        
+        self.assertEqual(mock_add_or_replace.call_args[0][1], content)
+        self.assertEqual(metadata["type"], "code_chunk")
+        self.assertEqual(metadata["content"], content)
+    
     def test_chunk_empty_file(self):
         """Test chunking an empty file."""
         # Create empty file
@@ -332,7 +347,167 @@ def valid_function():
         # Should not include excluded directories
         self.assertNotIn("package.js", file_names)
         self.assertNotIn("config", file_names)
-    
+
+    def test_compile_pattern_is_cached(self):
+        """Test that glob patterns are compiled once and match like the old matcher."""
+        from ..scripts.index_codebase import _compile_pattern, _matches_pattern
+
+        self.assertIs(_compile_pattern("src/**/*"), _compile_pattern("src/**/*"))
+
+        self.assertTrue(_matches_pattern("src/pkg/mod.py", "src/**/*"))
+        self.assertFalse(_matches_pattern("srcx/mod.py", "src/**/*"))
+        self.assertTrue(_matches_pattern("pkg/mod.py", "**/*.py"))
+        self.assertTrue(_matches_pattern("README.md", "*.md"))
+        self.assertTrue(_matches_pattern(".DS_Store", ".DS_Store"))
+        self.assertFalse(_matches_pattern("a/.DS_Store", ".DS_Store"))
+
+    def test_pattern_fast_paths_match_regex_semantics(self):
+        """Test that structural fast paths agree with the regex translation."""
+        from ..scripts.index_codebase import _matches_pattern
+
+        self.assertTrue(_matches_pattern("x/y.log", "**/*.log"))
+        self.assertFalse(_matches_pattern("y.log", "**/*.log"))
+        self.assertTrue(_matches_pattern("a/node_modules/b.js", "**/node_modules/**"))
+        self.assertFalse(_matches_pattern("node_modules/b.js", "**/node_modules/**"))
+
+    def test_walk_yields_posix_relative_paths(self):
+        """Test that the walker normalizes separators once, when building paths."""
+        from ..scripts.index_codebase import _walk_relative_files, _compile_pattern
+
+        root = pathlib.Path(self.temp_dir)
+        (root / "pkg" / "sub").mkdir(parents=True)
+        (root / "pkg" / "sub" / "mod.py").write_text("x = 1")
+        (root / "pkg" / "skip").mkdir()
+        (root / "pkg" / "skip" / "gone.py").write_text("y = 2")
+
+        paths = list(_walk_relative_files(root, [_compile_pattern("pkg/skip")]))
+
+        self.assertEqual(paths, ["pkg/sub/mod.py"])
+
+    def test_split_dir_excludes(self):
+        """Test that whole-directory excludes are turned into set lookups."""
+        from ..scripts.index_codebase import _split_dir_excludes
+
+        names, paths, remaining = _split_dir_excludes(
+            ["**/node_modules/**", "venv/**/*", "lib/python*/site-packages/**/*", "**/*.log"]
+        )
+
+        self.assertEqual(names, frozenset({"node_modules"}))
+        self.assertEqual(paths, frozenset({"venv"}))
+        self.assertEqual(remaining, ["lib/python*/site-packages/**/*", "**/*.log"])
+
+    def test_index_file_commits_in_bounded_batches(self):
+        """Test that index_file streams chunks to the store in fixed-size batches."""
+        from ..scripts import index_codebase
+
+        txt_file = pathlib.Path(self.temp_dir) / "notes.txt"
+        txt_file.write_text("\n".join(f"line {i}" for i in range(40)))
+        cfg = {"files": {"min_chunk_lines": 1, "max_chunk_lines": 5}}
+        expected = len(index_codebase.chunk_file(txt_file, cfg))
+
+        batch_sizes = []
+        def fake_batch(batch):
+            batch_sizes.append(len(batch))
+            return [chunk_id for chunk_id, _, _ in batch]
+
+        with mock.patch.object(index_codebase, "index_code_chunks_batch", side_effect=fake_batch), \
+             mock.patch.object(index_codebase, "_COMMIT_BATCH_CHUNKS", 2):
+            added = index_codebase.index_file(txt_file, cfg)
+
+        self.assertEqual(added, expected)
+        self.assertEqual(sum(batch_sizes), expected)
+        self.assertTrue(all(size <= 2 for size in batch_sizes))
+
+    def test_index_codebase_is_incremental(self):
+        """Test that unchanged files are skipped and stale chunks removed."""
+        from ..scripts import index_codebase
+
+        root = pathlib.Path(self.temp_dir) / "project"
+        (root / "src").mkdir(parents=True)
+        vec_dir = pathlib.Path(self.temp_dir) / "vecstore"
+        vec_dir.mkdir()
+        (root / "src" / "a.py").write_text("def a():\n    return 1\n")
+        (root / "src" / "b.py").write_text("def b():\n    return 2\n")
+
+        store = {}
+        def fake_batch(batch):
+            for chunk_id, _, chunk in batch:
+                store[chunk_id] = dict(chunk, id=chunk_id)
+            return [chunk_id for chunk_id, _, _ in batch]
+        def fake_delete(pred):
+            doomed = [k for k, v in store.items() if pred(v)]
+            for k in doomed:
+                del store[k]
+            return len(doomed), 0, len(doomed)
+
+        cfg = {"files": {"include": ["**/*.py"], "exclude": [], "index_workers": 1}}
+        with mock.patch.object(index_codebase, "load_cfg", return_value=cfg), \
+             mock.patch.object(index_codebase, "ROOT", root), \
+             mock.patch.object(index_codebase, "get_vec_dir", return_value=vec_dir), \
+             mock.patch.object(index_codebase, "load_index", return_value=(None, store)), \
+             mock.patch.object(index_codebase, "index_code_chunks_batch", side_effect=fake_batch), \
+             mock.patch.object(index_codebase, "delete_vectors_by_filter", side_effect=fake_delete):
+            self.assertEqual(index_codebase.index_codebase(), 2)
+            self.assertEqual(index_codebase.index_codebase(), 0)
+
+            (root / "src" / "b.py").unlink()
+            self.assertEqual(index_codebase.index_codebase(), 0)
+
+        self.assertEqual([v["source_file"] for v in store.values()], [str(root / "src" / "a.py")])
+
+    def test_index_codebase_retries_after_failed_store_write(self):
+        """Test that chunks whose store write failed are written by the next run."""
+        import numpy as np
+        from ..scripts import index_codebase, memory_utils
+
+        root = pathlib.Path(self.temp_dir) / "project"
+        (root / "src").mkdir(parents=True)
+        vec_dir = pathlib.Path(self.temp_dir) / "vecstore"
+        vec_dir.mkdir()
+        (root / "src" / "a.py").write_text("def a():\n    return 1\n")
+        (root / "src" / "b.py").write_text("def b():\n    return 2\n")
+
+        def empty_store():
+            return memory_utils.faiss.IndexIDMap(memory_utils.faiss.IndexFlatIP(8)), {"_custom_to_faiss_id_map_": {}}
+
+        # IndexManager stand-in: invalidate() drops the cached copy, like a re-read of the unchanged files
+        cached = [empty_store()]
+        manager = mock.Mock()
+        manager.get_index_and_meta.side_effect = lambda **kwargs: cached[0]
+        manager.invalidate.side_effect = lambda *args: cached.__setitem__(0, empty_store())
+
+        fail_writes = True
+        written = []
+        def fake_write(index, meta):
+            if fail_writes:
+                return False
+            written.append((index.ntotal, sorted(k for k in meta if not k.startswith("_"))))
+            return True
+
+        cfg = {"files": {"include": ["**/*.py"], "exclude": [], "index_workers": 1}}
+        self.addCleanup(setattr, memory_utils, "_pending_save", None)
+        with mock.patch.object(index_codebase, "load_cfg", return_value=cfg), \
+             mock.patch.object(index_codebase, "ROOT", root), \
+             mock.patch.object(index_codebase, "get_vec_dir", return_value=vec_dir), \
+             mock.patch.object(memory_utils, "load_cfg", return_value=cfg), \
+             mock.patch.object(memory_utils, "_index_manager", manager), \
+             mock.patch.object(memory_utils, "_use_index_mmap", return_value=False), \
+             mock.patch.object(memory_utils, "_write_index", side_effect=fake_write), \
+             mock.patch.object(memory_utils, "embed_batch",
+                               side_effect=lambda texts: np.ones((len(texts), 8), dtype=np.float32)):
+            index_codebase.index_codebase()
+            self.assertEqual(written, [])
+            self.assertEqual(list(vec_dir.iterdir()), [])  # No manifest either
+
+            fail_writes = False
+            self.assertEqual(index_codebase.index_codebase(), 2)
+
+        self.assertEqual(len(written), 1)
+        ntotal, chunk_ids = written[0]
+        self.assertEqual(ntotal, 2)
+        self.assertEqual(len(chunk_ids), 2)
+        self.assertNotEqual(list(vec_dir.iterdir()), [])
+
     def test_chunk_metadata_generation(self):
         """Test that chunk metadata is correctly generated."""
         # Python file with various elements
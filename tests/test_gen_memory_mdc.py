@@ -3,7 +3,7 @@ from unittest.mock import patch, MagicMock, mock_open
 import os
 import json
 
-from scripts.gen_memory_mdc import make, _formulate_query_from_active_tasks
+from scripts.gen_memory_mdc import make, _formulate_query_from_active_tasks, _has_context_body
 
 
 def test_formulate_query_from_active_tasks():
@@ -81,6 +81,8 @@ def test_make_function_success(mock_load_cfg, mock_load_preferences,
     # Verify success
     assert success is True
     assert "memory.mdc" in path
+    # The task-derived query is searched once
+    mock_search.assert_called_once()
     assert (tmp_path / ".cursor" / "rules" / "memory.mdc").exists()
 
 
@@ -115,4 +117,13 @@ def test_formulate_query_with_notes():
     # Only the last note is included
     assert "Review logs" in query
     # First note should not be included
-    assert "Check error handling" not in query
\ No newline at end of file
+    assert "Check error handling" not in query
+
+
+def test_has_context_body_checks_type_specific_field():
+    """Context items with blank bodies are recognised per item type"""
+    assert _has_context_body({"type": "snippet", "raw_content": "print(1)"})
+    assert not _has_context_body({"type": "snippet", "content": "ignored", "raw_content": "  "})
+    assert _has_context_body({"type": "note", "text": "Remember this"})
+    assert not _has_context_body({"type": "note", "text": ""})
+    assert not _has_context_body({"type": "code_chunk", "content": "\n\t"})
@@ -0,0 +1,91 @@
+import pytest
+from types import SimpleNamespace
+from unittest.mock import patch, MagicMock
+
+from scripts.gen_memory_mdc_preview import (
+    preview_context,
+    preview_context_eager,
+    format_preview_markdown,
+    count_tokens,
+)
+
+
+def _make_task_store():
+    """Build a TaskStore stand-in with one focus task and two active tasks."""
+    ts = MagicMock()
+    ts.tasks = [
+        SimpleNamespace(id=1, title="Focus task", status="in_progress", priority="high",
+                        progress=50, description="Main work", plan=["Step A"], notes=[]),
+        SimpleNamespace(id=2, title="Other task", status="todo", priority="low"),
+        SimpleNamespace(id=3, title="Finished task", status="done", priority="high"),
+    ]
+    return ts
+
+
+def _fake_search(query, top_k=5, pred=None):
+    items = [
+        ({"id": "s1", "type": "snippet", "title": "Snippet", "content": "x = 1", "language": "python"}, 0.9),
+        ({"id": "n1", "type": "note", "title": "Note", "content": "remember"}, 0.8),
+        ({"id": "c1", "type": "code_chunk", "file_path": "app.py", "content": "def f(): pass"}, 0.7),
+    ]
+    return [(meta, score) for meta, score in items if pred is None or pred(meta)][:top_k]
+
+
+def _fake_search_batch(queries, top_k=5, pred=None, offset=0):
+    preds = pred if isinstance(pred, list) else [pred] * len(queries)
+    return [_fake_search(query, top_k, p) for query, p in zip(queries, preds)]
+
+
+@pytest.fixture
+def preview_env():
+    with patch('scripts.gen_memory_mdc_preview.load_cfg', return_value={}), \
+         patch('scripts.gen_memory_mdc_preview.load_preferences', return_value={}), \
+         patch('scripts.gen_memory_mdc_preview.TaskStore', return_value=_make_task_store()), \
+         patch('scripts.gen_memory_mdc_preview.search_batch', side_effect=_fake_search_batch) as mock_search_batch:
+        yield mock_search_batch
+
+
+def test_preview_context_yields_items_in_section_order(preview_env):
+    kinds = [kind for kind, _, _ in preview_context(task_id="1")]
+    assert kinds == ['task', 'active_task', 'snippet', 'note', 'code_chunk']
+    # All three item types come from one batched search
+    assert preview_env.call_count == 1
+
+
+def test_preview_context_searches_lazily(preview_env):
+    items = preview_context(task_id="1")
+    # Consuming only the task sections must not touch the vector store
+    assert next(items)[0] == 'task'
+    assert next(items)[0] == 'active_task'
+    assert preview_env.call_count == 0
+
+
+def test_preview_context_eager_matches_legacy_shape(preview_env):
+    result = preview_context_eager(task_id="1")
+
+    assert result['success'] is True
+    assert result['task']['title'] == "Focus task"
+    assert [t['title'] for t in result['tasks']] == ["Other task"]
+    assert [s['id'] for s in result['snippets']] == ["s1"]
+    assert [n['id'] for n in result['notes']] == ["n1"]
+    assert [c['id'] for c in result['code_chunks']] == ["c1"]
+    assert result['stats']['total_items'] == 4
+
+
+def test_format_preview_markdown_accepts_dict_and_stream(preview_env):
+    from_dict = format_preview_markdown(preview_context_eager(task_id="1"))
+    from_stream = format_preview_markdown(preview_context(task_id="1"))
+
+    assert from_dict == from_stream
+    assert "## 🎯 Current Task" in from_stream
+    assert "## 💾 Relevant Code Snippets" in from_stream
+    assert "**app.py**" in from_stream
+
+
+def test_format_preview_markdown_reports_failure():
+    assert format_preview_markdown({'success': False, 'error': 'boom'}) == "❌ Error: boom"
+
+
+def test_count_tokens_empty_text_is_zero():
+    assert count_tokens("") == 0
+    assert count_tokens(None) == 0
@@ -6,9 +6,11 @@ import pytest
 import pathlib
 import time
 import threading
+from collections import OrderedDict
 from unittest.mock import Mock, patch, MagicMock
 
 from ..scripts.memory_bounded_index_manager import (
+    CacheEntry,
     MemoryBoundedIndexManager,
     get_index_and_meta,
     invalidate_cache,
@@ -186,31 +188,184 @@ class TestMemoryBoundedIndexManager:
         assert stats['evictions'] > 0
         assert stats['cache_entries'] < 5  # Some entries were evicted
     
+    @patch('memex.scripts.memory_bounded_index_manager.get_memory_utils_functions')
+    def test_load_does_not_run_full_eviction_check(self, mock_get_functions):
+        """Test that loading only enforces the size limit inline."""
+        mock_get_functions.return_value = (
+            Mock(return_value={}),
+            Mock(return_value=pathlib.Path("/fake/index.faiss")),
+            Mock(return_value=pathlib.Path("/fake/metadata.json")),
+            Mock(return_value=(MockIndex(), {"data": "test"})),
+            pathlib.Path("/fake/root")
+        )
+        
+        manager = MemoryBoundedIndexManager()
+        with patch.object(manager, '_check_and_evict') as mock_check:
+            manager.get_index_and_meta()
+            manager.get_index_and_meta(force_reload=True)
+        
+        mock_check.assert_not_called()
+        assert manager.get_stats()['eviction_checks'] == 0
+    
+    def test_check_skips_rss_query_under_limit(self):
+        """Test that the RSS is only queried when the cache is over its limit."""
+        manager = MemoryBoundedIndexManager()
+        manager.cache = OrderedDict([("a", CacheEntry(None, {}, 0, time.time(), 1000))])
+        
+        with patch.object(manager, '_proc') as mock_proc:
+            manager._check_and_evict()
+            mock_proc.memory_info.assert_not_called()
+            
+            mock_proc.memory_info.return_value = Mock(rss=0)
+            manager.max_memory_mb = 0.0005  # ~500 byte limit
+            manager._check_and_evict()
+            mock_proc.memory_info.assert_called_once()
+    
+    @patch('memex.scripts.memory_bounded_index_manager.get_memory_utils_functions')
+    def test_mtime_check_is_throttled(self, mock_get_functions):
+        """Test that cache hits only stat the files once per check interval."""
+        import memex.scripts.memory_bounded_index_manager as mbim
+        
+        mock_load_index_internal = Mock(return_value=(MockIndex(), {"data": "test"}))
+        mock_get_functions.return_value = (
+            Mock(return_value={}),
+            Mock(return_value=pathlib.Path("/fake/index.faiss")),
+            Mock(return_value=pathlib.Path("/fake/metadata.json")),
+            mock_load_index_internal,
+            pathlib.Path("/fake/root")
+        )
+        
+        manager = MemoryBoundedIndexManager()
+        with patch.object(mbim, '_stat_mtime', return_value=100.0) as mock_stat:
+            manager.get_index_and_meta()
+            loads_stats = mock_stat.call_count  # index + metadata file
+            
+            # Hits right after the load trust the cached mtime
+            manager.get_index_and_meta()
+            manager.get_index_and_meta()
+            assert mock_stat.call_count == loads_stats
+            
+            # Once the interval has passed, a newer file triggers a reload
+            manager._snapshot = manager._snapshot._replace(checked_at=0)
+            mock_stat.return_value = 200.0
+            manager.get_index_and_meta()
+        
+        assert mock_load_index_internal.call_count == 2
+    
+    @patch('memex.scripts.memory_bounded_index_manager.get_memory_utils_functions')
+    def test_check_disk_bypasses_throttle(self, mock_get_functions):
+        """Test that check_disk stats the files even while the snapshot is fresh."""
+        import memex.scripts.memory_bounded_index_manager as mbim
+        
+        mock_load_index_internal = Mock(return_value=(MockIndex(), {"version": 1}))
+        mock_get_functions.return_value = (
+            Mock(return_value={}),
+            Mock(return_value=pathlib.Path("/fake/index.faiss")),
+            Mock(return_value=pathlib.Path("/fake/metadata.json")),
+            mock_load_index_internal,
+            pathlib.Path("/fake/root")
+        )
+        
+        manager = MemoryBoundedIndexManager()
+        with patch.object(mbim, '_stat_mtime', return_value=100.0) as mock_stat:
+            manager.get_index_and_meta()
+            
+            # Unchanged files: the cached entry is used without a reload
+            manager.get_index_and_meta(check_disk=True)
+            assert mock_load_index_internal.call_count == 1
+            
+            # Another process committed within the check interval
+            mock_stat.return_value = 200.0
+            mock_load_index_internal.return_value = (MockIndex(), {"version": 2})
+            _, meta = manager.get_index_and_meta()
+            assert meta["version"] == 1
+            _, meta = manager.get_index_and_meta(check_disk=True)
+        
+        assert meta["version"] == 2
+        assert mock_load_index_internal.call_count == 2
+    
+    @patch('memex.scripts.memory_bounded_index_manager.get_memory_utils_functions')
+    def test_invalidate_drops_lock_free_snapshot(self, mock_get_functions):
+        """Test that hits after invalidation do not return the old snapshot."""
+        mock_load_index_internal = Mock(return_value=(MockIndex(), {"version": 1}))
+        mock_get_functions.return_value = (
+            Mock(return_value={}),
+            Mock(return_value=pathlib.Path("/fake/index.faiss")),
+            Mock(return_value=pathlib.Path("/fake/metadata.json")),
+            mock_load_index_internal,
+            pathlib.Path("/fake/root")
+        )
+        
+        manager = MemoryBoundedIndexManager()
+        manager.get_index_and_meta()
+        assert manager._snapshot is not None
+        
+        manager.invalidate()
+        mock_load_index_internal.return_value = (MockIndex(), {"version": 2})
+        _, meta = manager.get_index_and_meta()
+        
+        assert meta["version"] == 2
+        assert mock_load_index_internal.call_count == 2
+    
+    @patch('memex.scripts.memory_bounded_index_manager.get_memory_utils_functions')
+    def test_put_serves_saved_store_without_reload(self, mock_get_functions):
+        """Test that an index put after a save is served without re-reading the files."""
+        mock_load_index_internal = Mock(return_value=(MockIndex(), {"version": 1}))
+        mock_get_functions.return_value = (
+            Mock(return_value={}),
+            Mock(return_value=pathlib.Path("/fake/index.faiss")),
+            Mock(return_value=pathlib.Path("/fake/metadata.json")),
+            mock_load_index_internal,
+            pathlib.Path("/fake/root")
+        )
+        
+        with patch('memex.scripts.memory_bounded_index_manager._stat_mtime', return_value=100.0) as mock_stat:
+            manager = MemoryBoundedIndexManager()
+            manager.get_index_and_meta()
+            
+            # The save bumped the files' mtime
+            mock_stat.return_value = 200.0
+            saved_index = MockIndex()
+            manager.put(saved_index, {"version": 2})
+            manager._snapshot = manager._snapshot._replace(checked_at=0)
+            index, meta = manager.get_index_and_meta()
+        
+        assert index is saved_index
+        assert meta["version"] == 2
+        assert mock_load_index_internal.call_count == 1
+    
+    @patch('memex.scripts.memory_bounded_index_manager.get_memory_utils_functions')
+    def test_auto_mmap_small_index_counted_as_resident(self, mock_get_functions, tmp_path):
+        """Test that with mmap = "auto" an index below the mapping threshold is sized in full."""
+        index_path = tmp_path / "index.faiss"
+        index_path.write_bytes(b"x" * 16)
+        mock_load_index_internal = Mock(return_value=(MockIndex(d=128, ntotal=1000), {}))
+        mock_get_functions.return_value = (
+            Mock(return_value={"vector_store": {"mmap": "auto"}}),
+            Mock(return_value=index_path),
+            Mock(return_value=tmp_path / "metadata.json"),
+            mock_load_index_internal,
+            tmp_path
+        )
+        
+        with patch('memex.scripts.memory_utils.get_index_path', return_value=index_path):
+            manager = MemoryBoundedIndexManager()
+            manager.get_index_and_meta()
+        
+        mock_load_index_internal.assert_called_once_with(use_mmap=False)
+        entry = next(iter(manager.cache.values()))
+        assert entry.size >= 128 * 1000 * 4
+    
     def test_lru_eviction_order(self):
         """Test that LRU eviction works correctly."""
         manager = MemoryBoundedIndexManager()
         
-        # Mock the cache with known access times
-        manager.cache = {
-            "old": (None, {}, {}),
-            "middle": (None, {}, {}),
-            "new": (None, {}, {})
-        }
-        manager.access_times = {
-            "old": 100,
-            "middle": 200,
-            "new": 300
-        }
-        manager.load_times = {
-            "old": 100,
-            "middle": 200,
-            "new": 300
-        }
-        manager.cache_sizes = {
-            "old": 1000,
-            "middle": 1000,
-            "new": 1000
-        }
+        # Mock the cache in access order (least recently used first)
+        manager.cache = OrderedDict([
+            ("old", CacheEntry(None, {}, 0, 100, 1000)),
+            ("middle", CacheEntry(None, {}, 0, 200, 1000)),
+            ("new", CacheEntry(None, {}, 0, 300, 1000))
+        ])
         
         # Force eviction with low target
         manager.max_memory_mb = 0.002  # 2KB limit
@@ -220,19 +375,29 @@ class TestMemoryBoundedIndexManager:
         assert "old" not in manager.cache
         assert "middle" in manager.cache or "new" in manager.cache
     
+    def test_cache_hit_refreshes_lru_position(self):
+        """Test that a recently used entry outlives an older one under eviction."""
+        manager = MemoryBoundedIndexManager()
+        manager.cache = OrderedDict([
+            ("a", CacheEntry(None, {}, 0, 100, 500)),
+            ("b", CacheEntry(None, {}, 0, 200, 500))
+        ])
+        manager.cache.move_to_end("a")  # What a cache hit on "a" does
+        
+        manager.max_memory_mb = 0.001  # ~1KB limit, target ~800 bytes
+        manager._evict_lru(1000)
+        
+        assert list(manager.cache) == ["a"]
+    
     def test_invalidate_cache(self):
         """Test cache invalidation."""
         manager = MemoryBoundedIndexManager()
         
         # Add some cache entries
-        manager.cache = {
-            "/path1/index.faiss:/path1/meta.json": (None, {}, {}),
-            "/path2/index.faiss:/path2/meta.json": (None, {}, {})
-        }
-        manager.access_times = {
-            "/path1/index.faiss:/path1/meta.json": 100,
-            "/path2/index.faiss:/path2/meta.json": 200
-        }
+        manager.cache = OrderedDict([
+            ("/path1/index.faiss:/path1/meta.json", CacheEntry(None, {}, 0, 100, 0)),
+            ("/path2/index.faiss:/path2/meta.json", CacheEntry(None, {}, 0, 200, 0))
+        ])
         
         # Invalidate specific path
         manager.invalidate("/path1")
@@ -242,7 +407,6 @@ class TestMemoryBoundedIndexManager:
         # Invalidate all
         manager.invalidate()
         assert len(manager.cache) == 0
-        assert len(manager.access_times) == 0
     
     def test_size_estimation(self):
         """Test memory size estimation."""
@@ -258,6 +422,41 @@ class TestMemoryBoundedIndexManager:
         assert size > 500000  # At least 500KB
         assert size < 1000000  # Less than 1MB
     
+    def test_size_estimation_scales_sampled_metadata(self):
+        """Test that metadata size is extrapolated from a sample, not serialized."""
+        manager = MemoryBoundedIndexManager()
+        meta = {f"id{i}": {"content": "x" * 1000} for i in range(1000)}
+        meta["_custom_to_faiss_id_map_"] = {f"id{i}": i for i in range(1000)}
+        
+        with patch('memex.scripts.memory_bounded_index_manager.str', create=True,
+                   side_effect=AssertionError("metadata should not be stringified")):
+            size = manager._estimate_size(None, meta)
+        
+        # ~1KB of content per item plus the id map
+        assert 1000 * 1000 < size < 3 * 1000 * 1000
+    
+    def test_size_estimation_mmap_backed(self):
+        """Test that memory-mapped vectors are not counted against the cache."""
+        manager = MemoryBoundedIndexManager()
+        mock_index = MockIndex(d=128, ntotal=1000)
+        meta = {"key": "value"}
+        
+        resident = manager._estimate_size(mock_index, meta)
+        mapped = manager._estimate_size(mock_index, meta, mmap_backed=True)
+        
+        assert mapped < 10000
+        assert resident - mapped >= 128 * 1000 * 4
+    
+    def test_size_estimation_uses_encoded_vector_size(self):
+        """Test that compressed indexes are sized by their code size."""
+        manager = MemoryBoundedIndexManager()
+        wrapped = MockIndex(d=128, ntotal=1000)
+        wrapped.index = Mock(sa_code_size=Mock(return_value=128))  # e.g. SQ8
+        
+        size = manager._estimate_size(wrapped, None)
+        
+        assert size == 128 * 1000 + 1024
+    
     def test_statistics_tracking(self):
         """Test that statistics are properly tracked."""
         manager = MemoryBoundedIndexManager()
@@ -325,7 +524,7 @@ class TestModuleFunctions:
             
             assert index.d == 128
             assert meta["test"] == "data"
-            mock_method.assert_called_once_with(False)
+            mock_method.assert_called_once_with(False, False)
     
     def test_get_cache_stats_wrapper(self):
         """Test the module-level get_cache_stats function."""
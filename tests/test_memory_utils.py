@@ -39,11 +39,13 @@ class TestVectorStoreOperations(unittest.TestCase):
         # Mock CFG_PATH and other paths
         self.original_cfg_path = memory_utils.CFG_PATH
         memory_utils.CFG_PATH = self.temp_config_path
+        memory_utils.embed.cache_clear()
     
     def tearDown(self):
         """Tear down test fixtures."""
         # Restore original paths
         memory_utils.CFG_PATH = self.original_cfg_path
+        memory_utils.embed.cache_clear()
         
         # Clean up temporary directory
         for file in [self.temp_config_path, self.temp_index_path, self.temp_meta_path]:
@@ -86,6 +88,7 @@ class TestVectorStoreOperations(unittest.TestCase):
         # Verify that the custom-to-FAISS ID map was updated
         custom_to_faiss_map = mock_meta["_custom_to_faiss_id_map_"]
         self.assertIn(custom_id, custom_to_faiss_map)
+        self.assertEqual(mock_meta["_faiss_id_to_custom_id_map_"], {custom_to_faiss_map[custom_id]: custom_id})
         
         # Verify that save_index was called
         mock_save_index.assert_called_once_with(mock_index, mock_meta)
@@ -127,10 +130,105 @@ class TestVectorStoreOperations(unittest.TestCase):
         
         # Verify that the metadata was updated correctly
         self.assertEqual(mock_meta[custom_id], updated_metadata)
-        
+
         # Verify that save_index was called
         mock_save_index.assert_called_once_with(mock_index, mock_meta)
-    
+
+    @mock.patch('memex.scripts.memory_utils.load_index')
+    def test_add_or_replace_rejects_missing_ids_before_loading(self, mock_load_index):
+        """Test that placeholder and blank IDs are rejected without touching the store."""
+        for bad_id in (None, "none", "nOne", "null", "NuLL", float("nan"), "", "   "):
+            self.assertIsNone(memory_utils.add_or_replace(bad_id, "text", {"type": "note"}))
+        mock_load_index.assert_not_called()
+
+    @mock.patch('memex.scripts.memory_utils.embed')
+    @mock.patch('memex.scripts.memory_utils.load_index')
+    @mock.patch('memex.scripts.memory_utils.save_index')
+    def test_add_or_replace_uses_persisted_id_counter(self, mock_save_index, mock_load_index, mock_embed):
+        """Test that new FAISS IDs come from the stored counter, so deleted IDs are not reused."""
+        mock_embed.return_value = np.array([0.1, 0.2, 0.3], dtype=np.float32)
+
+        mock_index = mock.MagicMock()
+        mock_meta = {
+            "_custom_to_faiss_id_map_": {"kept": 3},
+            "_next_faiss_id_": 10,
+            "kept": {"type": "note"}
+        }
+        mock_load_index.return_value = (mock_index, mock_meta)
+
+        memory_utils.add_or_replace("new_item", "new text", {"type": "note"})
+
+        self.assertEqual(mock_meta["_custom_to_faiss_id_map_"]["new_item"], 10)
+        self.assertEqual(mock_meta["_next_faiss_id_"], 11)
+        self.assertEqual(list(mock_index.add_with_ids.call_args[0][1]), [10])
+
+    @mock.patch('memex.scripts.memory_utils.embed_batch')
+    @mock.patch('memex.scripts.memory_utils.load_index')
+    @mock.patch('memex.scripts.memory_utils.save_index')
+    def test_add_or_replace_batch(self, mock_save_index, mock_load_index, mock_embed_batch):
+        """Test adding and replacing several items with one embed, add and save."""
+        mock_embed_batch.return_value = np.zeros((2, 3), dtype=np.float32)
+
+        mock_index = mock.MagicMock()
+        mock_meta = {
+            "_custom_to_faiss_id_map_": {"existing": 7},
+            "existing": {"type": "note", "content": "Original content"}
+        }
+        mock_load_index.return_value = (mock_index, mock_meta)
+        mock_save_index.return_value = True
+
+        results = memory_utils.add_or_replace_batch([
+            ("existing", "updated text", {"type": "note", "content": "Updated content"}),
+            ("new_item", "new text", {"type": "note", "content": "New content"}),
+        ])
+
+        self.assertEqual(results, ["existing", "new_item"])
+        mock_embed_batch.assert_called_once_with(["updated text", "new text"])
+        mock_index.remove_ids.assert_called_once()
+        mock_index.add_with_ids.assert_called_once()
+        added_ids = mock_index.add_with_ids.call_args[0][1]
+        self.assertEqual(list(added_ids), [7, 8])
+
+        self.assertEqual(mock_meta["existing"]["content"], "Updated content")
+        self.assertEqual(mock_meta["_custom_to_faiss_id_map_"], {"existing": 7, "new_item": 8})
+        self.assertEqual(mock_meta["_next_faiss_id_"], 9)
+        mock_save_index.assert_called_once_with(mock_index, mock_meta)
+
+    @mock.patch('memex.scripts.memory_utils.embed')
+    @mock.patch('memex.scripts.memory_utils.embed_batch')
+    @mock.patch('memex.scripts.memory_utils.load_index')
+    @mock.patch('memex.scripts.memory_utils.save_index')
+    def test_unchanged_text_is_not_embedded_again(self, mock_save_index, mock_load_index,
+                                                  mock_embed_batch, mock_embed):
+        """Test that items whose stored text is unchanged only get their metadata replaced."""
+        mock_embed_batch.return_value = np.zeros((1, 3), dtype=np.float32)
+        mock_index = mock.MagicMock()
+        mock_meta = {
+            "_custom_to_faiss_id_map_": {"same": 1, "edited": 2},
+            "same": {"content": "old", memory_utils._CONTENT_HASH_KEY: memory_utils._content_hash("same text")},
+            "edited": {"content": "old", memory_utils._CONTENT_HASH_KEY: memory_utils._content_hash("old text")},
+        }
+        mock_load_index.return_value = (mock_index, mock_meta)
+        mock_save_index.return_value = True
+
+        results = memory_utils.add_or_replace_batch([
+            ("same", "same text", {"content": "moved"}),
+            ("edited", "new text", {"content": "edited"}),
+        ])
+
+        self.assertEqual(results, ["same", "edited"])
+        mock_embed_batch.assert_called_once_with(["new text"])
+        self.assertEqual(list(mock_index.remove_ids.call_args[0][0]), [2])
+        self.assertEqual(list(mock_index.add_with_ids.call_args[0][1]), [2])
+        self.assertEqual(mock_meta["same"]["content"], "moved")
+        self.assertEqual(mock_meta["edited"][memory_utils._CONTENT_HASH_KEY], memory_utils._content_hash("new text"))
+
+        mock_index.reset_mock()
+        self.assertEqual(memory_utils.add_or_replace("same", "same text", {"content": "again"}), "same")
+        mock_embed.assert_not_called()
+        mock_index.add_with_ids.assert_not_called()
+        self.assertEqual(mock_meta["same"]["content"], "again")
+
     @mock.patch('memex.scripts.memory_utils.load_index')
     @mock.patch('memex.scripts.memory_utils.save_index')
     def test_delete_vector(self, mock_save_index, mock_load_index):
@@ -164,6 +262,22 @@ class TestVectorStoreOperations(unittest.TestCase):
         # Verify that save_index was called
         mock_save_index.assert_called_once_with(mock_index, mock_meta)
     
+    @mock.patch('memex.scripts.memory_utils.load_index')
+    @mock.patch('memex.scripts.memory_utils.save_index')
+    def test_delete_vectors_by_filter_reports_failed_save(self, mock_save_index, mock_load_index):
+        """Test that a save returning False counts the matched vectors as failures."""
+        mock_meta = {
+            "_custom_to_faiss_id_map_": {"note_1": 1, "task_1": 2},
+            "note_1": {"type": "note"},
+            "task_1": {"type": "task"}
+        }
+        mock_load_index.return_value = (mock.MagicMock(), mock_meta)
+        mock_save_index.return_value = False
+        
+        result = memory_utils.delete_vectors_by_filter(lambda meta: meta.get("type") == "note")
+        
+        self.assertEqual(result, (0, 1, 2))
+    
     @mock.patch('memex.scripts.memory_utils.load_index')
     @mock.patch('memex.scripts.memory_utils.save_index')
     def test_delete_vectors_by_filter(self, mock_save_index, mock_load_index):
@@ -193,16 +307,11 @@ class TestVectorStoreOperations(unittest.TestCase):
         # Call delete_vectors_by_filter
         memory_utils.delete_vectors_by_filter(note_filter)
         
-        # Verify that remove_ids was called twice, once for each note
-        assert mock_index.remove_ids.call_count == 2
-        
-        # Check that the first call was for note_1
-        first_call_args = mock_index.remove_ids.call_args_list[0][0][0]
-        np.testing.assert_array_equal(first_call_args, np.array([1], dtype=np.int64))
-        
-        # Check that the second call was for note_2
-        second_call_args = mock_index.remove_ids.call_args_list[1][0][0]
-        np.testing.assert_array_equal(second_call_args, np.array([2], dtype=np.int64))
+        # Verify that both notes were removed in a single remove_ids call
+        mock_index.remove_ids.assert_called_once()
+        np.testing.assert_array_equal(
+            mock_index.remove_ids.call_args[0][0], np.array([1, 2], dtype=np.int64)
+        )
         
         # Verify that the metadata was updated correctly
         self.assertNotIn("note_1", mock_meta)
@@ -217,11 +326,9 @@ class TestVectorStoreOperations(unittest.TestCase):
         self.assertIn("task_1", custom_to_faiss_map)
         self.assertIn("task_2", custom_to_faiss_map)
         
-        # Verify that save_index was called multiple times (once per deletion)
-        assert mock_save_index.call_count == 2
-        
-        # Verify the last call to save_index
-        mock_save_index.assert_called_with(mock_index, mock_meta)
+        # Verify that the index was loaded and saved once for the whole batch
+        mock_load_index.assert_called_once()
+        mock_save_index.assert_called_once_with(mock_index, mock_meta)
     
     @mock.patch('memex.scripts.memory_utils.embed')
     @mock.patch('memex.scripts.memory_utils.load_index')
@@ -319,13 +426,71 @@ class TestVectorStoreOperations(unittest.TestCase):
         # Results should be item_3 and item_4
         self.assertEqual(results[0][0]["id"], "item_3")
         self.assertEqual(results[1][0]["id"], "item_4")
-    
+
+    @mock.patch('memex.scripts.memory_utils.embed_batch')
+    @mock.patch('memex.scripts.memory_utils.load_index')
+    def test_search_batch_shares_one_embedding_pass(self, mock_load_index, mock_embed_batch):
+        """Test that search_batch embeds all queries at once and splits results per query."""
+        mock_embed_batch.return_value = np.array([[0.1, 0.2, 0.3], [0.3, 0.2, 0.1]], dtype=np.float32)
+
+        mock_index = mock.MagicMock()
+        mock_index.search.return_value = (
+            np.array([[0.1, 0.5], [0.2, 0.4]]),  # Distances, one row per query
+            np.array([[1, 2], [2, -1]])           # FAISS IDs, -1 is padding
+        )
+        mock_meta = {
+            "_custom_to_faiss_id_map_": {"item_1": 1, "item_2": 2},
+            "_faiss_id_to_custom_id_map_": {1: "item_1", 2: "item_2"},
+            "item_1": {"id": "item_1", "type": "note"},
+            "item_2": {"id": "item_2", "type": "snippet"}
+        }
+        mock_load_index.return_value = (mock_index, mock_meta)
+
+        results = memory_utils.search_batch(["first query", "second query"], top_k=2)
+
+        mock_embed_batch.assert_called_once_with(["first query", "second query"])
+        mock_index.search.assert_called_once()
+        self.assertEqual(len(results), 2)
+        self.assertEqual([meta["id"] for meta, _ in results[0]], ["item_1", "item_2"])
+        self.assertEqual([meta["id"] for meta, _ in results[1]], ["item_2"])
+
+    @mock.patch('memex.scripts.memory_utils.embed_batch')
+    @mock.patch('memex.scripts.memory_utils.load_index')
+    def test_search_batch_repeated_query_with_per_query_predicates(self, mock_load_index, mock_embed_batch):
+        """Test that a repeated query is embedded once and filtered by each position's predicate."""
+        mock_embed_batch.return_value = np.array([[0.1, 0.2, 0.3]], dtype=np.float32)
+
+        mock_index = mock.MagicMock()
+        mock_index.search.return_value = (
+            np.array([[0.1, 0.5]]),
+            np.array([[1, 2]])
+        )
+        mock_meta = {
+            "_custom_to_faiss_id_map_": {"item_1": 1, "item_2": 2},
+            "_faiss_id_to_custom_id_map_": {1: "item_1", 2: "item_2"},
+            "item_1": {"id": "item_1", "type": "note"},
+            "item_2": {"id": "item_2", "type": "snippet"}
+        }
+        mock_load_index.return_value = (mock_index, mock_meta)
+
+        notes, snippets = memory_utils.search_batch(
+            ["query", "query"], top_k=2,
+            pred=[lambda m: m["type"] == "note", lambda m: m["type"] == "snippet"]
+        )
+
+        mock_embed_batch.assert_called_once_with(["query"])
+        mock_index.search.assert_called_once()
+        self.assertEqual([meta["id"] for meta, _ in notes], ["item_1"])
+        self.assertEqual([meta["id"] for meta, _ in snippets], ["item_2"])
+
     @mock.patch('memex.scripts.memory_utils.load_index')
     def test_count_items(self, mock_load_index):
         """Test counting items with a predicate."""
         # Mock metadata with various types
         mock_meta = {
             "_custom_to_faiss_id_map_": {},
+            "_faiss_id_to_custom_id_map_": {},
+            "_next_faiss_id_": 0,
             "note_1": {"type": "note"},
             "note_2": {"type": "note"},
             "task_1": {"type": "task"},
@@ -336,7 +501,7 @@ class TestVectorStoreOperations(unittest.TestCase):
         
         # Count all items
         count_all = memory_utils.count_items()
-        self.assertEqual(count_all, 5)  # All items except _custom_to_faiss_id_map_
+        self.assertEqual(count_all, 5)  # All items except the ID maps and counter
         
         # Count only notes
         count_notes = memory_utils.count_items(lambda m: m.get("type") == "note")
@@ -350,6 +515,21 @@ class TestVectorStoreOperations(unittest.TestCase):
         count_snippets = memory_utils.count_items(lambda m: m.get("type") == "snippet")
         self.assertEqual(count_snippets, 1)
     
+    def test_search_all_items_stops_once_page_is_filled(self):
+        """Test that an empty-query page only checks items up to offset + top_k matches."""
+        meta = {"_custom_to_faiss_id_map_": {f"item_{i}": i for i in range(100)}}
+        meta.update({f"item_{i}": {"id": f"item_{i}", "type": "note"} for i in range(100)})
+        checked = []
+        
+        def pred(item):
+            checked.append(item["id"])
+            return True
+        
+        page = memory_utils._search_all_items(meta, top_k=3, pred=pred, offset=2)
+        
+        self.assertEqual([item["id"] for item, _ in page], ["item_2", "item_3", "item_4"])
+        self.assertEqual(len(checked), 5)
+    
     @mock.patch('scripts.memory_utils.embed')
     @mock.patch('scripts.memory_utils.save_index')
     @mock.patch('scripts.memory_utils.load_index')
@@ -484,6 +664,439 @@ class TestVectorStoreOperations(unittest.TestCase):
             self.assertNotIn(str(faiss_id), mock_meta, 
                            f"Item '{custom_id}' should NOT be keyed by FAISS ID '{faiss_id}'")
 
+    def test_load_cfg_reparses_only_when_file_changes(self):
+        """Test that load_cfg caches the parsed config until memory.toml changes."""
+        with mock.patch.object(memory_utils.tomli, 'load', wraps=memory_utils.tomli.load) as mock_load:
+            first = memory_utils.load_cfg()
+            second = memory_utils.load_cfg()
+            self.assertIs(first, second)
+            self.assertEqual(mock_load.call_count, 1)
+            
+            self.temp_config_path.write_text('[system]\ncursor_output_dir_relative_to_memex_root = "changed"')
+            third = memory_utils.load_cfg()
+        
+        self.assertEqual(third["system"]["cursor_output_dir_relative_to_memex_root"], "changed")
+        self.assertEqual(mock_load.call_count, 2)
+    
+    @mock.patch('memex.scripts.memory_utils.model')
+    def test_vec_dim_is_cached(self, mock_model):
+        """Test that vec_dim asks the model for its dimension only once."""
+        mock_model.return_value.get_sentence_embedding_dimension.return_value = 384
+        memory_utils.vec_dim.cache_clear()
+        try:
+            self.assertEqual(memory_utils.vec_dim(), 384)
+            self.assertEqual(memory_utils.vec_dim(), 384)
+        finally:
+            memory_utils.vec_dim.cache_clear()
+        
+        mock_model.return_value.get_sentence_embedding_dimension.assert_called_once()
+    
+    @mock.patch('memex.scripts.memory_utils.model')
+    def test_embed_returns_float32_without_copying(self, mock_model):
+        """Test that embed reuses a float32 model output and converts anything else."""
+        vector = np.ones(4, dtype=np.float32)
+        mock_model.return_value.encode.return_value = vector
+        self.assertIs(memory_utils.embed("text"), vector)
+        
+        mock_model.return_value.encode.return_value = np.ones(4, dtype=np.float64)
+        self.assertEqual(memory_utils.embed("other text").dtype, np.float32)
+        
+        mock_model.return_value.encode.return_value = np.ones(8, dtype=np.float32)[::2]
+        self.assertTrue(memory_utils.embed("strided text").flags["C_CONTIGUOUS"])
+    
+    @mock.patch('memex.scripts.memory_utils.model')
+    def test_embed_caches_vectors_per_text(self, mock_model):
+        """Test that repeated texts are embedded once and the shared vector is read-only."""
+        mock_model.return_value.encode.return_value = np.ones(4, dtype=np.float32)
+        
+        first = memory_utils.embed("query")
+        self.assertIs(memory_utils.embed("query"), first)
+        mock_model.return_value.encode.assert_called_once()
+        self.assertFalse(first.flags.writeable)
+        
+        memory_utils.embed("another query")
+        self.assertEqual(mock_model.return_value.encode.call_count, 2)
+    
+    @mock.patch('memex.scripts.memory_utils.model')
+    def test_embed_batch_encodes_in_one_call(self, mock_model):
+        """Test that embed_batch hands the whole list to the model and returns a contiguous float32 matrix."""
+        mock_model.return_value.encode.return_value = np.ones((3, 2), dtype=np.float64)[:, ::-1]
+        
+        vectors = memory_utils.embed_batch(("a", "b", "c"), batch_size=16)
+        
+        mock_model.return_value.encode.assert_called_once_with(
+            ["a", "b", "c"], batch_size=16, normalize_embeddings=True,
+            convert_to_numpy=True, show_progress_bar=False)
+        self.assertEqual(vectors.shape, (3, 2))
+        self.assertEqual(vectors.dtype, np.float32)
+        self.assertTrue(vectors.flags["C_CONTIGUOUS"])
+    
+    @mock.patch('memex.scripts.memory_utils.model')
+    def test_embed_batch_encodes_duplicate_texts_once(self, mock_model):
+        """Test that repeated texts are encoded once and their rows repeated in input order."""
+        mock_model.return_value.encode.return_value = np.array([[1.0, 0.0], [0.0, 1.0]], dtype=np.float32)
+        
+        vectors = memory_utils.embed_batch(["a", "b", "a"])
+        
+        self.assertEqual(mock_model.return_value.encode.call_args[0][0], ["a", "b"])
+        np.testing.assert_array_equal(vectors, [[1.0, 0.0], [0.0, 1.0], [1.0, 0.0]])
+    
+    def test_ensure_store_does_not_read_existing_index(self):
+        """Test that an existing store is not loaded just to check its dimension."""
+        self.temp_index_path.write_bytes(b"index")
+        self.temp_meta_path.write_text("{}")
+        
+        with mock.patch.object(memory_utils, 'get_vec_dir', return_value=pathlib.Path(self.temp_dir)), \
+             mock.patch.object(memory_utils.faiss, 'read_index') as mock_read_index, \
+             mock.patch.object(memory_utils, 'vec_dim') as mock_vec_dim:
+            memory_utils._ensure_store()
+        
+        mock_read_index.assert_not_called()
+        mock_vec_dim.assert_not_called()
+    
+    def test_load_preferences_reparses_only_changed_file(self):
+        """Test that preferences are parsed once per file version."""
+        cfg = {"system": {"preferences_file_relative_to_memex_root": "PREFERENCES.yaml"}}
+        with tempfile.TemporaryDirectory() as root:
+            prefs_path = pathlib.Path(root) / "PREFERENCES.yaml"
+            prefs_path.write_text("style: pep8\n")
+            with mock.patch.object(memory_utils.yaml, 'safe_load', wraps=memory_utils.yaml.safe_load) as mock_safe_load:
+                self.assertEqual(memory_utils.load_preferences(cfg, pathlib.Path(root)), {"style": "pep8"})
+                self.assertEqual(memory_utils.load_preferences(cfg, pathlib.Path(root)), {"style": "pep8"})
+                self.assertEqual(mock_safe_load.call_count, 1)
+                
+                prefs_path.write_text("style: black\n")
+                self.assertEqual(memory_utils.load_preferences(cfg, pathlib.Path(root)), {"style": "black"})
+                self.assertEqual(mock_safe_load.call_count, 2)
+    
+    def test_dimension_mismatch_is_warned_once(self):
+        """Test that reloading an index built for another model does not repeat the warning."""
+        index = mock.MagicMock(d=768)
+        with mock.patch.object(memory_utils, '_dim_mismatch_warned', False), \
+             mock.patch.object(memory_utils, 'vec_dim', return_value=384):
+            with self.assertLogs(level="WARNING") as logs:
+                memory_utils._warn_if_dim_mismatch(index)
+                memory_utils._warn_if_dim_mismatch(index)
+        self.assertEqual(len(logs.records), 1)
+        self.assertIn("(768)", logs.output[0])
+    
+    def test_ensure_store_creates_files_atomically(self):
+        """Test that a new store's index and metadata are written to temp files and renamed into place."""
+        with mock.patch.object(memory_utils, 'get_vec_dir', return_value=pathlib.Path(self.temp_dir)), \
+             mock.patch.object(memory_utils, 'vec_dim', return_value=8), \
+             mock.patch.object(memory_utils.faiss, 'write_index',
+                               side_effect=lambda _index, path: pathlib.Path(path).write_bytes(b"index")) as mock_write_index, \
+             mock.patch.object(memory_utils.os, 'replace', wraps=os.replace) as mock_replace:
+            memory_utils._ensure_store()
+        
+        self.assertTrue(mock_write_index.call_args[0][1].endswith(".tmp"))
+        self.assertEqual(mock_replace.call_count, 2)
+        self.assertEqual(sorted(os.listdir(self.temp_dir)), ["index.faiss", "memory.toml", "metadata.json"])
+        self.assertEqual(json.loads(self.temp_meta_path.read_text()), {"_custom_to_faiss_id_map_": {}})
+    
+    def test_save_index_keeps_reverse_map_in_memory_only(self):
+        """Test that save_index writes only the forward ID map and caches what it saved."""
+        meta = {"_custom_to_faiss_id_map_": {"a": np.int64(3)}, "a": {"id": "a"}}
+        index = mock.MagicMock()
+        
+        with mock.patch.object(memory_utils, 'get_vec_dir', return_value=pathlib.Path(self.temp_dir)), \
+             mock.patch.object(memory_utils.faiss, 'write_index',
+                               side_effect=lambda _index, path: pathlib.Path(path).write_bytes(b"index")), \
+             mock.patch.object(memory_utils, '_index_manager') as mock_manager:
+            self.assertTrue(memory_utils.save_index(index, meta))
+        
+        self.assertEqual(self.temp_index_path.read_bytes(), b"index")
+        self.assertEqual(sorted(os.listdir(self.temp_dir)), ["index.faiss", "memory.toml", "metadata.json"])
+        
+        on_disk = json.loads(self.temp_meta_path.read_text(encoding="utf-8"))
+        self.assertEqual(on_disk["_custom_to_faiss_id_map_"], {"a": 3})
+        self.assertNotIn("_faiss_id_to_custom_id_map_", on_disk)
+        self.assertEqual(meta["_faiss_id_to_custom_id_map_"], {3: "a"})
+        mock_manager.put.assert_called_once_with(index, meta)
+    
+    def test_save_index_reuses_in_sync_id_maps(self):
+        """Test that save_index keeps ID maps the write paths maintained instead of rebuilding them."""
+        custom_to_faiss_map = {"a": 3}
+        faiss_to_custom_map = {3: "a"}
+        meta = {"_custom_to_faiss_id_map_": custom_to_faiss_map,
+                "_faiss_id_to_custom_id_map_": faiss_to_custom_map, "a": {"id": "a"}}
+        
+        with mock.patch.object(memory_utils, 'get_vec_dir', return_value=pathlib.Path(self.temp_dir)), \
+             mock.patch.object(memory_utils.faiss, 'write_index',
+                               side_effect=lambda _index, path: pathlib.Path(path).write_bytes(b"index")), \
+             mock.patch.object(memory_utils, '_index_manager'):
+            self.assertTrue(memory_utils.save_index(mock.MagicMock(), meta))
+        
+        self.assertIs(meta["_custom_to_faiss_id_map_"], custom_to_faiss_map)
+        self.assertIs(meta["_faiss_id_to_custom_id_map_"], faiss_to_custom_map)
+        on_disk = json.loads(self.temp_meta_path.read_text(encoding="utf-8"))
+        self.assertEqual(on_disk["_custom_to_faiss_id_map_"], {"a": 3})
+    
+    def test_replace_file_keeps_old_file_on_failure(self):
+        """Test that a failed write leaves the existing file intact and no temp file behind."""
+        self.temp_meta_path.write_text("old")
+        
+        def failing_write(tmp_path):
+            tmp_path.write_text("partial")
+            raise OSError("disk full")
+        
+        with self.assertRaises(OSError):
+            memory_utils._replace_file(self.temp_meta_path, failing_write)
+        
+        self.assertEqual(self.temp_meta_path.read_text(), "old")
+        self.assertFalse(self.temp_meta_path.with_name("metadata.json.tmp").exists())
+    
+    def test_build_reverse_id_map(self):
+        """Test reverse ID map construction for clean and malformed maps."""
+        self.assertEqual(memory_utils._build_reverse_id_map({"a": 0, "b": "7"}), {0: "a", 7: "b"})
+        self.assertEqual(memory_utils._build_reverse_id_map({}), {})
+        
+        # An invalid FAISS ID is skipped without losing the valid entries
+        self.assertEqual(memory_utils._build_reverse_id_map({"a": 0, "bad": "x", "c": 2}), {0: "a", 2: "c"})
+    
+    @mock.patch('memex.scripts.memory_utils._write_index')
+    def test_deferred_saves_write_once_and_serve_pending_state(self, mock_write_index):
+        """Test that saves inside deferred_saves() are coalesced into one write at the end."""
+        mock_write_index.return_value = True
+        index, first_meta, last_meta = mock.MagicMock(), {"v": 1}, {"v": 2}
+        
+        with memory_utils.deferred_saves():
+            self.assertTrue(memory_utils.save_index(index, first_meta))
+            with memory_utils.deferred_saves():
+                self.assertTrue(memory_utils.save_index(index, last_meta))
+            mock_write_index.assert_not_called()
+            self.assertEqual(memory_utils.load_index(), (index, last_meta))
+        
+        mock_write_index.assert_called_once_with(index, last_meta)
+        self.assertIsNone(memory_utils._pending_save)
+        self.assertTrue(memory_utils.flush_index())
+        mock_write_index.assert_called_once()
+    
+    @mock.patch('memex.scripts.memory_utils._index_manager')
+    @mock.patch('memex.scripts.memory_utils._write_index')
+    def test_failed_flush_keeps_pending_save(self, mock_write_index, mock_index_manager):
+        """Test that a deferred save whose write fails stays pending and is retried."""
+        self.addCleanup(setattr, memory_utils, '_pending_save', None)
+        mock_write_index.return_value = False
+        index, meta = mock.MagicMock(), {"v": 1}
+        
+        with memory_utils.deferred_saves():
+            memory_utils.save_index(index, meta)
+            self.assertFalse(memory_utils.flush_index())
+        
+        self.assertEqual(memory_utils._pending_save, (index, meta))
+        self.assertEqual(memory_utils.load_index(), (index, meta))
+        mock_index_manager.invalidate.assert_called()
+        
+        mock_write_index.return_value = True
+        self.assertTrue(memory_utils.flush_index())
+        self.assertIsNone(memory_utils._pending_save)
+        mock_write_index.assert_called_with(index, meta)
+    
+    def test_normalize_id_map(self):
+        """Test that loaded FAISS IDs become Python ints, keeping entries that cannot be converted."""
+        normalized = memory_utils._normalize_id_map({"a": 0, "b": 7.0})
+        self.assertEqual(normalized, {"a": 0, "b": 7})
+        self.assertIs(type(normalized["b"]), int)
+        self.assertEqual(memory_utils._normalize_id_map({"a": "3", "bad": "x"}), {"a": 3, "bad": "x"})
+    
+    def test_store_paths_follow_config(self):
+        """Test that resolved store paths are reused per config and change with it."""
+        cfg = {"system": {"cursor_output_dir_relative_to_memex_root": "a"}}
+        vec_dir = memory_utils.get_vec_dir(cfg)
+        self.assertEqual(vec_dir, memory_utils.ROOT / "a" / ".cursor" / "vecstore")
+        self.assertIs(memory_utils.get_vec_dir(cfg), vec_dir)
+        self.assertEqual(memory_utils.get_index_path(cfg), vec_dir / "index.faiss")
+        
+        other_cfg = {"system": {"cursor_output_dir_relative_to_memex_root": "b"}}
+        self.assertEqual(memory_utils.get_cursor_output_base_path(other_cfg), memory_utils.ROOT / "b")
+        self.assertEqual(memory_utils.get_meta_path(other_cfg), memory_utils.ROOT / "b" / ".cursor" / "vecstore" / "metadata.json")
+    
+    def test_lazy_module_imports_on_first_use(self):
+        """Test that _LazyModule defers the import until an attribute is read."""
+        lazy_json = memory_utils._LazyModule("json")
+        self.assertIsNone(lazy_json._module)
+        self.assertIs(lazy_json.dumps, json.dumps)
+        self.assertIs(lazy_json._module, json)
+    
+    def test_metadata_json_round_trip(self):
+        """Test that metadata survives a compact save/load with and without orjson."""
+        meta = {"item": {"id": "item", "content": "caf\u00e9", "line": np.int64(7), "vec": np.array([0.5], dtype=np.float32)},
+                "_faiss_id_to_custom_id_map_": {0: "item"}}
+        
+        for json_lib in (memory_utils.orjson, None):
+            with mock.patch.object(memory_utils, 'orjson', json_lib):
+                data = memory_utils._json_dumps(meta)
+                self.assertNotIn(b"\n", data)
+                loaded = memory_utils._json_loads(data)
+            self.assertEqual(loaded["item"]["content"], "caf\u00e9")
+            self.assertEqual(loaded["item"]["line"], 7)
+            self.assertEqual(loaded["item"]["vec"], [0.5])
+            self.assertEqual(loaded["_faiss_id_to_custom_id_map_"], {"0": "item"})
+    
+    def test_auto_mmap_maps_only_large_index_files(self):
+        """Test that vector_store.mmap = "auto" depends on the index file size."""
+        cfg = {"vector_store": {"mmap": "auto"}}
+        self.temp_index_path.write_bytes(b"x" * 16)
+        with mock.patch.object(memory_utils, 'get_index_path', return_value=self.temp_index_path):
+            self.assertFalse(memory_utils._use_index_mmap(cfg))
+            with mock.patch.object(memory_utils, '_MMAP_AUTO_MIN_BYTES', 16):
+                self.assertTrue(memory_utils._use_index_mmap(cfg))
+        self.assertTrue(memory_utils._use_index_mmap({"vector_store": {"mmap": True}}))
+        self.assertFalse(memory_utils._use_index_mmap({}))
+    
+    def test_writers_get_private_copy_of_mmapped_index(self):
+        """Test that write paths do not modify a read-only mapped index."""
+        with mock.patch.object(memory_utils, '_use_index_mmap', return_value=True), \
+             mock.patch.object(memory_utils, '_load_index_internal', return_value=("copy", {})) as mock_internal, \
+             mock.patch.object(memory_utils, 'load_index') as mock_load_index:
+            self.assertEqual(memory_utils._load_index_for_write()[0], "copy")
+        
+        mock_internal.assert_called_once_with(use_mmap=False)
+        mock_load_index.assert_not_called()
+    
+    def test_corrupt_metadata_keeps_index_mmapped(self):
+        """Test that the index re-read after a metadata decode error honours use_mmap."""
+        self.temp_meta_path.write_text("{not json")
+        faiss = memory_utils.faiss
+        stored_index = faiss.IndexIDMap(faiss.IndexFlatIP(8))
+        with mock.patch.object(memory_utils, '_ensure_store'), \
+             mock.patch.object(memory_utils, 'load_cfg', return_value={"vector_store": {"verify_dim": False}}), \
+             mock.patch.object(memory_utils, 'get_index_path', return_value=self.temp_index_path), \
+             mock.patch.object(memory_utils, 'get_meta_path', return_value=self.temp_meta_path), \
+             mock.patch.object(faiss, 'read_index', return_value=stored_index) as mock_read_index:
+            index, meta = memory_utils._load_index_internal(use_mmap=True)
+        
+        self.assertEqual(meta, {"_custom_to_faiss_id_map_": {}})
+        self.assertIs(index, stored_index)
+        for call in mock_read_index.call_args_list:
+            self.assertTrue(call.args[1] & memory_utils.faiss.IO_FLAG_MMAP)
+    
+    def test_ivf_of_non_faiss_object(self):
+        """Test that _ivf_of returns None for objects that are not FAISS indexes."""
+        self.assertIsNone(memory_utils._ivf_of(mock.MagicMock()))
+        self.assertIsNone(memory_utils._ivf_of(None))
+    
+    def test_create_index_uses_configured_factory(self):
+        """Test that vector_store.index_factory is honoured only when the index can be updated in place."""
+        sq_index = memory_utils._create_index(8, {"vector_store": {"index_factory": "SQfp16"}})
+        self.assertIsInstance(sq_index, memory_utils.faiss.IndexIDMap)
+        self.assertEqual(sq_index.index.sa_code_size(), 8 * 2)
+        
+        # HNSW cannot remove vectors, so the store falls back to a flat index
+        fallback = memory_utils._create_index(8, {"vector_store": {"index_factory": "HNSW32"}})
+        self.assertEqual(fallback.index.sa_code_size(), 8 * 4)
+    
+    def test_create_index_fp16_precision(self):
+        """Test that vector_store.precision = "fp16" builds a half-precision inner-product index."""
+        index = memory_utils._create_index(8, {"vector_store": {"precision": "fp16"}})
+        self.assertEqual(index.index.sa_code_size(), 8 * 2)
+        self.assertEqual(index.metric_type, memory_utils.faiss.METRIC_INNER_PRODUCT)
+        
+        # index_factory takes precedence over the precision shorthand
+        flat = memory_utils._create_index(8, {"vector_store": {"precision": "fp16", "index_factory": "Flat"}})
+        self.assertEqual(flat.index.sa_code_size(), 8 * 4)
+    
+    def test_ivf_index_is_trained_once_store_is_large_enough(self):
+        """Test that an IVF store starts flat and converts, keeping IDs, once it can be trained."""
+        faiss = memory_utils.faiss
+        cfg = {"vector_store": {"index_factory": "IVF4,Flat", "train_size": 40, "nprobe": 4}}
+        index = memory_utils._create_index(8, cfg)
+        self.assertIsNone(memory_utils._ivf_of(index))
+        
+        vectors = np.random.default_rng(0).standard_normal((50, 8)).astype("float32")
+        vectors /= np.linalg.norm(vectors, axis=1, keepdims=True)
+        ids = np.arange(100, 150, dtype="int64")
+        index.add_with_ids(vectors[:30], ids[:30])
+        self.assertIs(memory_utils._train_index_if_due(index, cfg), index)
+        
+        index.add_with_ids(vectors[30:], ids[30:])
+        trained = memory_utils._train_index_if_due(index, cfg)
+        self.assertIsNotNone(memory_utils._ivf_of(trained))
+        self.assertEqual(memory_utils._ivf_of(trained).nprobe, 4)
+        self.assertEqual(trained.ntotal, 50)
+        self.assertEqual(trained.metric_type, faiss.METRIC_INNER_PRODUCT)
+        
+        _, found = trained.search(vectors[7:8], 1)
+        self.assertEqual(found[0][0], 107)
+    
+    def test_int8_store_is_quantized_once_store_is_large_enough(self):
+        """Test that precision = "int8" starts flat and converts to an 8-bit scalar quantizer, keeping IDs."""
+        faiss = memory_utils.faiss
+        cfg = {"vector_store": {"precision": "int8", "train_size": 40}}
+        index = memory_utils._create_index(8, cfg)
+        self.assertEqual(index.index.sa_code_size(), 8 * 4)
+        
+        vectors = np.random.default_rng(0).standard_normal((50, 8)).astype("float32")
+        vectors /= np.linalg.norm(vectors, axis=1, keepdims=True)
+        ids = np.arange(100, 150, dtype="int64")
+        index.add_with_ids(vectors[:30], ids[:30])
+        self.assertIs(memory_utils._train_index_if_due(index, cfg), index)
+        
+        index.add_with_ids(vectors[30:], ids[30:])
+        quantized = memory_utils._train_index_if_due(index, cfg)
+        self.assertEqual(quantized.index.sa_code_size(), 8)
+        self.assertEqual(quantized.ntotal, 50)
+        self.assertEqual(quantized.metric_type, faiss.METRIC_INNER_PRODUCT)
+        self.assertIs(memory_utils._train_index_if_due(quantized, cfg), quantized)
+        
+        _, found = quantized.search(vectors[7:8], 1)
+        self.assertEqual(found[0][0], 107)
+    
+    def test_auto_index_factory_switches_to_ivf_at_ten_thousand_vectors(self):
+        """Test that index_factory = "auto" starts flat and trains IVF256 at about 10k vectors."""
+        cfg = {"vector_store": {"index_factory": "auto"}}
+        self.assertEqual(memory_utils._configured_index_factory(cfg), "IVF256,Flat")
+        fp16_cfg = {"vector_store": {"index_factory": "auto", "precision": "fp16"}}
+        self.assertEqual(memory_utils._configured_index_factory(fp16_cfg), "IVF256,SQfp16")
+        
+        index = memory_utils._create_index(8, cfg)
+        self.assertIsNone(memory_utils._ivf_of(index))
+        index.add_with_ids(np.zeros((100, 8), dtype="float32"), np.arange(100, dtype="int64"))
+        self.assertIs(memory_utils._train_index_if_due(index, cfg), index)
+    
+    def test_flat_l2_store_is_migrated_to_inner_product(self):
+        """Test that an older flat L2 store is rebuilt as an inner-product index under the same IDs."""
+        faiss = memory_utils.faiss
+        l2_index = faiss.IndexIDMap(faiss.IndexFlatL2(2))
+        l2_index.add_with_ids(np.array([[1.0, 0.0], [0.0, 1.0]], dtype="float32"), np.array([5, 9], dtype="int64"))
+        
+        migrated = memory_utils._migrate_l2_index(l2_index, {})
+        self.assertEqual(migrated.metric_type, faiss.METRIC_INNER_PRODUCT)
+        self.assertEqual(migrated.ntotal, 2)
+        distances, faiss_ids = migrated.search(np.array([[0.6, 0.8]], dtype="float32"), 2)
+        self.assertEqual(faiss_ids[0].tolist(), [9, 5])
+        self.assertAlmostEqual(float(distances[0][0]), 0.8, places=5)
+        
+        # Inner-product stores are left as they are
+        self.assertIs(memory_utils._migrate_l2_index(migrated, {}), migrated)
+    
+    def test_new_index_ranks_by_inner_product(self):
+        """Test that new stores use inner product and report cosine similarity as the score."""
+        faiss = memory_utils.faiss
+        index = memory_utils._create_index(2, {})
+        self.assertEqual(index.metric_type, faiss.METRIC_INNER_PRODUCT)
+        index.add_with_ids(np.array([[1.0, 0.0], [0.0, 1.0]], dtype="float32"), np.array([0, 1], dtype="int64"))
+        
+        meta = {
+            "_faiss_id_to_custom_id_map_": {0: "x", 1: "y"},
+            "x": {"id": "x"}, "y": {"id": "y"}
+        }
+        distances, faiss_ids = index.search(np.array([[0.6, 0.8]], dtype="float32"), 2)
+        hits = memory_utils._collect_search_hits("q", distances[0], faiss_ids[0], meta, 2, None, 0,
+                                                 inner_product=memory_utils._uses_inner_product(index))
+        
+        self.assertEqual([item["id"] for item, _ in hits], ["y", "x"])
+        self.assertAlmostEqual(hits[0][1], 0.8, places=5)
+        
+        # Older L2 stores keep producing the same cosine score
+        l2_index = faiss.IndexIDMap(faiss.IndexFlatL2(2))
+        l2_index.add_with_ids(np.array([[1.0, 0.0], [0.0, 1.0]], dtype="float32"), np.array([0, 1], dtype="int64"))
+        distances, faiss_ids = l2_index.search(np.array([[0.6, 0.8]], dtype="float32"), 2)
+        l2_hits = memory_utils._collect_search_hits("q", distances[0], faiss_ids[0], meta, 2, None, 0,
+                                                    inner_product=memory_utils._uses_inner_product(l2_index))
+        self.assertAlmostEqual(l2_hits[0][1], 0.8, places=5)
+    
     def test_check_vector_store_integrity_healthy(self):
         """Test check_vector_store_integrity with a healthy store."""
         # Create mock healthy store
@@ -510,6 +1123,27 @@ class TestVectorStoreOperations(unittest.TestCase):
         self.assertEqual(result["summary"]["metadata_entries"], 3)
         self.assertEqual(result["summary"]["mapped_vectors_count"], 3)
     
+    def test_check_vector_store_integrity_id_map_exact(self):
+        """Test that IndexIDMap stores are checked exactly against the stored IDs."""
+        faiss = memory_utils.faiss
+        index = faiss.IndexIDMap(faiss.IndexFlatL2(4))
+        index.add_with_ids(np.zeros((3, 4), dtype="float32"), np.array([0, 1, 5], dtype="int64"))
+        
+        mock_meta = {
+            "_custom_to_faiss_id_map_": {"a": 0, "b": 1, "c": 2},
+            "a": {"id": "a"}, "b": {"id": "b"}, "c": {"id": "c"}
+        }
+        
+        with mock.patch.object(memory_utils, 'load_index', return_value=(index, mock_meta)), \
+             mock.patch.object(memory_utils, 'vec_dim', return_value=4):
+            result = memory_utils.check_vector_store_integrity()
+        
+        self.assertEqual(result["status"], "error")
+        self.assertEqual(result["summary"]["missing_vectors"], 1)
+        self.assertEqual(result["details"]["missing_vectors"][0]["custom_id"], "c")
+        self.assertEqual(result["summary"]["orphaned_vectors"], 1)
+        self.assertEqual(result["details"]["orphaned_vectors"], [5])
+    
     def test_check_vector_store_integrity_orphaned_metadata(self):
         """Test check_vector_store_integrity with orphaned metadata."""
         mock_index = mock.MagicMock()
@@ -532,6 +1166,9 @@ class TestVectorStoreOperations(unittest.TestCase):
         # Check for metadata without mapping
         self.assertEqual(result["status"], "warning")
         self.assertTrue(any("exists but no FAISS ID mapping" in issue for issue in result["issues"]))
+        # Reported once, even though both checks see it
+        self.assertEqual(result["summary"]["orphaned_metadata_entries"], 1)
+        self.assertEqual(result["details"]["orphaned_metadata"], ["item3"])
     
     def test_check_vector_store_integrity_missing_metadata(self):
         """Test check_vector_store_integrity with missing metadata."""
@@ -12,6 +12,7 @@ from unittest.mock import patch, MagicMock
 
 from ..scripts.migrate_faiss_keyed_metadata import (
     identify_incorrectly_keyed_items, 
+    identify_incorrectly_keyed_items_streaming,
     migrate_metadata_keys,
     create_backup
 )
@@ -216,6 +217,20 @@ class TestMigrateFaissKeyedMetadata:
         assert "task_old" in mixed_format_metadata
         assert "snippet_old" in mixed_format_metadata
     
+    def test_migrate_metadata_keys_precomputed_items(self, mixed_format_metadata):
+        """Test migration with an already identified item list"""
+        incorrectly_keyed = identify_incorrectly_keyed_items(mixed_format_metadata)
+        task_meta = mixed_format_metadata["102"]
+        
+        with patch('memex.scripts.migrate_faiss_keyed_metadata.identify_incorrectly_keyed_items') as mock_identify:
+            stats = migrate_metadata_keys(mixed_format_metadata, incorrectly_keyed=incorrectly_keyed)
+        
+        mock_identify.assert_not_called()
+        assert stats['items_migrated'] == 2
+        # The item's metadata dict is moved, not copied
+        assert mixed_format_metadata["task_old"] is task_meta
+        assert task_meta["id"] == "task_old"
+    
     def test_create_backup(self):
         """Test backup file creation"""
         with tempfile.TemporaryDirectory() as temp_dir:
@@ -238,6 +253,18 @@ class TestMigrateFaissKeyedMetadata:
             
             assert backup_data == test_data
     
+    def test_identify_incorrectly_keyed_items_streaming(self, mixed_format_metadata):
+        """Test that the streaming scan matches the in-memory scan"""
+        pytest.importorskip("ijson")
+        with tempfile.TemporaryDirectory() as temp_dir:
+            meta_file = Path(temp_dir) / "metadata.json"
+            with open(meta_file, 'w') as f:
+                json.dump(mixed_format_metadata, f)
+            
+            streamed = identify_incorrectly_keyed_items_streaming(meta_file)
+        
+        assert streamed == identify_incorrectly_keyed_items(mixed_format_metadata)
+    
     def test_empty_metadata(self):
         """Test handling of empty metadata"""
         empty_meta = {}
@@ -13,6 +13,7 @@ from pathlib import Path
 from ..scripts.migrate_to_thread_safe import (
     update_imports,
     find_python_files,
+    _update_all_imports,
     THREAD_SAFE_FUNCTIONS,
     EXCLUDE_FILES
 )
@@ -111,6 +112,22 @@ def test_function():
         # Should update to use scripts prefix
         assert "from scripts.thread_safe_store import add_or_replace, search" in modified_content
     
+    def test_update_imports_memex_prefix_and_unrelated_file(self, tmp_path):
+        """Test memex-prefixed imports and files that never mention memory_utils."""
+        test_file = tmp_path / "test_module.py"
+        test_file.write_text("from memex.scripts.memory_utils import search, load_cfg\n")
+        other_file = tmp_path / "other_module.py"
+        other_content = "from some_other_module import search\n"
+        other_file.write_text(other_content)
+        
+        assert len(update_imports(test_file, dry_run=False)) > 0
+        assert update_imports(other_file, dry_run=False) == []
+        
+        modified_content = test_file.read_text()
+        assert "from memex.scripts.memory_utils import load_cfg" in modified_content
+        assert "from memex.scripts.thread_safe_store import search" in modified_content
+        assert other_file.read_text() == other_content
+    
     def test_update_imports_dry_run(self, tmp_path):
         """Test dry run mode doesn't modify files."""
         test_file = tmp_path / "test_module.py"
@@ -129,6 +146,20 @@ def test_function():
         # File should not be modified
         assert test_file.read_text() == original_content
     
+    def test_update_all_imports_in_process_pool(self, tmp_path):
+        """Test that parallel processing returns changes in file order."""
+        files = []
+        for i in range(4):
+            test_file = tmp_path / f"module_{i}.py"
+            test_file.write_text("from memory_utils import search\n" if i % 2 else "x = 1\n")
+            files.append(test_file)
+        
+        results = _update_all_imports(files, dry_run=False, workers=2)
+        
+        assert [bool(changes) for changes in results] == [False, True, False, True]
+        assert files[1].read_text() == "from thread_safe_store import search\n"
+        assert files[0].read_text() == "x = 1\n"
+    
     def test_find_python_files(self, tmp_path):
         """Test finding Python files while respecting exclusions."""
         # Create test directory structure
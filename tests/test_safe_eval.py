@@ -4,7 +4,7 @@ Tests for the safe expression evaluator.
 """
 import pytest
 
-from ..scripts.safe_eval import safe_eval, validate_expression, SafeEvaluator
+from ..scripts.safe_eval import safe_eval, validate_expression, SafeEvaluator, _compile_cached
 
 
 class TestSafeEval:
@@ -240,6 +240,46 @@ class TestSafeEval:
             {"meta_item": meta}
         ) is True
 
+    
+    def test_expression_compiled_once(self):
+        """Test that a filter evaluated over many items is compiled only once."""
+        _compile_cached.cache_clear()
+        expression = "meta_item.get('type') == 'task'"
+        
+        results = [safe_eval(expression, {"meta_item": {"type": t}}) for t in ("task", "note", "task")]
+        
+        assert results == [True, False, True]
+        assert _compile_cached.cache_info().misses == 1
+    
+    def test_methods_checked_against_receiver_type(self):
+        """Test that allowed methods are refused on other types and boolean operators short-circuit."""
+        meta = {"progress": 75}
+        
+        with pytest.raises(ValueError, match="Method 'lower' is not allowed for int"):
+            safe_eval("meta_item.get('progress').lower()", {"meta_item": meta})
+        
+        assert safe_eval(
+            "meta_item.get('missing') is not None and meta_item.get('missing').lower() == 'x'",
+            {"meta_item": meta}
+        ) is False
+        
+        with pytest.raises(ValueError, match="not allowed for security reasons"):
+            safe_eval("meta_item.get.__self__", {"meta_item": meta})
+    
+    def test_bound_methods_cannot_escape_method_checks(self):
+        """Test that methods passed as values (e.g. key=) cannot mutate the metadata."""
+        meta = {"type": "task", "status": "done"}
+        
+        for expression in (
+            "sorted(['type'], key=meta_item.pop)",
+            "max(['status'], key=meta_item.setdefault)",
+            "meta_item.pop",
+            "[meta_item.clear]",
+        ):
+            with pytest.raises(ValueError):
+                safe_eval(expression, {"meta_item": meta})
+        
+        assert meta == {"type": "task", "status": "done"}
 
 if __name__ == "__main__":
     pytest.main([__file__, "-v"])
\ No newline at end of file
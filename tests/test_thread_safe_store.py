@@ -9,12 +9,16 @@ import concurrent.futures
 import time
 import random
 import sys
+import multiprocessing
 from unittest.mock import patch, MagicMock
 
+import numpy as np
+
 from ..scripts.thread_safe_store import (
     VectorStoreLock,
     add_or_replace,
     delete_vector,
+    deferred_saves,
     search,
     count_items,
     get_lock_stats,
@@ -136,6 +140,26 @@ class TestThreadSafeOperations:
         stats = get_lock_stats()
         assert stats['read_operations'] > 0
     
+    @patch('memex.scripts.thread_safe_store._add_or_replace')
+    @patch('memex.scripts.thread_safe_store._search')
+    def test_deferred_saves_holds_write_lock(self, mock_search, mock_add):
+        """Test that other threads wait for a deferred_saves block, while its own writes proceed."""
+        events = []
+        mock_add.side_effect = lambda *args: events.append("add")
+        mock_search.side_effect = lambda *args: events.append("search")
+        
+        with patch('memex.scripts.thread_safe_store._deferred_saves') as mock_deferred:
+            mock_deferred.return_value.__exit__.side_effect = lambda *args: events.append("flush")
+            with deferred_saves():
+                add_or_replace("test_id", "test content", {"type": "test"})
+                reader = threading.Thread(target=search, args=("test query",))
+                reader.start()
+                time.sleep(0.1)
+                add_or_replace("test_id_2", "more content", {"type": "test"})
+            reader.join(timeout=5)
+        
+        assert events == ["add", "add", "flush", "search"]
+    
     @patch('memex.scripts.thread_safe_store._add_or_replace')
     @patch('memex.scripts.thread_safe_store._search')
     def test_concurrent_operations(self, mock_search, mock_add):
@@ -278,4 +302,40 @@ class TestLockStatistics:
 
 
 if __name__ == "__main__":
-    pytest.main([__file__, "-v"])
\ No newline at end of file
+    pytest.main([__file__, "-v"])
+
+
+@pytest.mark.skipif("fork" not in multiprocessing.get_all_start_methods(), reason="needs the fork start method")
+class TestMultiProcessWrites:
+    """Test writes made through the thread-safe wrappers from several processes."""
+    
+    def test_write_builds_on_other_process_commit(self, tmp_path):
+        """Test that a write right after another process's commit keeps that commit."""
+        from ..scripts import memory_utils
+        
+        cfg_path = tmp_path / "memory.toml"
+        cfg_path.write_text('[system]\ncursor_output_dir_relative_to_memex_root = "."\n')
+        
+        def write_in_child():
+            if add_or_replace("b", "text b", {"type": "note"}) != "b":
+                raise SystemExit(1)
+        
+        with patch.object(memory_utils, "CFG_PATH", cfg_path), \
+             patch.object(memory_utils, "ROOT", tmp_path), \
+             patch.object(memory_utils, "vec_dim", return_value=4), \
+             patch.object(memory_utils, "embed", side_effect=lambda text: np.ones(4, dtype=np.float32)):
+            try:
+                assert add_or_replace("a", "text a", {"type": "note"}) == "a"
+                
+                # Another process commits while this one's cached copy is still within the read throttle
+                child = multiprocessing.get_context("fork").Process(target=write_in_child)
+                child.start()
+                child.join(30)
+                assert child.exitcode == 0
+                
+                assert add_or_replace("c", "text c", {"type": "note"}) == "c"
+                _, meta = memory_utils.load_index(force_reload=True)
+            finally:
+                memory_utils._index_manager.invalidate()
+        
+        assert {"a", "b", "c"} <= set(meta["_custom_to_faiss_id_map_"])
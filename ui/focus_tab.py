@@ -271,7 +271,7 @@ def create_focus_tab(ts, cfg, data_integrity_error=None):
                 return "# Context Preview\n\nGenerate MDC first to see preview", "Statistics unavailable"
             
             # Generate preview data
-            preview_data = gen_memory_mdc_preview.preview_context(
+            preview_data = gen_memory_mdc_preview.preview_context_eager(
                 task_id=task_id,
                 max_items=10
             )